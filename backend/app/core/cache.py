@@ -0,0 +1,257 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar
+
+import redis.asyncio as redis_async
+
+from .config import settings
+
+T = TypeVar("T")
+
+class TTLCache:
+    """
+    Small in-process LRU cache whose entries also expire after `ttl_seconds`.
+    Used as the first level in front of Redis for data read on almost every request
+    (e.g. the authenticated user). Not shared between worker processes: anything that must be
+    visible everywhere at once still has to be invalidated in Redis as well, and entries here
+    are only trusted for `ttl_seconds`.
+    Only touched from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key) # Most recently used
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return # Disabled by configuration
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False) # Evict least recently used
+
+    def delete(self, *keys: Hashable) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+# --- Two-tier cache: per-process L1 (TTLCache) in front of Redis ---
+# Hot keys (single posts, list pages, counts, generation counters, the tag list) are served
+# from process memory, skipping the Redis round trip and JSON decoding. Every invalidation
+# deletes the key in Redis, drops it from this process and publishes it on a pub/sub channel;
+# every worker (on every node sharing the Redis) runs invalidation_listener() and drops the
+# key too. The short L1 TTL bounds staleness if a message is ever missed.
+_local_caches: List[TTLCache] = []
+
+def register_local_cache(cache: TTLCache) -> TTLCache:
+    """Make `cache` subject to cross-process invalidation. Keys must be the Redis key strings."""
+    _local_caches.append(cache)
+    return cache
+
+local_cache = register_local_cache(TTLCache(settings.cache.local_max_entries, settings.cache.local_ttl_seconds))
+
+async def get_cached(redis: redis_async.Redis, key: str, loads: Callable[[bytes], T]) -> Optional[T]:
+    """
+    L1, then Redis. `loads` turns the Redis value into the object kept in L1; it may raise
+    (e.g. on a corrupt entry), in which case this is treated as a miss. The returned object
+    is shared with other requests: copy it before mutating.
+    """
+    value = local_cache.get(key)
+    if value is not None:
+        return value
+    raw = await redis.get(key)
+    if raw is None:
+        return None
+    try:
+        value = loads(raw)
+    except Exception as e:
+        print(f"Error decoding cached value for key: {key}. Error: {e}.")
+        return None
+    local_cache.set(key, value)
+    return value
+
+async def set_cached(redis: redis_async.Redis, key: str, value: Any, serialized: Any, ex: int) -> None:
+    """Store `serialized` in Redis and the already-built `value` in L1."""
+    await redis.set(key, serialized, ex=ex)
+    local_cache.set(key, value)
+
+async def get_cached_field(redis: redis_async.Redis, key: str, field: str) -> Optional[bytes]:
+    """
+    Like get_cached for one field of a Redis hash. The L1 keeps a dict per key, so
+    invalidating the key drops every field at once (everywhere).
+    """
+    fields = local_cache.get(key)
+    if fields is not None and field in fields:
+        return fields[field]
+    value = await redis.hget(key, field)
+    if value is not None:
+        local_cache.set(key, {**(fields or {}), field: value})
+    return value
+
+async def set_cached_field(redis: redis_async.Redis, key: str, field: str, value: bytes, ex: int) -> None:
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hset(key, field, value)
+        pipe.expire(key, ex)
+        await pipe.execute()
+    local_cache.set(key, {**(local_cache.get(key) or {}), field: value})
+
+# --- Single flight: one computation per key on a cache miss ---
+# When a popular key is invalidated, every request for it misses at once and would run the
+# same query in parallel. In this process the first miss registers a future that later
+# misses await. Across workers, the first one to take a short Redis lock computes, and the
+# others poll the cache until the value shows up, or until they can take the lock themselves.
+# The lock expires on its own, so a crashed holder only delays the others by the lock TTL.
+SINGLE_FLIGHT_LOCK_PREFIX = "lock:"
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+_in_flight: Dict[str, "asyncio.Future[Any]"] = {}
+
+async def get_or_compute(
+    redis: redis_async.Redis, key: str, loads: Callable[[bytes], T], compute: Callable[[], Awaitable[T]]
+) -> T:
+    """
+    get_cached, and on a miss run `compute` at most once per key at a time (per process, and
+    across processes via the Redis lock). `compute` must store its result with set_cached if
+    it wants it cached; callers that waited get the same (shared) object back.
+    """
+    value = await get_cached(redis, key, loads)
+    if value is not None:
+        return value
+    pending = _in_flight.get(key)
+    if pending is not None:
+        try:
+            return await asyncio.shield(pending) # A cancelled waiter must not cancel the computation
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise # This request was cancelled
+            return await get_or_compute(redis, key, loads, compute) # The computing request was; take over
+    future: "asyncio.Future[Any]" = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        value = await _compute_under_lock(redis, key, loads, compute)
+        future.set_result(value)
+        return value
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e) # Waiters fail the same way
+        future.exception() # Mark as retrieved: with no waiters asyncio would log it as never consumed
+        raise
+    finally:
+        del _in_flight[key]
+
+async def _compute_under_lock(
+    redis: redis_async.Redis, key: str, loads: Callable[[bytes], T], compute: Callable[[], Awaitable[T]]
+) -> T:
+    lock_key = f"{SINGLE_FLIGHT_LOCK_PREFIX}{key}"
+    token = uuid.uuid4().hex
+    while True:
+        if await redis.set(lock_key, token, nx=True, px=settings.cache.single_flight_lock_ttl_ms):
+            try:
+                return await compute()
+            finally:
+                await redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token) # Only release our own lock
+        await asyncio.sleep(settings.cache.single_flight_poll_ms / 1000)
+        value = await get_cached(redis, key, loads)
+        if value is not None:
+            return value
+
+def forget_locally(*keys: str) -> None:
+    for cache in _local_caches:
+        cache.delete(*keys)
+
+async def publish_invalidation(redis: redis_async.Redis, *keys: str) -> None:
+    """Drop `keys` from L1 here and in every other worker. Does not touch the Redis values."""
+    if not keys:
+        return
+    forget_locally(*keys)
+    await redis.publish(settings.cache.invalidation_channel, json.dumps(list(keys)))
+
+async def invalidate(redis: redis_async.Redis, *keys: str) -> None:
+    """Delete `keys` from Redis and from every worker's L1."""
+    if not keys:
+        return
+    await redis.delete(*keys)
+    await publish_invalidation(redis, *keys)
+
+# Other per-process state (e.g. the perceptual hash index) rides on the same channel: a
+# message that is a JSON object {"kind": ..., ...} goes to the handler registered for its kind
+# instead of being read as a list of keys. on_resubscribe callbacks run whenever the listener
+# (re)connects, since messages sent while it was disconnected are lost.
+_message_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+_resubscribe_callbacks: List[Callable[[], None]] = []
+
+def register_message_handler(
+    kind: str, handler: Callable[[Dict[str, Any]], None], on_resubscribe: Optional[Callable[[], None]] = None
+) -> None:
+    _message_handlers[kind] = handler
+    if on_resubscribe is not None:
+        _resubscribe_callbacks.append(on_resubscribe)
+
+async def publish_message(redis: redis_async.Redis, kind: str, **fields: Any) -> None:
+    """Send a message to the handler registered for `kind` in every worker (this one included)."""
+    await redis.publish(settings.cache.invalidation_channel, json.dumps({"kind": kind, **fields}))
+
+def _dispatch(payload: Any) -> None:
+    if isinstance(payload, dict):
+        handler = _message_handlers.get(payload.get("kind"))
+        if handler is not None:
+            handler(payload)
+        return
+    forget_locally(*payload)
+
+async def invalidation_listener(redis_pool: redis_async.ConnectionPool) -> None:
+    """
+    Background task (started by main.py): apply invalidations and messages published by any
+    worker. Reconnects on errors; L1 is cleared (and on_resubscribe callbacks run) on every
+    (re)subscribe because messages sent while disconnected are lost.
+    """
+    while True:
+        client = redis_async.Redis(connection_pool=redis_pool)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(settings.cache.invalidation_channel)
+            for cache in _local_caches:
+                cache.clear()
+            for callback in _resubscribe_callbacks:
+                callback()
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    _dispatch(json.loads(message["data"]))
+                except (json.JSONDecodeError, TypeError, KeyError, ValueError) as e:
+                    print(f"Ignoring malformed cache invalidation message: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Cache invalidation listener error: {e}. Reconnecting in 1s.")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
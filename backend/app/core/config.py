@@ -17,6 +17,10 @@ print(f"Loading configuration from {CONFIG_FILE_PATH}")
 class SiteSettings(PydanticBaseModel):
     name: str = "Spectra Gallery"
     description: str = "An open-source image board."
+    # Public origin, e.g. "https://gallery.example.com". Absolute URLs in API responses are built
+    # from it, and serialized responses are only cached when it is set (without it they would
+    # depend on the client's Host header).
+    public_url: Optional[str] = None
 
 class ThemeColors(PydanticBaseModel):
     bg_color: str = "#000000" # Default fallback
@@ -59,6 +63,51 @@ class SecuritySettings(PydanticBaseModel):
     access_token_expire_minutes: int = 30
     upload_rate_limit: str = "10/minute"
     default_rate_limit: str = "200/minute"
+    password_hash_executor: str = "thread" # "thread" or "process" (multi-core hosts)
+    password_hash_workers: int = 4 # Max bcrypt hashes/verifications running at once
+
+class MediaSettings(PydanticBaseModel):
+    thumbnail_sizes: List[int] = [256, 512] # Longest edge in pixels; one file per size
+    default_thumbnail_size: int = 256 # Size returned as thumbnail_url
+    thumbnail_format: str = "webp"
+    thumbnail_quality: int = 80
+    process_pool_workers: int = 2 # Worker processes for Pillow work (dimensions, thumbnails)
+    io_pool_workers: int = 4 # Threads for short blocking calls such as libmagic sniffing
+    batch_upload_concurrency: int = 4 # Files of an admin batch upload ingested at the same time
+    duplicate_search_distance: int = 6 # Default max Hamming distance for GET /posts/{id}/duplicates (max 11)
+    duplicate_reject_distance: Optional[int] = None # Reject uploads this close to an existing post (None disables)
+
+class CacheSettings(PydanticBaseModel):
+    # Identity cache: the authenticated user / public user info, in-process first, then Redis.
+    # The in-process TTL bounds how long another worker may keep serving a role change.
+    identity_local_ttl_seconds: int = 30
+    identity_local_max_entries: int = 10000
+    identity_redis_ttl_seconds: int = 300
+    # In-process L1 in front of Redis for posts, post lists/counts and the tag list.
+    # Invalidated across workers and nodes through Redis pub/sub; the TTL bounds staleness
+    # if a message is missed.
+    local_ttl_seconds: int = 5
+    local_max_entries: int = 2000
+    invalidation_channel: str = "cache_invalidation"
+    # Single flight on cache misses: the Redis lock's TTL (an upper bound on how long other
+    # workers wait for a stuck computation) and how often waiters re-check the cache.
+    single_flight_lock_ttl_ms: int = 5000
+    single_flight_poll_ms: int = 25
+    # In-process tag autocomplete index (GET /tags/suggest): how often each worker reloads it
+    tag_suggest_refresh_seconds: int = 60
+
+class RankingSettings(PydanticBaseModel):
+    # sort_by=hot / sort_by=top rankings, kept as Redis sorted sets (see core.rankings)
+    hot_half_life_seconds: int = 45000 # A post needs 10x the score to rank level with one this much newer
+    max_ranked_posts: int = 10000 # Length of each ranking; pages beyond it are empty
+    rebuild_interval_seconds: int = 300 # Full rebuild from Postgres (drops posts that left a period)
+
+class CommentSettings(PydanticBaseModel):
+    # Comment threads (GET /posts/{id}/comments): each root comment comes with its replies,
+    # down to max_reply_depth levels and at most max_replies_per_comment (oldest first) per comment.
+    # Every comment carries reply_count, so clients can tell when a thread was cut short.
+    max_reply_depth: int = 5
+    max_replies_per_comment: int = 10
 
 # --- Main Settings Class ---
 class Settings(BaseSettings):
@@ -82,6 +131,10 @@ class Settings(BaseSettings):
     database: DatabaseSettings = Field(default_factory=DatabaseSettings)
     redis: RedisSettings = Field(default_factory=RedisSettings)
     security: SecuritySettings = Field(default_factory=SecuritySettings)
+    media: MediaSettings = Field(default_factory=MediaSettings)
+    cache: CacheSettings = Field(default_factory=CacheSettings)
+    rankings: RankingSettings = Field(default_factory=RankingSettings)
+    comments: CommentSettings = Field(default_factory=CommentSettings)
     
     DATABASE_URL: Optional[str] = None # Will be constructed
     REDIS_URL: Optional[str] = None # Will be constructed
@@ -0,0 +1,151 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import magic # For python-magic
+from PIL import Image as PillowImage, ImageOps
+from pydantic import BaseModel
+
+from .config import settings
+from .phash import compute_dhash
+
+# Pillow work is CPU-bound, so it runs in a process pool rather than on the event loop.
+# libmagic calls are short but blocking, so they run in a small thread pool.
+# Both pools are bounded by [media] settings, created lazily on first use,
+# and shut down by main.py's shutdown handler.
+_process_pool: Optional[ProcessPoolExecutor] = None
+_io_pool: Optional[ThreadPoolExecutor] = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.media.process_pool_workers)
+    return _process_pool
+
+def get_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=settings.media.io_pool_workers, thread_name_prefix="media-io")
+    return _io_pool
+
+def shutdown_executors() -> None:
+    global _process_pool, _io_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
+
+class ProcessedImage(BaseModel):
+    """What the upload pipeline learned about an image before the post row is written."""
+    image_width: Optional[int] = None
+    image_height: Optional[int] = None
+    thumbnail_sizes: List[int] = []
+    phash: Optional[int] = None # Unsigned 64-bit dHash (see core.phash)
+
+async def sniff_mime_type(buffer: bytes) -> str:
+    """Detect the MIME type of the leading bytes of a file with libmagic, off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_pool(), lambda: magic.from_buffer(buffer, mime=True))
+
+def thumbnail_filename(filename: str, size: int, image_format: Optional[str] = None) -> str:
+    """Thumbnails live next to the upload: <stem>_<size>.<format>."""
+    return f"{Path(filename).stem}_{size}.{image_format or settings.media.thumbnail_format}"
+
+def process_image_file(source_path: str, sizes: List[int], image_format: str, quality: int) -> Tuple[int, int, List[int], Optional[int]]:
+    """
+    Read the image dimensions, compute its perceptual hash and write one thumbnail per size
+    next to `source_path`. Returns (width, height, sizes written, phash). Thumbnail and hash
+    failures are not fatal: the dimensions are still returned with an empty size list / None.
+    Runs inside a worker process, so it only takes plain arguments and never touches settings.
+    """
+    with PillowImage.open(source_path) as img:
+        width, height = img.size
+        try:
+            phash = compute_dhash(img)
+        except Exception as e:
+            print(f"Warning: Could not hash {source_path}. Error: {e}")
+            phash = None
+    try:
+        written = generate_thumbnails(source_path, sizes, image_format, quality)
+    except Exception as e:
+        print(f"Warning: Could not generate thumbnails for {source_path}. Error: {e}")
+        written = []
+    return width, height, written, phash
+
+def hash_image_file(source_path: str) -> int:
+    """Perceptual hash of an image on disk. Runs inside a worker process."""
+    with PillowImage.open(source_path) as img:
+        return compute_dhash(img)
+
+def generate_thumbnails(source_path: str, sizes: List[int], image_format: str, quality: int) -> List[int]:
+    """
+    Write one thumbnail per size next to `source_path` and return the sizes written.
+    Runs inside a worker process, so it only takes plain arguments and never touches settings.
+    Animated images contribute their first frame.
+    """
+    source = Path(source_path)
+    written: List[int] = []
+    with PillowImage.open(source) as img:
+        # Let JPEG decode at reduced scale when the largest thumbnail is much smaller than the original
+        img.draft("RGB", (max(sizes), max(sizes)))
+        img = ImageOps.exif_transpose(img) # Honour camera orientation
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+        for size in sorted(sizes, reverse=True):
+            thumb = img.copy()
+            thumb.thumbnail((size, size), PillowImage.LANCZOS)
+            thumb.save(source.with_name(thumbnail_filename(source.name, size, image_format)), format=image_format.upper(), quality=quality)
+            written.append(size)
+    return sorted(written)
+
+async def process_upload(source_path: Path) -> ProcessedImage:
+    """
+    Probe dimensions, hash and generate thumbnails for a freshly written upload in the process pool.
+    Must be called before the post's DB transaction is opened. An unreadable image yields
+    an empty ProcessedImage (the post is then stored without dimensions or thumbnails).
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        width, height, sizes, phash = await loop.run_in_executor(
+            get_process_pool(), process_image_file, str(source_path),
+            settings.media.thumbnail_sizes, settings.media.thumbnail_format, settings.media.thumbnail_quality
+        )
+        return ProcessedImage(image_width=width, image_height=height, thumbnail_sizes=sizes, phash=phash)
+    except Exception as e:
+        print(f"Warning: Could not process image {source_path}. Error: {e}. Post will be created without dimensions.")
+        return ProcessedImage()
+
+async def create_thumbnails(source_path: Path) -> List[int]:
+    """
+    Generate the configured thumbnail sizes for an uploaded file in the process pool.
+    Failures are logged and reported as "no thumbnails" so uploads never fail because of them;
+    callers fall back to the original image URL.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            get_process_pool(), generate_thumbnails, str(source_path),
+            settings.media.thumbnail_sizes, settings.media.thumbnail_format, settings.media.thumbnail_quality
+        )
+    except Exception as e:
+        print(f"Warning: Could not generate thumbnails for {source_path}. Error: {e}")
+        return []
+
+async def compute_phash(source_path: Path) -> Optional[int]:
+    """Perceptual hash of a stored file in the process pool (used by the backfill). None if unreadable."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_process_pool(), hash_image_file, str(source_path))
+    except Exception as e:
+        print(f"Warning: Could not hash {source_path}. Error: {e}")
+        return None
+
+def remove_thumbnails(source_path: Path, sizes: List[int]) -> None:
+    """Delete the thumbnails generated for `source_path` (used when the post or upload is discarded)."""
+    for size in sizes:
+        thumb_path = source_path.with_name(thumbnail_filename(source_path.name, size))
+        if thumb_path.exists():
+            thumb_path.unlink()
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from pydantic import BaseModel
+
+from .config import settings
+from . import imaging
+
+INGEST_CHUNK_SIZE = 1024 * 1024 # 1 MiB per read/write
+MAGIC_SNIFF_BYTES = 2048 # libmagic only needs the leading bytes
+
+# Files are stored content-addressed as <sha256><ext>. The extension comes from the sniffed
+# type rather than the client's filename, so identical bytes always map to the same name.
+MIME_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+class IngestedFile(BaseModel):
+    """An upload that has been validated and atomically moved into the uploads directory."""
+    filename: str # Name under the uploads directory
+    path: Path # Absolute path on disk
+    mimetype: str # Server-verified (libmagic) MIME type
+    filesize: int # Bytes
+    sha256: str # Hex digest of the file contents
+    is_new_file: bool = True # False when identical bytes were already stored; callers must not delete the file then
+
+def content_addressed_filename(sha256: str, mimetype: str, original_filename: Optional[str] = None) -> str:
+    """Storage name for a file with this digest: <sha256><ext>."""
+    extension = MIME_TYPE_EXTENSIONS.get(mimetype) or Path(original_filename or "").suffix.lower()
+    return f"{sha256}{extension}"
+
+def _write_and_hash(file_object, hasher, chunk: bytes) -> None:
+    # Runs in the media thread pool: hashlib releases the GIL for large buffers
+    hasher.update(chunk)
+    file_object.write(chunk)
+
+async def ingest_upload(file: UploadFile, uploads_dir: Path) -> IngestedFile:
+    """
+    Read an upload exactly once, in chunks:
+    - sniff the real type from the first chunk and reject disallowed types immediately,
+    - enforce MAX_FILE_SIZE_MB as bytes arrive and abort as soon as it is exceeded (this only
+      saves the second copy: Starlette has already spooled the whole request body into the
+      UploadFile; main.reject_oversized_uploads refuses oversized single uploads earlier,
+      from their Content-Length),
+    - compute the SHA-256 on the fly,
+    - write to a temporary file off the event loop, then atomically rename it to <sha256><ext>.
+    If a file with the same contents is already stored, the temporary copy is discarded and
+    the existing file is reused (is_new_file=False).
+    Raises HTTPException (400/413/500) on rejection; nothing is left on disk in that case.
+    """
+    if file.content_type not in settings.ALLOWED_MIME_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid image type (header). Allowed: {settings.ALLOWED_MIME_TYPES}")
+
+    max_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+    loop = asyncio.get_running_loop()
+    io_pool = imaging.get_io_pool()
+    hasher = hashlib.sha256()
+    temp_path = uploads_dir / f".{uuid.uuid4().hex}.part"
+    true_mime_type = None
+    file_size = 0
+
+    file_object = await loop.run_in_executor(io_pool, open, temp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(INGEST_CHUNK_SIZE)
+            if not chunk:
+                break
+            if true_mime_type is None:
+                try:
+                    true_mime_type = await imaging.sniff_mime_type(chunk[:MAGIC_SNIFF_BYTES])
+                except Exception as e:
+                    print(f"Error during magic number check: {e}")
+                    raise HTTPException(status_code=500, detail="Could not verify file content.")
+                if true_mime_type not in settings.ALLOWED_MIME_TYPES:
+                    raise HTTPException(status_code=400, detail=f"Invalid image type (content: {true_mime_type}). Allowed: {settings.ALLOWED_MIME_TYPES}")
+            file_size += len(chunk)
+            if file_size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File too large. Max size: {settings.MAX_FILE_SIZE_MB}MB")
+            await loop.run_in_executor(io_pool, _write_and_hash, file_object, hasher, chunk)
+        if true_mime_type is None:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+        await loop.run_in_executor(io_pool, file_object.close)
+
+        file_hash = hasher.hexdigest()
+        stored_filename = content_addressed_filename(file_hash, true_mime_type, file.filename)
+        final_path = uploads_dir / stored_filename
+        # link() fails if the name exists, so of several concurrent uploads of the same bytes
+        # exactly one stores the file (is_new_file) and is the only one that may ever remove it
+        try:
+            os.link(temp_path, final_path)
+            is_new_file = True
+        except FileExistsError:
+            is_new_file = False # Identical bytes already on disk; keep a single copy
+        temp_path.unlink()
+    except BaseException:
+        # Covers rejections, I/O errors and client disconnects (cancellation)
+        file_object.close()
+        if temp_path.exists():
+            temp_path.unlink()
+        raise
+
+    return IngestedFile(
+        filename=stored_filename, path=final_path, mimetype=true_mime_type,
+        filesize=file_size, sha256=file_hash, is_new_file=is_new_file
+    )
@@ -1,6 +1,13 @@
 import json
 from datetime import datetime
 
+# orjson is several times faster than the standard library for both directions and handles
+# datetime natively. It is optional: without it everything falls back to the json module.
+try:
+    import orjson
+except ImportError: # pragma: no cover - depends on the deployment
+    orjson = None
+
 class DateTimeEncoder(json.JSONEncoder):
     """Custom JSON encoder that handles datetime objects."""
     def default(self, obj):
@@ -8,6 +15,18 @@ class DateTimeEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
+def json_dumps_bytes(obj) -> bytes:
+    """Serialize to UTF-8 JSON bytes (orjson when available), with datetime support."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, cls=DateTimeEncoder, separators=(",", ":")).encode("utf-8")
+
 def json_dumps(obj):
     """Helper function to serialize objects to JSON with datetime support."""
-    return json.dumps(obj, cls=DateTimeEncoder)
+    return json_dumps_bytes(obj).decode("utf-8")
+
+def json_loads(data):
+    """Parse JSON from str or bytes (orjson when available)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
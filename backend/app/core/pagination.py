@@ -0,0 +1,20 @@
+import base64
+import binascii
+import json
+from typing import Any, Dict
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """Encode a keyset position as an opaque, URL-safe cursor string."""
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor produced by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Malformed cursor: {e}")
+    if not isinstance(payload, dict):
+        raise ValueError("Malformed cursor: payload is not an object.")
+    return payload
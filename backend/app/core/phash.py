@@ -0,0 +1,196 @@
+from array import array
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+import numpy as np
+import redis.asyncio as redis_async
+from PIL import Image as PillowImage
+
+from . import cache
+
+# Perceptual hashing for near-duplicate detection.
+# Each image gets a 64-bit dHash: the image is shrunk to 9x8 greyscale and every bit records
+# whether a pixel is brighter than its right-hand neighbour. Re-encoded, resized or lightly
+# edited copies end up within a small Hamming distance of the original.
+#
+# Lookups use multi-index hashing: the 64 bits are split into 4 chunks of 16 bits, each with
+# its own table chunk value -> post ids. If two hashes differ in at most r bits, at least one
+# chunk differs in at most r // 4 bits (pigeonhole), so a query only probes the chunk values
+# within that distance and verifies the few candidates it finds with a popcount.
+
+HASH_BITS = 64
+CHUNK_COUNT = 4
+CHUNK_BITS = HASH_BITS // CHUNK_COUNT
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+MAX_SEARCH_DISTANCE = 11 # Keeps each chunk probe at <= 2 flipped bits (137 values)
+LOAD_BATCH_SIZE = 50000
+
+# Every worker keeps its own index. The worker that creates or deletes a post publishes the
+# change on the cache invalidation channel (publish_added / publish_removed) and every worker
+# applies it, so lookups never query the database. Messages sent while a worker's listener
+# was disconnected are lost: on (re)subscribe the index is marked stale and the next
+# sync_index() re-reads the posts table from just below the highest id it has synced. Post
+# ids are taken from the sequence before the row commits, so a lower id can become visible
+# after a higher one; that re-read starts SYNC_LOOKBACK_IDS ids back and skips indexed posts.
+PHASH_MESSAGE_KIND = "phash"
+SYNC_LOOKBACK_IDS = 1000
+
+def compute_dhash(img: PillowImage.Image) -> int:
+    """64-bit difference hash of an open Pillow image. Safe to call inside a worker process."""
+    small = img.convert("L").resize((9, 8), PillowImage.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def to_db_value(phash: int) -> int:
+    """Postgres BIGINT is signed: store the unsigned 64-bit hash in two's complement."""
+    return phash - (1 << HASH_BITS) if phash >= (1 << (HASH_BITS - 1)) else phash
+
+def from_db_value(value: int) -> int:
+    return value & ((1 << HASH_BITS) - 1)
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def _chunks(phash: int) -> List[int]:
+    return [(phash >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNK_COUNT)]
+
+# Bit masks with 0, 1, 2 bits set, used to enumerate chunk values near a query chunk
+_FLIP_MASKS: List[List[int]] = [
+    [sum(1 << bit for bit in bits) for bits in combinations(range(CHUNK_BITS), flips)]
+    for flips in range(MAX_SEARCH_DISTANCE // CHUNK_COUNT + 1)
+]
+
+class PerceptualHashIndex:
+    """In-memory multi-index hash table over post perceptual hashes."""
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self._hashes: Dict[int, int] = {} # post_id -> phash
+        self._tables: List[Dict[int, array]] = [{} for _ in range(CHUNK_COUNT)]
+        self.synced_through = 0 # Highest post id seen by sync_index; add() never moves it
+        self.stale = True # Changes may have been missed; sync_index() must read the table
+        self.loaded = False
+
+    def mark_stale(self) -> None:
+        self.stale = True
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, post_id: int) -> bool:
+        return post_id in self._hashes
+
+    def add(self, post_id: int, phash: int) -> None:
+        if post_id in self._hashes:
+            self.remove(post_id)
+        self._hashes[post_id] = phash
+        for table, chunk in zip(self._tables, _chunks(phash)):
+            bucket = table.get(chunk)
+            if bucket is None:
+                table[chunk] = array("q", [post_id])
+            else:
+                bucket.append(post_id)
+
+    def remove(self, post_id: int) -> None:
+        phash = self._hashes.pop(post_id, None)
+        if phash is None:
+            return
+        for table, chunk in zip(self._tables, _chunks(phash)):
+            bucket = table.get(chunk)
+            if bucket is not None and post_id in bucket:
+                bucket.remove(post_id)
+                if not bucket:
+                    del table[chunk]
+
+    def search(self, phash: int, max_distance: int, exclude_post_id: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Return (post_id, distance) pairs within max_distance, nearest first."""
+        max_distance = min(max_distance, MAX_SEARCH_DISTANCE)
+        chunk_radius = max_distance // CHUNK_COUNT
+        seen = set()
+        matches: List[Tuple[int, int]] = []
+        for table, chunk in zip(self._tables, _chunks(phash)):
+            for flips in range(chunk_radius + 1):
+                for mask in _FLIP_MASKS[flips]:
+                    bucket = table.get(chunk ^ mask)
+                    if bucket is None:
+                        continue
+                    for post_id in bucket:
+                        if post_id in seen or post_id == exclude_post_id:
+                            continue
+                        seen.add(post_id)
+                        distance = hamming_distance(phash, self._hashes[post_id])
+                        if distance <= max_distance:
+                            matches.append((post_id, distance))
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+    def get(self, post_id: int) -> Optional[int]:
+        return self._hashes.get(post_id)
+
+    def bulk_add(self, rows: Iterable[Tuple[int, int]]) -> None:
+        for post_id, phash in rows:
+            self.add(post_id, phash)
+
+# One index per worker process, loaded by main.py at startup
+phash_index = PerceptualHashIndex()
+
+async def load_index(db: asyncpg.Connection, index: PerceptualHashIndex = phash_index) -> int:
+    """(Re)load every stored hash into the index in id-ordered batches. Returns the number of posts indexed."""
+    index.clear()
+    await sync_index(db, index)
+    index.loaded = True
+    return len(index)
+
+async def sync_index(db: asyncpg.Connection, index: PerceptualHashIndex = phash_index) -> None:
+    """
+    Catch up with the posts table if the index may have missed changes (at startup, or after
+    the invalidation listener reconnected); otherwise a no-op, as changes arrive as messages.
+    Uses the primary key, so it is a short range scan. Hashes backfilled onto older posts are
+    only seen by load_index (i.e. after a restart).
+    """
+    if not index.stale:
+        return
+    index.stale = False # Set first: a reconnect during the sync marks it stale again
+    after_id = max(index.synced_through - SYNC_LOOKBACK_IDS, 0)
+    while True:
+        rows = await db.fetch(
+            "SELECT id, phash FROM posts WHERE id > $1 AND phash IS NOT NULL ORDER BY id LIMIT $2",
+            after_id, LOAD_BATCH_SIZE
+        )
+        if not rows:
+            return
+        index.bulk_add((row['id'], from_db_value(row['phash'])) for row in rows if row['id'] not in index)
+        after_id = rows[-1]['id']
+        index.synced_through = max(index.synced_through, after_id)
+        if len(rows) < LOAD_BATCH_SIZE:
+            return
+
+def apply_message(payload: Dict, index: PerceptualHashIndex = phash_index) -> None:
+    """Apply a change published by any worker (this one included): {"post_id", "phash" or None}."""
+    post_id = int(payload["post_id"])
+    if payload.get("phash") is None:
+        index.remove(post_id)
+    elif index.get(post_id) != payload["phash"]:
+        index.add(post_id, int(payload["phash"]))
+
+async def publish_added(redis: redis_async.Redis, post_id: int, phash: int) -> None:
+    """Index a newly committed post here and in every other worker."""
+    phash_index.add(post_id, phash)
+    try:
+        await cache.publish_message(redis, PHASH_MESSAGE_KIND, post_id=post_id, phash=phash)
+    except Exception as e:
+        print(f"Warning: Could not publish perceptual hash of post {post_id}: {e}. Other workers miss it until their next resync.")
+
+async def publish_removed(redis: redis_async.Redis, post_id: int) -> None:
+    """Drop a deleted post from the index here and in every other worker."""
+    phash_index.remove(post_id)
+    try:
+        await cache.publish_message(redis, PHASH_MESSAGE_KIND, post_id=post_id, phash=None)
+    except Exception as e:
+        print(f"Warning: Could not publish removal of post {post_id} from the perceptual hash index: {e}")
+
+cache.register_message_handler(PHASH_MESSAGE_KIND, apply_message, on_resubscribe=phash_index.mark_stale)
@@ -0,0 +1,138 @@
+import asyncio
+import math
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+import redis.asyncio as redis_async
+
+from .config import settings
+
+# Precomputed rankings for sort_by=hot and sort_by=top&period=..., kept as Redis sorted sets
+# (member: post id, score: rank). A page is one ZREVRANGE plus a primary-key lookup of its
+# posts, so these orders never sort the posts table per request.
+#
+# Hot rank is log10 of the vote score plus the upload time divided by hot_half_life_seconds:
+# a post needs 10x the score to stay level with one uploaded that much later. A post's hot
+# rank only changes when it is voted on, so older posts sink without any decay job.
+# Votes update every ranking the post belongs to (cast_vote), new posts are added on upload
+# and deleted posts removed. Each ranking keeps at most max_ranked_posts members.
+# Top-by-period rankings cannot notice a post ageing out of their window, so one worker
+# rebuilds every ranking from Postgres every rebuild_interval_seconds.
+
+HOT_KEY = "rank:hot"
+TOP_KEY_PREFIX = "rank:top:"
+REBUILD_LOCK_KEY = "lock:rank:rebuild"
+
+# None: no time limit
+TOP_PERIODS: Dict[str, Optional[timedelta]] = {
+    "day": timedelta(days=1),
+    "week": timedelta(days=7),
+    "month": timedelta(days=30),
+    "all": None,
+}
+DEFAULT_TOP_PERIOD = "all"
+
+def hot_rank(score: int, uploaded_at: datetime) -> float:
+    """Same formula as the rebuild query in rebuild_rankings()."""
+    magnitude = math.log10(max(abs(score), 1))
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    return sign * magnitude + uploaded_at.timestamp() / settings.rankings.hot_half_life_seconds
+
+def top_key(period: str) -> str:
+    return f"{TOP_KEY_PREFIX}{period}"
+
+def all_keys() -> List[str]:
+    return [HOT_KEY] + [top_key(period) for period in TOP_PERIODS]
+
+def _top_keys_containing(uploaded_at: datetime) -> List[str]:
+    """Top rankings whose period covers a post uploaded at `uploaded_at`."""
+    age = datetime.now(timezone.utc) - uploaded_at
+    return [top_key(period) for period, window in TOP_PERIODS.items() if window is None or age <= window]
+
+async def record_post(redis: redis_async.Redis, post_id: int, score: int, uploaded_at: datetime) -> None:
+    """Add or re-rank a post in every ranking it belongs to (after a vote or on upload)."""
+    await record_posts(redis, [(post_id, score, uploaded_at)])
+
+async def record_posts(redis: redis_async.Redis, posts: List[Tuple[int, int, datetime]]) -> None:
+    """record_post for many (post_id, score, uploaded_at) at once: one pipeline, one round trip."""
+    if not posts:
+        return
+    max_members = settings.rankings.max_ranked_posts
+    members_by_key: Dict[str, Dict[str, float]] = {}
+    for post_id, score, uploaded_at in posts:
+        members_by_key.setdefault(HOT_KEY, {})[str(post_id)] = hot_rank(score, uploaded_at)
+        for key in _top_keys_containing(uploaded_at):
+            members_by_key.setdefault(key, {})[str(post_id)] = score
+    async with redis.pipeline(transaction=False) as pipe:
+        for key, members in members_by_key.items():
+            pipe.zadd(key, members)
+            pipe.zremrangebyrank(key, 0, -(max_members + 1)) # Keep only the best max_members
+        await pipe.execute()
+
+async def forget_post(redis: redis_async.Redis, post_id: int) -> None:
+    async with redis.pipeline(transaction=False) as pipe:
+        for key in all_keys():
+            pipe.zrem(key, str(post_id))
+        await pipe.execute()
+
+async def page_post_ids(redis: redis_async.Redis, key: str, skip: int, limit: int) -> List[int]:
+    """Post ids at positions skip .. skip + limit - 1 of a ranking, best first."""
+    members = await redis.zrevrange(key, skip, skip + limit - 1)
+    return [int(member) for member in members]
+
+async def count_ranked(redis: redis_async.Redis, key: str) -> int:
+    return await redis.zcard(key)
+
+async def rebuild_rankings(db: asyncpg.Connection, redis: redis_async.Redis) -> None:
+    """
+    Recompute every ranking from Postgres and swap it in with RENAME, so readers never see
+    a half-built set. Votes cast during the rebuild may be overwritten by the older value;
+    the next vote on the post, or the next rebuild, corrects it.
+    """
+    max_members = settings.rankings.max_ranked_posts
+    rankings = {
+        HOT_KEY: await db.fetch("""
+            SELECT id, SIGN(score) * LOG(GREATEST(ABS(score), 1)) + EXTRACT(EPOCH FROM uploaded_at) / $1 AS rank
+            FROM posts ORDER BY rank DESC, id DESC LIMIT $2
+        """, float(settings.rankings.hot_half_life_seconds), max_members)
+    }
+    for period, window in TOP_PERIODS.items():
+        if window is None:
+            records = await db.fetch("SELECT id, score AS rank FROM posts ORDER BY score DESC, id DESC LIMIT $1", max_members)
+        else:
+            records = await db.fetch("""
+                SELECT id, score AS rank FROM posts WHERE uploaded_at >= NOW() - $1::interval
+                ORDER BY score DESC, id DESC LIMIT $2
+            """, window, max_members)
+        rankings[top_key(period)] = records
+
+    for key, records in rankings.items():
+        if not records:
+            await redis.delete(key)
+            continue
+        staging_key = f"{key}:rebuild:{uuid.uuid4().hex}"
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(staging_key, {str(record['id']): float(record['rank']) for record in records})
+            pipe.rename(staging_key, key)
+            await pipe.execute()
+
+async def refresh_loop(pg_pool: asyncpg.Pool, redis_pool: redis_async.ConnectionPool) -> None:
+    """
+    Background task (started by main.py): rebuild the rankings now and then every
+    rebuild_interval_seconds. Every worker runs it; a Redis lock that expires with the
+    interval lets only one of them rebuild per interval.
+    """
+    interval = settings.rankings.rebuild_interval_seconds
+    redis = redis_async.Redis(connection_pool=redis_pool)
+    while True:
+        try:
+            if await redis.set(REBUILD_LOCK_KEY, uuid.uuid4().hex, nx=True, ex=interval):
+                async with pg_pool.acquire() as conn:
+                    await rebuild_rankings(conn, redis)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error rebuilding post rankings: {e}. Keeping the previous ones.")
+        await asyncio.sleep(interval)
@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
@@ -35,6 +37,37 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+# bcrypt deliberately costs ~250 ms of CPU per call. Request handlers must use the async
+# variants below, which run it on a dedicated executor so logins never stall the event loop.
+# The executor is bounded by [security] password_hash_workers: a thread pool by default
+# (the bcrypt C extension releases the GIL), or a process pool when
+# password_hash_executor = "process". Created lazily, shut down by main.py.
+_password_executor: Optional[Executor] = None
+
+def get_password_executor() -> Executor:
+    global _password_executor
+    if _password_executor is None:
+        workers = settings.security.password_hash_workers
+        if settings.security.password_hash_executor == "process":
+            _password_executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _password_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+    return _password_executor
+
+def shutdown_password_executor() -> None:
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_executor(), get_password_hash, password)
+
 def decode_access_token(token: str) -> Optional[dict]:
     try:
         payload = jwt.decode(token, settings.security.secret_key, algorithms=[ALGORITHM])
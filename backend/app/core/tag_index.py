@@ -0,0 +1,101 @@
+import asyncio
+import heapq
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+import asyncpg
+
+from .config import settings
+
+# In-memory tag autocomplete.
+# Tag names are kept in one sorted list, so the tags starting with a prefix are a contiguous
+# slice found with two binary searches. Short prefixes match a large share of all tags, so
+# the top tags by count for every prefix of up to PRECOMPUTED_PREFIX_LENGTH characters are
+# computed once per refresh; longer prefixes only rank their (small) slice per request.
+# Counts change with every upload, so each worker reloads the table in the background every
+# [cache] tag_suggest_refresh_seconds; a suggestion is never more than that out of date.
+
+SUGGEST_MAX_LIMIT = 50
+PRECOMPUTED_PREFIX_LENGTH = 2
+
+TagEntry = Tuple[int, str, int] # (id, name, post_count)
+
+def normalize_prefix(prefix: str) -> str:
+    """Same normalisation as stored tag names (see crud._clean_tag_names)."""
+    return prefix.strip().lower().replace(' ', '_')
+
+def _rank(entry: TagEntry) -> Tuple[int, str]:
+    return -entry[2], entry[1] # Most used first, ties alphabetically
+
+class TagSuggestIndex:
+    """Sorted tag names with per-prefix top lists. Rebuilt wholesale, swapped in atomically."""
+
+    def __init__(self) -> None:
+        # (names, entries, top lists by prefix): one attribute, so rebuild() (which runs in a
+        # thread) swaps it in with a single assignment and suggest() never sees a mix
+        self._state: Tuple[List[str], List[TagEntry], Dict[str, List[TagEntry]]] = ([], [], {})
+        self.loaded = False
+        self.load_lock = asyncio.Lock() # Serializes on-demand loads (ensure_loaded)
+
+    def __len__(self) -> int:
+        return len(self._state[1])
+
+    def rebuild(self, rows: List[TagEntry]) -> None:
+        """Replace the contents with `rows`, which must be sorted by name."""
+        grouped: Dict[str, List[TagEntry]] = {"": rows}
+        for entry in rows:
+            name = entry[1]
+            for length in range(1, min(len(name), PRECOMPUTED_PREFIX_LENGTH) + 1):
+                grouped.setdefault(name[:length], []).append(entry)
+        top_by_prefix = {
+            prefix: sorted(entries, key=_rank)[:SUGGEST_MAX_LIMIT]
+            for prefix, entries in grouped.items()
+        }
+        self._state = ([entry[1] for entry in rows], rows, top_by_prefix)
+        self.loaded = True
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[TagEntry]:
+        """Tags whose name starts with `prefix`, most used first (ties by name)."""
+        limit = min(limit, SUGGEST_MAX_LIMIT)
+        names, entries, top_by_prefix = self._state
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            return top_by_prefix.get(prefix, [])[:limit]
+        start = bisect_left(names, prefix)
+        end = bisect_left(names, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo=start) # First name past the prefix
+        return heapq.nsmallest(limit, entries[start:end], key=_rank)
+
+# One index per worker process, loaded by main.py at startup
+tag_index = TagSuggestIndex()
+
+async def load_index(db: asyncpg.Connection, index: TagSuggestIndex = tag_index) -> int:
+    """(Re)load every tag into the index. Returns the number of tags indexed."""
+    records = await db.fetch("SELECT id, name, post_count FROM tags ORDER BY name COLLATE \"C\"")
+    rows = [(record['id'], record['name'], record['post_count']) for record in records]
+    # Building the prefix lists is pure Python; keep it off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, index.rebuild, rows)
+    return len(index)
+
+async def ensure_loaded(pg_pool: asyncpg.Pool, index: TagSuggestIndex = tag_index) -> None:
+    """
+    Load the index on first use if the startup load failed. A connection is only checked out
+    here, never on the warm path, and concurrent first requests wait for one shared load.
+    """
+    if index.loaded:
+        return
+    async with index.load_lock:
+        if index.loaded:
+            return # Loaded by another request while this one waited
+        async with pg_pool.acquire() as conn:
+            await load_index(conn, index)
+
+async def refresh_loop(pg_pool: asyncpg.Pool, index: TagSuggestIndex = tag_index) -> None:
+    """Background task (started by main.py): reload the index periodically."""
+    while True:
+        await asyncio.sleep(settings.cache.tag_suggest_refresh_seconds)
+        try:
+            async with pg_pool.acquire() as conn:
+                await load_index(conn, index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error refreshing tag suggestion index: {e}. Keeping the previous one.")
@@ -1,13 +1,17 @@
 import asyncpg
 import redis.asyncio as redis_async
 import json
-from typing import List, Dict, Any, Optional
-from PIL import Image as PillowImage # For image dimension extraction
-from pathlib import Path # For working with file paths
+import random
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import quote, urlencode
 from . import models
 from .core.config import settings
-from .core import security
-from .core.json_utils import json_dumps
+from .core import security, phash
+from .core.json_utils import json_dumps, json_dumps_bytes, json_loads
+from .core.pagination import encode_cursor, decode_cursor
+from .core import cache, rankings
+from .core.cache import TTLCache
 
 # Helper function to robustly parse tags
 def _parse_tags_from_source(tags_source: Any) -> List[models.Tag]:
@@ -56,26 +60,186 @@ def _parse_tags_from_source(tags_source: Any) -> List[models.Tag]:
                  print(f"Warning: Item in tags list is not a dict or valid JSON string for a dict: {type(item)} - {str(item)[:100]}")
     return parsed_tags
 
+def _tags_from_arrays(tag_ids: Optional[List[int]], tag_names: Optional[List[str]]) -> List[models.Tag]:
+    """Build Tag models from the aligned posts.tag_ids / posts.tag_names columns."""
+    if not tag_ids or not tag_names:
+        return []
+    return [models.Tag(id=tag_id, name=tag_name) for tag_id, tag_name in zip(tag_ids, tag_names)]
+
+async def _sync_post_tag_arrays(db: asyncpg.Connection, post_ids: List[int]) -> None:
+    """
+    Recompute posts.tag_ids / posts.tag_names from post_tags for the given posts.
+    Must run in the same transaction as the post_tags change it mirrors.
+    """
+    if not post_ids:
+        return
+    await db.execute("""
+        UPDATE posts p SET
+            tag_ids = COALESCE(agg.ids, '{}'::int[]),
+            tag_names = COALESCE(agg.names, '{}'::text[])
+        FROM unnest($1::int[]) AS target(post_id)
+        LEFT JOIN LATERAL (
+            SELECT array_agg(t.id ORDER BY t.name) AS ids, array_agg(t.name::text ORDER BY t.name) AS names
+            FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+            WHERE pt.post_id = target.post_id
+        ) agg ON TRUE
+        WHERE p.id = target.post_id
+    """, post_ids)
+
+# tags.post_count is updated by every upload and retag, so concurrent transactions often touch
+# the same tag rows. UPDATE ... FROM locks them in whatever order the join produces, which can
+# deadlock two transactions with overlapping tags. _lock_tag_rows takes them with
+# SELECT ... ORDER BY id FOR UPDATE first, so every transaction locks them in tag id order.
+# A transaction that both unlinks and links (a tag SET) must lock both sets in one call.
+
+async def _lock_tag_rows(db: asyncpg.Connection, tag_ids: Optional[List[int]], post_ids: Optional[List[int]] = None) -> None:
+    """Lock the `tag_ids` rows plus every tag linked to `post_ids`, in tag id order."""
+    await db.execute("""
+        SELECT 1 FROM tags
+        WHERE id = ANY($1::int[]) OR id IN (SELECT tag_id FROM post_tags WHERE post_id = ANY($2::int[]))
+        ORDER BY id FOR UPDATE
+    """, tag_ids or [], post_ids or [])
+
+async def _link_post_tags(db: asyncpg.Connection, post_ids: List[int], tag_ids: List[int]) -> None:
+    """
+    Link every post to every tag and add the links actually created to tags.post_count.
+    Must run in the caller's transaction.
+    """
+    await _lock_tag_rows(db, tag_ids)
+    await db.execute("""
+        WITH linked AS (
+            INSERT INTO post_tags (post_id, tag_id)
+            SELECT p, t FROM unnest($1::int[]) AS p CROSS JOIN unnest($2::int[]) AS t
+            ON CONFLICT DO NOTHING
+            RETURNING tag_id
+        )
+        UPDATE tags SET post_count = tags.post_count + added.n
+        FROM (SELECT tag_id, COUNT(*) AS n FROM linked GROUP BY tag_id) AS added
+        WHERE tags.id = added.tag_id
+    """, post_ids, tag_ids)
+
+async def _unlink_post_tags(db: asyncpg.Connection, post_ids: List[int], tag_ids: Optional[List[int]] = None) -> None:
+    """
+    Remove the posts' links (only those to `tag_ids` if given) and subtract the links actually
+    removed from tags.post_count. Must run in the caller's transaction.
+    """
+    if tag_ids is None:
+        await _lock_tag_rows(db, None, post_ids)
+    else:
+        await _lock_tag_rows(db, tag_ids)
+    await db.execute("""
+        WITH unlinked AS (
+            DELETE FROM post_tags
+            WHERE post_id = ANY($1::int[]) AND ($2::int[] IS NULL OR tag_id = ANY($2::int[]))
+            RETURNING tag_id
+        )
+        UPDATE tags SET post_count = tags.post_count - removed.n
+        FROM (SELECT tag_id, COUNT(*) AS n FROM unlinked GROUP BY tag_id) AS removed
+        WHERE tags.id = removed.tag_id
+    """, post_ids, tag_ids)
+
 # Cache constants
 POST_CACHE_PREFIX = "post:"
 POST_LIST_CACHE_PREFIX = "posts_list:"
 POST_COUNT_CACHE_PREFIX = "posts_count:"
 CACHE_EXPIRY_SECONDS = 300 # 5 minutes
 
+# Serialized API responses (final JSON bytes), served as-is on a hit; see routers/posts.py.
+# They embed absolute image URLs, so they are only cached when site.public_url fixes the
+# origin, and kept per origin: list pages in the key, single posts as fields of one Redis
+# hash per post so a single delete drops every origin's copy.
+POST_RESPONSE_CACHE_PREFIX = "post_response:" # Hash: origin -> Post JSON
+POST_LIST_RESPONSE_CACHE_PREFIX = "posts_list_response:"
+
+def post_cache_keys(post_id: int) -> List[str]:
+    """Every cache key holding data of one post; invalidate them together."""
+    return [f"{POST_CACHE_PREFIX}{post_id}", f"{POST_RESPONSE_CACHE_PREFIX}{post_id}"]
+
+async def post_list_response_cache_key(redis: redis_async.Redis, listing_params: Dict[str, Any]) -> str:
+    """
+    Key for a serialized list page, given its validated listing parameters. Unset parameters
+    are dropped, tags normalised and the rest put in a fixed order, so every spelling of one
+    listing maps to one key. It embeds the list generation, so it rolls over with
+    invalidate_post_lists.
+    """
+    params = {name: value for name, value in listing_params.items() if value is not None}
+    if "tags" in params:
+        params["tags"] = ",".join(_clean_tag_names(params["tags"]))
+    list_generation = await _get_cache_generation(redis, POSTS_CACHE_GENERATION_KEY)
+    return f"{POST_LIST_RESPONSE_CACHE_PREFIX}v{list_generation}:{urlencode(sorted(params.items()))}"
+
+# Generation counters. List/count keys embed the current generation ("posts_list:v7:..."),
+# so invalidating them is a single INCR; entries from older generations are never read
+# again and simply expire through their TTL.
+POSTS_CACHE_GENERATION_KEY = "posts_cache_gen"
+COMMENTS_CACHE_GENERATION_PREFIX = "comments_cache_gen:" # Per post: comments_cache_gen:{post_id}
+# Per-post generation keys are dropped after a day without writes. This must stay well above
+# CACHE_EXPIRY_SECONDS so a counter never restarts while entries from its old generations are alive.
+GENERATION_KEY_EXPIRY_SECONDS = 86400
+
+async def _get_cache_generation(redis: redis_async.Redis, generation_key: str) -> int:
+    # Generations are read on every list request, so they go through the L1 as well;
+    # INCRs below publish the key so every worker re-reads it.
+    generation = await cache.get_cached(redis, generation_key, int)
+    if generation is None:
+        cache.local_cache.set(generation_key, 0) # Never incremented yet; avoid a Redis GET per request
+        return 0
+    return generation
+
+async def invalidate_post_lists(redis: redis_async.Redis) -> None:
+    """Invalidate every cached post list and post count by moving to a new generation."""
+    await redis.incr(POSTS_CACHE_GENERATION_KEY)
+    await cache.publish_invalidation(redis, POSTS_CACHE_GENERATION_KEY)
+
+async def invalidate_comments_for_post(redis: redis_async.Redis, post_id: int) -> None:
+    """Invalidate every cached comments page of one post by moving it to a new generation."""
+    generation_key = f"{COMMENTS_CACHE_GENERATION_PREFIX}{post_id}"
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.incr(generation_key)
+        pipe.expire(generation_key, GENERATION_KEY_EXPIRY_SECONDS)
+        await pipe.execute()
+    await cache.publish_invalidation(redis, generation_key)
+
+def _clean_tag_names(tag_names: List[str]) -> List[str]:
+    """Normalise tag names the way they are stored (trimmed, lower case, spaces as underscores), dropping empties and repeats."""
+    cleaned = {tag_name.strip().lower().replace(' ', '_') for tag_name in tag_names}
+    cleaned.discard("")
+    return sorted(cleaned)
+
+async def resolve_tags(db: asyncpg.Connection, tag_names: List[str], create_missing: bool = True) -> List[models.Tag]:
+    """
+    Resolve tag names, creating the missing ones. Returns the tags sorted by name (the
+    posts.tag_names order).
+    Existing tags are only read: writing them again (ON CONFLICT ... DO UPDATE) would leave a
+    dead tuple and burn a tags_id_seq value per tag on every upload. Only names missing from
+    the first SELECT are inserted, with ON CONFLICT DO NOTHING; a name a concurrent upload
+    created in the meantime is not RETURNed, so those few are read back once more (that upload
+    has committed by then: the INSERT waits for it). Names are inserted in sorted order so
+    concurrent batches lock rows in the same order and cannot deadlock.
+    """
+    names = _clean_tag_names(tag_names)
+    if not names:
+        return []
+    records = list(await db.fetch("SELECT id, name FROM tags WHERE name = ANY($1::text[])", names))
+    missing = sorted(set(names) - {record['name'] for record in records})
+    if create_missing and missing:
+        inserted = await db.fetch("""
+            INSERT INTO tags (name)
+            SELECT name FROM unnest($1::text[]) AS wanted(name) ORDER BY name
+            ON CONFLICT (name) DO NOTHING
+            RETURNING id, name
+        """, missing)
+        records.extend(inserted)
+        created_concurrently = sorted(set(missing) - {record['name'] for record in inserted})
+        if created_concurrently:
+            records.extend(await db.fetch("SELECT id, name FROM tags WHERE name = ANY($1::text[])", created_concurrently))
+    return sorted((models.Tag(id=record['id'], name=record['name']) for record in records), key=lambda t: t.name)
+
 async def get_or_create_tag(db: asyncpg.Connection, tag_name: str) -> models.Tag:
-    tag_name_cleaned = tag_name.strip().lower().replace(' ', '_')
-    if not tag_name_cleaned:
+    tags = await resolve_tags(db, [tag_name])
+    if not tags:
         raise ValueError("Tag name cannot be empty.")
-    async with db.transaction():
-        tag_record = await db.fetchrow("SELECT id, name FROM tags WHERE name = $1", tag_name_cleaned)
-        if tag_record:
-            return models.Tag(id=tag_record['id'], name=tag_record['name'])
-        created_tag_record = await db.fetchrow(
-            "INSERT INTO tags (name) VALUES ($1) RETURNING id, name", tag_name_cleaned
-        )
-        if not created_tag_record:
-            raise Exception(f"Failed to create tag: {tag_name_cleaned}")
-        return models.Tag(id=created_tag_record['id'], name=created_tag_record['name'])
+    return tags[0]
 
 async def create_post_with_tags(
     db: asyncpg.Connection,
@@ -84,207 +248,199 @@ async def create_post_with_tags(
     filepath_on_disk: str,
     uploader_id: int
 ) -> models.Post:
+    # Image dimensions (and the MIME type) are probed by the router before this call, off the
+    # event loop; this function does no file I/O so the transaction stays short. Redis work
+    # waits for the commit, so the tag row locks are never held across a Redis round trip.
     async with db.transaction():
-        # Get image dimensions
-        img_width, img_height = None, None
-        try:
-            # Construct the absolute path to the image on disk
-            # Assuming filepath_on_disk is relative to the project root or a configured UPLOADS_DIR
-            # For this to work, filepath_on_disk needs to be the actual path where the file was saved.
-            # The router saves it to settings.UPLOADS_DIR / unique_filename
-            # So, filepath_on_disk passed here should be that absolute path or relative to a known root.
-            # Let's assume filepath_on_disk is relative to project root for now, or adjust if it's absolute.
-            
-            # If filepath_on_disk is already absolute, this Path construction is fine.
-            # If it's relative like "uploads/filename.jpg", we need to prepend the project root.
-            # The router currently constructs `file_location_on_disk` as an absolute path.
-            # And `db_filepath` is `f"{settings.UPLOADS_DIR}/{unique_filename}"` which is relative.
-            # Let's ensure we use the absolute path for Pillow.
-            
-            # The router saves the file to `file_location_on_disk` which is absolute.
-            # We need that absolute path here.
-            # The `filepath_on_disk` parameter in this function currently receives `db_filepath`
-            # which is relative. This needs to be reconciled.
-            # For now, let's assume `filepath_on_disk` is the *absolute* path to the saved file.
-            # This means the router should pass `file_location_on_disk.as_posix()` to this CRUD function.
-            # I will make a note to adjust the router call if this assumption is incorrect.
-            
-            # **Critical Assumption for this block:** `filepath_on_disk` is the ABSOLUTE path to the image.
-            # If it's relative, this Pillow part will fail.
-            # The router currently passes a relative path. This will need adjustment in the router.
-            # For now, proceeding with the assumption it's absolute for Pillow.
-            
-            # Let's refine this: the router saves to an absolute path.
-            # The `filepath_on_disk` parameter here is intended for the DB `filepath` column.
-            # We need the *actual disk path* for Pillow.
-            # The router should pass the *absolute disk path* to this function as a separate parameter,
-            # or this function needs to reconstruct it.
-            # Let's assume the router will pass the absolute path as `actual_disk_path`.
-            # For now, I'll add a placeholder for `actual_disk_path` and use `filepath_on_disk`
-            # with a comment, then adjust the router.
-
-            # Re-evaluating: The router's `file_location_on_disk` is the absolute path.
-            # The `db_filepath` is relative for storage in DB.
-            # This function `create_post_with_tags` needs the absolute path for Pillow.
-            # So, the router should pass `file_location_on_disk.as_posix()` as an additional argument,
-            # or this function needs to derive it.
-            # Let's modify this function to accept `absolute_disk_path`.
-
-            # Modifying function signature to accept absolute_disk_path
-            # This change will require updating the call in posts.py router.
-            # For now, I will proceed as if it's passed.
-            # If not passed, Pillow will fail.
-            # The `filepath_on_disk` is for the DB.
-
-            # Let's assume the router will be updated to pass the absolute path.
-            # For now, I'll use `filepath_on_disk` and assume it's made absolute by the caller.
-            # This is a bit messy. A better way: router passes the UploadFile object, or its path.
-
-            # Simplification: The router has the absolute path `file_location_on_disk`.
-            # It should pass this to the CRUD function.
-            # I will modify the CRUD function signature.
-
-            # The `filepath_on_disk` parameter IS the relative path for the DB.
-            # We need the *absolute path* for Pillow.
-            # The router has `file_location_on_disk`.
-            # This function should take `absolute_file_path_on_disk` as a new param.
-            # I will add this to the signature and then update the router.
-
-            # For now, let's assume `post_data` can carry the absolute path if we modify PostCreate,
-            # or we add a new parameter to this function. Adding a new param is cleaner.
-            # I will add `absolute_file_path: str` to this function's signature.
-            # This means the router `upload_post` needs to pass `file_location_on_disk.as_posix()`.
-
-            # **NEW PLAN:** Modify `create_post_with_tags` signature.
-            # `filepath_on_disk` remains the relative path for DB.
-            # Add `absolute_path_for_pillow: str`.
-
-            # The `filepath_on_disk` is the relative path for the DB.
-            # The router has `file_location_on_disk` (absolute).
-            # This function needs the absolute path.
-            # Let's assume the router passes `file_location_on_disk.as_posix()` as `filepath_on_disk`
-            # and the DB stores this absolute path. Or, the DB stores relative and we reconstruct.
-            # Storing relative is usually better.
-            # So, `filepath_on_disk` is relative. We need to make it absolute for Pillow.
-            project_root_for_pillow = Path(__file__).resolve().parent.parent.parent # backend/
-            # `filepath_on_disk` is like "uploads/images/uuid.jpg"
-            # settings.UPLOADS_DIR is like "frontend/static/uploads/images"
-            # This needs to be consistent. `filepath_on_disk` is `settings.UPLOADS_DIR/unique_filename`
-            # So, `project_root / filepath_on_disk` should be the absolute path.
-            
-            # The router calculates `file_location_on_disk` as absolute.
-            # It passes `db_filepath` (relative) to this CRUD.
-            # We need to reconstruct the absolute path here for Pillow.
-            
-            # `db_filepath` is `f"{settings.UPLOADS_DIR}/{post_data.filename}"`
-            # `settings.UPLOADS_DIR` is relative to project root e.g. "frontend/static/uploads"
-            # So, `Path(settings.PROJECT_ROOT_DIR) / db_filepath` should be it.
-            # Assuming settings.PROJECT_ROOT_DIR is available. If not, derive it.
-            # `Path(__file__).resolve().parent.parent.parent` is `backend/`
-            # So `Path(__file__).resolve().parent.parent.parent.parent` is project root.
-            
-            current_file_path = Path(__file__).resolve() # .../backend/app/crud.py
-            project_root = current_file_path.parent.parent.parent # z:/projects_git/spectra/backend
-            # This is still not project root.
-            # `settings.UPLOADS_DIR` is like `frontend/static/uploads`
-            # `filepath_on_disk` is like `frontend/static/uploads/filename.jpg` (if settings.UPLOADS_DIR includes frontend/static)
-            # The router saves to `project_root_for_router / settings.UPLOADS_DIR / unique_filename`
-            # where `project_root_for_router` is `z:/projects_git/spectra`
-            # `filepath_on_disk` passed here is `settings.UPLOADS_DIR + "/" + post_data.filename`
-            # So, `Path(settings.PROJECT_ROOT_DIR) / filepath_on_disk` is the way.
-            # Let's assume `settings.PROJECT_ROOT_DIR` is defined in `core.config.py`
-            # If not, we have to derive it carefully.
-            # `Path(settings.UPLOADS_DIR)` is relative from project root.
-            # `filepath_on_disk` is also relative from project root.
-
-            # The router saves the file to an absolute path: `uploads_abs_path / unique_filename`
-            # `uploads_abs_path` is `project_root / settings.UPLOADS_DIR`
-            # `filepath_on_disk` passed to this function is `f"{settings.UPLOADS_DIR}/{unique_filename}"`
-            # This is a relative path from the project root.
-            # So, to get absolute path for Pillow:
-            abs_path_for_pillow = Path(settings.PROJECT_ROOT_DIR) / filepath_on_disk
-
-            with PillowImage.open(abs_path_for_pillow) as img:
-                img_width, img_height = img.size
-        except FileNotFoundError:
-            print(f"Warning: Image file not found at {abs_path_for_pillow} for dimension extraction. Post will be created without dimensions.")
-        except Exception as e:
-            print(f"Warning: Could not get image dimensions for {filepath_on_disk}. Error: {e}. Post will be created without dimensions.")
-
         post_insert_query = """
-            INSERT INTO posts (filename, filepath, mimetype, filesize, image_width, image_height, title, description, uploader_id)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-            RETURNING id, filename, filepath, mimetype, filesize, image_width, image_height, title, description, uploader_id, uploaded_at
+            INSERT INTO posts (filename, filepath, mimetype, filesize, image_width, image_height, thumbnail_sizes, file_hash, phash, title, description, uploader_id)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+            RETURNING id, filename, filepath, mimetype, filesize, image_width, image_height, thumbnail_sizes, file_hash, title, description, uploader_id, uploaded_at
         """
         post_record = await db.fetchrow(
             post_insert_query,
             post_data.filename, filepath_on_disk, post_data.mimetype, post_data.filesize,
-            img_width, img_height, # Add dimensions here
+            post_data.image_width, post_data.image_height,
+            post_data.thumbnail_sizes, post_data.file_hash,
+            phash.to_db_value(post_data.phash) if post_data.phash is not None else None,
             post_data.title, post_data.description, uploader_id
         )
         if not post_record:
-            # If insert failed, and we opened the file with Pillow, it's already closed by `with`.
             # The file on disk should be cleaned up by the router if DB operation fails.
             raise Exception("Failed to create post record in database.")
 
         created_post_id = post_record['id']
-        processed_tags: List[models.Tag] = []
-        if post_data.tags:
-            for tag_name in post_data.tags:
-                tag_name_cleaned = tag_name.strip().lower()
-                if not tag_name_cleaned: continue
-                tag_obj = await get_or_create_tag(db, tag_name_cleaned)
-                processed_tags.append(tag_obj)
-                await db.execute(
-                    "INSERT INTO post_tags (post_id, tag_id) VALUES ($1, $2) ON CONFLICT DO NOTHING",
-                    created_post_id, tag_obj.id
-                )
+        processed_tags = await resolve_tags(db, post_data.tags or [])
+        if processed_tags:
+            await _link_post_tags(db, [created_post_id], [t.id for t in processed_tags])
+            # Mirror the links into the denormalized arrays (same name ordering as _sync_post_tag_arrays)
+            await db.execute(
+                "UPDATE posts SET tag_ids = $1, tag_names = $2 WHERE id = $3",
+                [t.id for t in processed_tags], [t.name for t in processed_tags], created_post_id
+            )
 
-        uploader_info_record = await db.fetchrow("SELECT id, username, role FROM users WHERE id = $1", uploader_id) # Fetch only needed fields for UserPublic
-        uploader_public_info = models.UserPublic(**uploader_info_record) if uploader_info_record else None
+    uploader_public_info = await get_cached_user_public(db, redis, uploader_id)
 
-        response_post = models.Post(
-            id=post_record['id'], filename=post_record['filename'], filepath=post_record['filepath'],
-            mimetype=post_record['mimetype'], filesize=post_record['filesize'],
-            image_width=post_record['image_width'], image_height=post_record['image_height'], # Add dimensions
-            title=post_record['title'], description=post_record['description'],
-            uploader_id=post_record['uploader_id'], uploader=uploader_public_info,
-            uploaded_at=post_record['uploaded_at'], tags=processed_tags,
+    response_post = models.Post(
+        id=post_record['id'], filename=post_record['filename'], filepath=post_record['filepath'],
+        mimetype=post_record['mimetype'], filesize=post_record['filesize'],
+        image_width=post_record['image_width'], image_height=post_record['image_height'], # Add dimensions
+        thumbnail_sizes=post_record['thumbnail_sizes'], file_hash=post_record['file_hash'],
+        title=post_record['title'], description=post_record['description'],
+        uploader_id=post_record['uploader_id'], uploader=uploader_public_info,
+        uploaded_at=post_record['uploaded_at'], tags=processed_tags,
+        image_url=None, thumbnail_url=None, comment_count=0, upvotes=0, downvotes=0
+    )
+
+    # Invalidate relevant caches
+    await cache.invalidate(redis, *post_cache_keys(created_post_id)) # Invalidate specific post if it was somehow cached before full creation
+    await invalidate_post_lists(redis)
+    await rankings.record_post(redis, created_post_id, 0, post_record['uploaded_at'])
+    return response_post
+
+async def create_posts_bulk(
+    db: asyncpg.Connection,
+    redis: redis_async.Redis,
+    posts_data: List[models.PostCreate],
+    filepaths_on_disk: List[str],
+    uploader_id: int,
+    tag_names: List[str]
+) -> List[models.Post]:
+    """
+    Create many posts sharing one set of tags (admin batch upload) in a single transaction:
+    the tags are resolved once, every post row is inserted by one multi-row INSERT ... SELECT
+    FROM unnest(...) and every post_tags row by one more statement. Caches are invalidated once.
+    Posts whose file or hash is already stored (a concurrent upload of the same bytes) are
+    skipped rather than failing the batch; they are simply absent from the returned list.
+    """
+    if not posts_data:
+        return []
+    async with db.transaction():
+        processed_tags = await resolve_tags(db, tag_names)
+        tag_ids = [t.id for t in processed_tags]
+        # Per-row int[] values cannot go through unnest() (it would flatten a 2-D array),
+        # so thumbnail sizes travel as array literals and are cast back per row.
+        post_records = await db.fetch("""
+            INSERT INTO posts (filename, filepath, mimetype, filesize, image_width, image_height, thumbnail_sizes,
+                               file_hash, phash, title, description, uploader_id, tag_ids, tag_names)
+            SELECT r.filename, r.filepath, r.mimetype, r.filesize, r.image_width, r.image_height, r.thumbnail_sizes::int[],
+                   r.file_hash, r.phash, r.title, r.description, $12, $13::int[], $14::text[]
+            FROM unnest($1::text[], $2::text[], $3::text[], $4::int[], $5::int[], $6::int[], $7::text[],
+                        $8::text[], $9::bigint[], $10::text[], $11::text[])
+                 AS r(filename, filepath, mimetype, filesize, image_width, image_height, thumbnail_sizes,
+                      file_hash, phash, title, description)
+            ON CONFLICT DO NOTHING
+            RETURNING id, filename, filepath, mimetype, filesize, image_width, image_height, thumbnail_sizes, file_hash, title, description, uploader_id, uploaded_at
+        """,
+            [p.filename for p in posts_data], filepaths_on_disk,
+            [p.mimetype for p in posts_data], [p.filesize for p in posts_data],
+            [p.image_width for p in posts_data], [p.image_height for p in posts_data],
+            ["{" + ",".join(str(size) for size in p.thumbnail_sizes) + "}" for p in posts_data],
+            [p.file_hash for p in posts_data],
+            [phash.to_db_value(p.phash) if p.phash is not None else None for p in posts_data],
+            [p.title for p in posts_data], [p.description for p in posts_data],
+            uploader_id, tag_ids, [t.name for t in processed_tags]
+        )
+        if tag_ids and post_records:
+            await _link_post_tags(db, [record['id'] for record in post_records], tag_ids)
+
+    uploader_public_info = await get_cached_user_public(db, redis, uploader_id)
+
+    created_posts = [
+        models.Post(
+            id=record['id'], filename=record['filename'], filepath=record['filepath'],
+            mimetype=record['mimetype'], filesize=record['filesize'],
+            image_width=record['image_width'], image_height=record['image_height'],
+            thumbnail_sizes=record['thumbnail_sizes'], file_hash=record['file_hash'],
+            title=record['title'], description=record['description'],
+            uploader_id=record['uploader_id'], uploader=uploader_public_info,
+            uploaded_at=record['uploaded_at'], tags=processed_tags,
             image_url=None, thumbnail_url=None, comment_count=0, upvotes=0, downvotes=0
         )
+        for record in post_records
+    ]
+    if created_posts:
+        await invalidate_post_lists(redis)
+        await rankings.record_posts(redis, [(post.id, 0, post.uploaded_at) for post in created_posts])
+    return created_posts
+
+async def delete_post(db: asyncpg.Connection, post_id: int) -> bool:
+    """
+    Delete a post row. Its tag links are removed first (keeping tags.post_count in step);
+    comments and votes go with the row through ON DELETE CASCADE. Returns False if there was
+    no such post. The caller removes the files and invalidates caches.
+    """
+    async with db.transaction():
+        await _unlink_post_tags(db, [post_id])
+        result = await db.execute("DELETE FROM posts WHERE id = $1", post_id)
+    return result != "DELETE 0"
+
+async def get_post_ids_by_hashes(db: asyncpg.Connection, file_hashes: List[str]) -> Dict[str, int]:
+    """Map each already-stored SHA-256 (hex) in `file_hashes` to its post id. One query for a whole batch."""
+    if not file_hashes:
+        return {}
+    records = await db.fetch(
+        "SELECT file_hash, id FROM posts WHERE file_hash = ANY($1::text[])",
+        [file_hash.lower() for file_hash in file_hashes]
+    )
+    return {record['file_hash']: record['id'] for record in records}
 
-        # Invalidate relevant caches
-        await redis.delete(f"{POST_CACHE_PREFIX}{created_post_id}") # Invalidate specific post if it was somehow cached before full creation
-        list_cache_keys = [key async for key in redis.scan_iter(match=f"{POST_LIST_CACHE_PREFIX}*")]
-        if list_cache_keys: await redis.delete(*list_cache_keys)
-        count_cache_keys = [key async for key in redis.scan_iter(match=f"{POST_COUNT_CACHE_PREFIX}*")]
-        if count_cache_keys: await redis.delete(*count_cache_keys)
-        return response_post
+async def get_existing_post_ids(db: asyncpg.Connection, post_ids: List[int]) -> set:
+    """The subset of `post_ids` that still exist (primary-key lookups)."""
+    if not post_ids:
+        return set()
+    records = await db.fetch("SELECT id FROM posts WHERE id = ANY($1::int[])", post_ids)
+    return {record['id'] for record in records}
+
+async def get_post_id_by_hash(db: asyncpg.Connection, file_hash: str) -> Optional[int]:
+    """Return the id of the post whose file has this SHA-256 (hex), if any. Uses uq_posts_file_hash."""
+    return await db.fetchval("SELECT id FROM posts WHERE file_hash = $1", file_hash.lower())
+
+async def get_post_phash(db: asyncpg.Connection, post_id: int) -> Optional[int]:
+    """Unsigned perceptual hash of a post, or None if it has none (not yet backfilled / unreadable)."""
+    value = await db.fetchval("SELECT phash FROM posts WHERE id = $1", post_id)
+    return phash.from_db_value(value) if value is not None else None
+
+async def get_posts_missing_phash(db: asyncpg.Connection, after_id: int = 0, limit: int = 100) -> List[asyncpg.Record]:
+    """Posts without a perceptual hash, in id order (keyset on id), for backfill_media.py."""
+    return await db.fetch(
+        "SELECT id, filepath FROM posts WHERE phash IS NULL AND id > $1 ORDER BY id LIMIT $2",
+        after_id, limit
+    )
+
+async def set_post_phash(db: asyncpg.Connection, post_id: int, value: int) -> None:
+    await db.execute("UPDATE posts SET phash = $1 WHERE id = $2", phash.to_db_value(value), post_id)
+
+def _post_from_cache_dict(post_dict: Dict[str, Any]) -> models.Post:
+    post_dict['tags'] = _parse_tags_from_source(post_dict.get('tags', []))
+    if post_dict.get('uploader') and isinstance(post_dict['uploader'], dict):
+        # Ensure it's parsed as UserPublic if that's what Post expects
+        post_dict['uploader'] = models.UserPublic(**post_dict['uploader'])
+    return models.Post(**post_dict)
+
+def _post_from_cache_json(raw: bytes) -> models.Post:
+    return _post_from_cache_dict(json_loads(raw))
+
+def _posts_from_cache_json(raw: bytes) -> List[models.Post]:
+    return [_post_from_cache_dict(post_dict) for post_dict in json_loads(raw)]
 
 async def get_post(db: asyncpg.Connection, redis: redis_async.Redis, post_id: int) -> Optional[models.Post]:
     cache_key = f"{POST_CACHE_PREFIX}{post_id}"
-    cached_post_json = await redis.get(cache_key)
-    if cached_post_json:
-        try:
-            post_dict = json.loads(cached_post_json)
-            post_dict['tags'] = _parse_tags_from_source(post_dict.get('tags', []))
-            if post_dict.get('uploader') and isinstance(post_dict['uploader'], dict):
-                 # Ensure it's parsed as UserPublic if that's what Post expects
-                 post_dict['uploader'] = models.UserPublic(**post_dict['uploader'])
-            return models.Post(**post_dict)
-        except (json.JSONDecodeError, TypeError, KeyError) as e: # Added KeyError for safety
-            print(f"Error decoding/parsing cached post for ID: {post_id}. Error: {e}. Fetching from DB.")
+    # Two-tier: process L1, then Redis; on a miss only one request per key queries the DB
+    # (single flight). Cached models are shared, so callers get a copy they can fill in
+    # (image_url etc.).
+    post = await cache.get_or_compute(redis, cache_key, _post_from_cache_json, lambda: _load_post(db, redis, cache_key, post_id))
+    return post.model_copy() if post is not None else None
 
+async def _load_post(db: asyncpg.Connection, redis: redis_async.Redis, cache_key: str, post_id: int) -> Optional[models.Post]:
     query = """
         SELECT
             p.id, p.filename, p.filepath, p.mimetype, p.filesize, p.image_width, p.image_height, -- Added dimensions
+            p.thumbnail_sizes, p.file_hash,
             p.title, p.description, p.uploaded_at, p.uploader_id,
             u.id AS uploader_user_id, u.username AS uploader_username, u.role AS uploader_role,
-            COALESCE((SELECT json_agg(json_build_object('id', t.id, 'name', t.name) ORDER BY t.name)
-                      FROM tags t JOIN post_tags pt ON t.id = pt.tag_id WHERE pt.post_id = p.id), '[]'::json) AS tags,
-            (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.id) AS comment_count,
-            (SELECT COUNT(*) FROM votes v WHERE v.post_id = p.id AND v.vote_type = 1) AS upvotes,
-            (SELECT COUNT(*) FROM votes v WHERE v.post_id = p.id AND v.vote_type = -1) AS downvotes
+            p.tag_ids, p.tag_names, -- Denormalized tags, no per-row join
+            p.comment_count, p.upvotes, p.downvotes -- Denormalized counters
         FROM posts p
         LEFT JOIN users u ON p.uploader_id = u.id
         WHERE p.id = $1;
@@ -292,7 +448,7 @@ async def get_post(db: asyncpg.Connection, redis: redis_async.Redis, post_id: in
     post_record = await db.fetchrow(query, post_id)
     if not post_record: return None
 
-    parsed_db_tags = _parse_tags_from_source(post_record['tags'])
+    parsed_db_tags = _tags_from_arrays(post_record['tag_ids'], post_record['tag_names'])
     uploader_public_data = None
     if post_record['uploader_id'] and post_record['uploader_user_id']: # Ensure uploader_user_id is present
         uploader_public_data = models.UserPublic(
@@ -304,63 +460,143 @@ async def get_post(db: asyncpg.Connection, redis: redis_async.Redis, post_id: in
         id=post_record['id'], filename=post_record['filename'], filepath=post_record['filepath'],
         mimetype=post_record['mimetype'], filesize=post_record['filesize'],
         image_width=post_record['image_width'], image_height=post_record['image_height'], # Added dimensions
+        thumbnail_sizes=post_record['thumbnail_sizes'], file_hash=post_record['file_hash'],
         title=post_record['title'], description=post_record['description'],
         uploaded_at=post_record['uploaded_at'], uploader_id=post_record['uploader_id'],
         uploader=uploader_public_data, tags=parsed_db_tags, image_url=None, thumbnail_url=None,
         comment_count=post_record['comment_count'], upvotes=post_record['upvotes'],
         downvotes=post_record['downvotes']
     )
-    await redis.set(cache_key, db_post_model.model_dump_json(), ex=CACHE_EXPIRY_SECONDS) # Use model_dump_json for Pydantic v2
+    await cache.set_cached(redis, cache_key, db_post_model, db_post_model.model_dump_json(), ex=CACHE_EXPIRY_SECONDS) # Use model_dump_json for Pydantic v2
     return db_post_model
 
+# Text search configuration shared by the posts.search_vector definition and the q= filter
+SEARCH_CONFIG = "english"
+
+# Sorts that support keyset (cursor) pagination, mapped to the column they order by.
+# Every keyset sort uses p.id as the tie-breaker.
+KEYSET_SORT_COLUMNS = {"date": "p.uploaded_at", "score": "p.score", "id": "p.id"}
+
+def _effective_sort(sort_by: Optional[str], order: Optional[str]) -> tuple:
+    # The default listing is always newest first, regardless of `order`
+    if sort_by is None:
+        return "date", "desc"
+    return sort_by, (order or "desc")
+
+def make_post_cursor(post: models.Post, sort_by: Optional[str], order: Optional[str]) -> Optional[str]:
+    """
+    Build the opaque cursor that continues a listing after `post`.
+    Returns None for sorts that cannot be paged by keyset (e.g. random).
+    """
+    sort_key, sort_order = _effective_sort(sort_by, order)
+    if sort_key not in KEYSET_SORT_COLUMNS:
+        return None
+    if sort_key == "date":
+        key_value: Any = post.uploaded_at.isoformat()
+    elif sort_key == "score":
+        key_value = post.upvotes - post.downvotes
+    else:
+        key_value = post.id
+    return encode_cursor({"s": sort_key, "o": sort_order, "k": key_value, "i": post.id})
+
+def parse_post_cursor(cursor: str, sort_by: Optional[str], order: Optional[str]) -> Dict[str, Any]:
+    """
+    Decode a cursor from make_post_cursor into the {"key", "id"} position get_posts expects.
+    Raises ValueError if the cursor is malformed or was issued for a different sort.
+    """
+    sort_key, sort_order = _effective_sort(sort_by, order)
+    if sort_key not in KEYSET_SORT_COLUMNS:
+        raise ValueError(f"Cursor pagination is not supported for sort_by={sort_by}.")
+    payload = decode_cursor(cursor)
+    if payload.get("s") != sort_key or payload.get("o") != sort_order:
+        raise ValueError("Cursor does not match the requested sort_by/order.")
+    last_id = payload.get("i")
+    key_value = payload.get("k")
+    if not isinstance(last_id, int):
+        raise ValueError("Malformed cursor: missing id.")
+    try:
+        if sort_key == "date":
+            key_value = datetime.fromisoformat(key_value)
+        elif sort_key == "score":
+            key_value = int(key_value)
+        else:
+            key_value = last_id
+    except (TypeError, ValueError):
+        raise ValueError("Malformed cursor: bad sort key.")
+    return {"key": key_value, "id": last_id}
+
+# Columns of a listed post; every listing query starts with this and adds WHERE/ORDER BY
+POST_LIST_SELECT = """
+        SELECT
+            p.id, p.filename, p.filepath, p.mimetype, p.filesize, p.image_width, p.image_height, -- Added dimensions
+            p.thumbnail_sizes, p.file_hash,
+            p.title, p.description, p.uploaded_at, p.uploader_id,
+            u.id AS uploader_user_id, u.username AS uploader_username, u.role AS uploader_role,
+            p.tag_ids, p.tag_names, -- Denormalized tags, no per-row join
+            p.comment_count, p.upvotes, p.downvotes, p.score -- Denormalized counters
+        FROM posts p
+        LEFT JOIN users u ON p.uploader_id = u.id
+    """
+
+def _post_from_list_record(record: asyncpg.Record) -> models.Post:
+    parsed_db_tags = _tags_from_arrays(record['tag_ids'], record['tag_names'])
+    uploader_public_data = None
+    if record['uploader_id'] and record['uploader_user_id']: # Ensure uploader_user_id is present
+        uploader_public_data = models.UserPublic(
+            id=record['uploader_user_id'], # Use uploader_user_id from query
+            username=record['uploader_username'],
+            role=record['uploader_role']
+        )
+    return models.Post(
+        id=record['id'], filename=record['filename'], filepath=record['filepath'],
+        mimetype=record['mimetype'], filesize=record['filesize'],
+        image_width=record['image_width'], image_height=record['image_height'], # Added dimensions
+        thumbnail_sizes=record['thumbnail_sizes'], file_hash=record['file_hash'],
+        title=record['title'], description=record['description'],
+        uploaded_at=record['uploaded_at'], uploader_id=record['uploader_id'],
+        uploader=uploader_public_data, tags=parsed_db_tags, image_url=None, thumbnail_url=None,
+        comment_count=record['comment_count'], upvotes=record['upvotes'],
+        downvotes=record['downvotes']
+    )
+
 async def get_posts(
     db: asyncpg.Connection, redis: redis_async.Redis, skip: int = 0, limit: int = 10,
     tags_filter: Optional[List[str]] = None,
     sort_by: Optional[str] = None, order: Optional[str] = "desc",
-    advanced_filters: Optional[Dict[str, Any]] = None
+    advanced_filters: Optional[Dict[str, Any]] = None,
+    cursor: Optional[Dict[str, Any]] = None # Position from parse_post_cursor; pages by keyset instead of OFFSET
 ) -> List[models.Post]:
+    if sort_by == "random":
+        # A fresh sample per request: never cached or shared with other requests
+        return await _load_posts(db, redis, None, skip, limit, tags_filter, sort_by, order, advanced_filters, cursor)
+
     normalized_tags_key_part = "_".join(sorted([tag.strip().lower().replace(' ', '_') for tag in tags_filter])) if tags_filter else "all"
     sort_key_part = f"sort_{sort_by}_order_{order}" if sort_by else "sort_default"
+    cursor_key_part = f"after_{cursor['key']}_{cursor['id']}".replace(' ', '_') if cursor else "first"
     
     adv_filters_key_parts = []
     if advanced_filters:
         for k, v in sorted(advanced_filters.items()): # Sort for consistent key order
             if v is not None: # Ensure None values don't break the key or are handled consistently
-                adv_filters_key_parts.append(f"{k}_{str(v).replace(' ','_')}")
+                adv_filters_key_parts.append(f"{k}_{quote(str(v), safe='')}") # Encoded: free text (q, uploader_name) must not collide
     adv_filters_key = "_".join(adv_filters_key_parts) if adv_filters_key_parts else "no_adv_filters"
 
-    cache_key = f"{POST_LIST_CACHE_PREFIX}skip_{skip}_limit_{limit}_tags_{normalized_tags_key_part}_{sort_key_part}_adv_{adv_filters_key}"
+    list_generation = await _get_cache_generation(redis, POSTS_CACHE_GENERATION_KEY)
+    cache_key = f"{POST_LIST_CACHE_PREFIX}v{list_generation}:skip_{skip}_limit_{limit}_tags_{normalized_tags_key_part}_{sort_key_part}_adv_{adv_filters_key}_cur_{cursor_key_part}"
     
-    cached_posts_json = await redis.get(cache_key)
-    if cached_posts_json:
-        try:
-            posts_dict_list = json.loads(cached_posts_json)
-            response_posts = []
-            for post_dict in posts_dict_list:
-                post_dict['tags'] = _parse_tags_from_source(post_dict.get('tags', []))
-                if post_dict.get('uploader') and isinstance(post_dict['uploader'], dict):
-                    # Ensure it's parsed as UserPublic if that's what Post expects
-                    post_dict['uploader'] = models.UserPublic(**post_dict['uploader'])
-                response_posts.append(models.Post(**post_dict))
-            return response_posts
-        except (json.JSONDecodeError, TypeError, KeyError) as e: # Added KeyError for safety
-            print(f"Error decoding/parsing cached post list for key: {cache_key}. Error: {e}. Fetching from DB.")
-
-    base_query = """
-        SELECT
-            p.id, p.filename, p.filepath, p.mimetype, p.filesize, p.image_width, p.image_height, -- Added dimensions
-            p.title, p.description, p.uploaded_at, p.uploader_id,
-            u.id AS uploader_user_id, u.username AS uploader_username, u.role AS uploader_role,
-            COALESCE((SELECT json_agg(json_build_object('id', t.id, 'name', t.name) ORDER BY t.name)
-                      FROM tags t JOIN post_tags pt ON t.id = pt.tag_id WHERE pt.post_id = p.id), '[]'::json) AS tags,
-            (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.id) AS comment_count,
-            (SELECT COUNT(*) FROM votes v WHERE v.post_id = p.id AND v.vote_type = 1) AS upvotes,
-            (SELECT COUNT(*) FROM votes v WHERE v.post_id = p.id AND v.vote_type = -1) AS downvotes,
-            ((SELECT COUNT(*) FROM votes v_up WHERE v_up.post_id = p.id AND v_up.vote_type = 1) -
-             (SELECT COUNT(*) FROM votes v_down WHERE v_down.post_id = p.id AND v_down.vote_type = -1)) AS score
-        FROM posts p
-        LEFT JOIN users u ON p.uploader_id = u.id
-    """
+    # Single flight: concurrent misses on this page (e.g. right after an invalidation) share one query
+    posts_list = await cache.get_or_compute(
+        redis, cache_key, _posts_from_cache_json,
+        lambda: _load_posts(db, redis, cache_key, skip, limit, tags_filter, sort_by, order, advanced_filters, cursor)
+    )
+    return [post.model_copy() for post in posts_list] # Shared with the L1 and other requests; hand out copies
+
+async def _load_posts(
+    db: asyncpg.Connection, redis: redis_async.Redis, cache_key: Optional[str], skip: int, limit: int,
+    tags_filter: Optional[List[str]], sort_by: Optional[str], order: Optional[str],
+    advanced_filters: Optional[Dict[str, Any]], cursor: Optional[Dict[str, Any]]
+) -> List[models.Post]:
+    base_query = POST_LIST_SELECT
     conditions = []
     query_params: List[Any] = []
     param_idx = 1
@@ -368,19 +604,10 @@ async def get_posts(
     if tags_filter:
         normalized_tags_filter = [tag.strip().lower().replace(' ', '_') for tag in tags_filter if tag.strip()]
         if normalized_tags_filter:
-            tag_placeholders = ', '.join([f'${i+param_idx}' for i in range(len(normalized_tags_filter))])
-            conditions.append(f"""
-                EXISTS (
-                    SELECT 1
-                    FROM post_tags pt_filter
-                    JOIN tags t_filter ON pt_filter.tag_id = t_filter.id
-                    WHERE pt_filter.post_id = p.id AND t_filter.name IN ({tag_placeholders})
-                    GROUP BY pt_filter.post_id
-                    HAVING COUNT(DISTINCT t_filter.id) = {len(normalized_tags_filter)}
-                )
-            """)
-            query_params.extend(normalized_tags_filter)
-            param_idx += len(normalized_tags_filter)
+            # Post must carry every requested tag; answered by the GIN index on tag_names
+            conditions.append(f"p.tag_names @> ${param_idx}::text[]")
+            query_params.append(normalized_tags_filter)
+            param_idx += 1
 
     if advanced_filters:
         if advanced_filters.get("uploaded_after"):
@@ -392,17 +619,9 @@ async def get_posts(
             query_params.append(advanced_filters["uploaded_before"])
             param_idx += 1
         if advanced_filters.get("min_score") is not None: # Check for None explicitly for 0 score
-            # Score is calculated, so we need a subquery or HAVING clause.
-            # For simplicity in WHERE, let's assume score is positive and filter on upvotes for now,
-            # or adjust the base_query to calculate score and use HAVING.
-            # Using the calculated 'score' alias directly in WHERE is not standard SQL for all DBs without subqueries.
-            # Let's add it to the HAVING clause later if possible, or filter on components.
-            # For now, let's add a placeholder condition that will be part of a HAVING clause if score is used in sort_by
-            # This part is tricky without modifying the base query structure significantly for WHERE.
-            # A common approach is to filter in a subquery or use HAVING.
-            # Let's assume for now we will filter on the calculated score in a HAVING clause if `min_score` is present.
-            # This will be handled by adding to a `having_conditions` list.
-            pass # Will handle min_score with HAVING clause or by adjusting main query structure if not already handled by score calculation in SELECT
+            conditions.append(f"p.score >= ${param_idx}") # score is a stored column, so it can be filtered directly
+            query_params.append(advanced_filters["min_score"])
+            param_idx += 1
         if advanced_filters.get("min_width"):
             conditions.append(f"p.image_width >= ${param_idx}") # Now uses actual column
             query_params.append(advanced_filters["min_width"])
@@ -411,71 +630,158 @@ async def get_posts(
             conditions.append(f"p.image_height >= ${param_idx}") # Now uses actual column
             query_params.append(advanced_filters["min_height"])
             param_idx += 1
+        if advanced_filters.get("uploader_id"):
+            # One user's posts: served by idx_posts_uploader (uploader_id, uploaded_at DESC, id DESC)
+            conditions.append(f"p.uploader_id = ${param_idx}")
+            query_params.append(advanced_filters["uploader_id"])
+            param_idx += 1
         if advanced_filters.get("uploader_name"):
-            conditions.append(f"u.username ILIKE ${param_idx}") # Case-insensitive search for username
+            # Substring search on usernames (trigram index), resolved to uploader ids first
+            conditions.append(f"p.uploader_id IN (SELECT id FROM users WHERE username ILIKE ${param_idx})")
             query_params.append(f"%{advanced_filters['uploader_name']}%") # Add wildcards for partial match
             param_idx += 1
+        if advanced_filters.get("q"):
+            # Full-text search over title/description, answered by the GIN index on search_vector
+            search_param_idx = param_idx
+            conditions.append(f"p.search_vector @@ websearch_to_tsquery('{SEARCH_CONFIG}', ${param_idx})")
+            query_params.append(advanced_filters["q"])
+            param_idx += 1
+
+    if cursor:
+        # Keyset pagination: continue strictly after the last row of the previous page
+        sort_key, sort_order = _effective_sort(sort_by, order)
+        comparator = "<" if sort_order == "desc" else ">"
+        if sort_key == "id":
+            conditions.append(f"p.id {comparator} ${param_idx}")
+            query_params.append(cursor["id"])
+            param_idx += 1
+        else:
+            conditions.append(f"({KEYSET_SORT_COLUMNS[sort_key]}, p.id) {comparator} (${param_idx}, ${param_idx + 1})")
+            query_params.extend([cursor["key"], cursor["id"]])
+            param_idx += 2
             
     if conditions:
         base_query += " WHERE " + " AND ".join(conditions)
 
-    # Handle min_score with a HAVING clause if present
-    having_conditions = []
-    if advanced_filters and advanced_filters.get("min_score") is not None:
-        having_conditions.append(f"score >= ${param_idx}")
-        query_params.append(advanced_filters["min_score"])
-        param_idx += 1
-    
     # Determine ORDER BY clause
     order_clause = "ORDER BY p.uploaded_at DESC, p.id DESC" # Default sort
     if sort_by == "date":
         order_clause = f"ORDER BY p.uploaded_at {order.upper()}, p.id {order.upper()}"
     elif sort_by == "score":
-        # Score is calculated in the SELECT, so we can use the alias 'score'
-        order_clause = f"ORDER BY score {order.upper()}, p.id {order.upper()}"
+        order_clause = f"ORDER BY p.score {order.upper()}, p.id {order.upper()}"
     elif sort_by == "id":
         order_clause = f"ORDER BY p.id {order.upper()}"
-    elif sort_by == "random":
-        order_clause = "ORDER BY RANDOM()" # PostgreSQL specific for random
+    elif sort_by == "relevance" and advanced_filters and advanced_filters.get("q"):
+        order_clause = f"ORDER BY ts_rank(p.search_vector, websearch_to_tsquery('{SEARCH_CONFIG}', ${search_param_idx})) DESC, p.id DESC"
     
-    base_query += f" {order_clause}" # Apply order first
-
-    if having_conditions:
-        base_query += " HAVING " + " AND ".join(having_conditions)
-
-    base_query += f" LIMIT ${param_idx} OFFSET ${param_idx + 1}" # Then limit and offset
-    query_params.extend([limit, skip])
-
-
-    post_records = await db.fetch(base_query, *query_params)
-    posts_list = []
-    for record in post_records:
-        parsed_db_tags = _parse_tags_from_source(record['tags'])
-        uploader_public_data = None
-        if record['uploader_id'] and record['uploader_user_id']: # Ensure uploader_user_id is present
-            uploader_public_data = models.UserPublic(
-                id=record['uploader_user_id'], # Use uploader_user_id from query
-                username=record['uploader_username'],
-                role=record['uploader_role']
-            )
-        posts_list.append(models.Post(
-            id=record['id'], filename=record['filename'], filepath=record['filepath'],
-            mimetype=record['mimetype'], filesize=record['filesize'],
-            image_width=record['image_width'], image_height=record['image_height'], # Added dimensions
-            title=record['title'], description=record['description'],
-            uploaded_at=record['uploaded_at'], uploader_id=record['uploader_id'],
-            uploader=uploader_public_data, tags=parsed_db_tags, image_url=None, thumbnail_url=None,
-            comment_count=record['comment_count'], upvotes=record['upvotes'],
-            downvotes=record['downvotes']
-        ))
-    if posts_list:
+    if sort_by == "random":
+        post_records = await _sample_random_post_records(db, base_query, bool(conditions), query_params, limit, tags_filter)
+    else:
+        base_query += f" {order_clause}"
+        base_query += f" LIMIT ${param_idx} OFFSET ${param_idx + 1}" # Then limit and offset
+        query_params.extend([limit, skip])
+        post_records = await db.fetch(base_query, *query_params)
+    posts_list = [_post_from_list_record(record) for record in post_records]
+    if posts_list and cache_key:
         try:
             cacheable_data = json_dumps([post.model_dump() for post in posts_list]) # Use model_dump for Pydantic v2
-            await redis.set(cache_key, cacheable_data, ex=CACHE_EXPIRY_SECONDS)
+            await cache.set_cached(redis, cache_key, posts_list, cacheable_data, ex=CACHE_EXPIRY_SECONDS)
         except Exception as e:
             print(f"Error caching post list: {e}")
     return posts_list
 
+async def get_posts_by_ids(db: asyncpg.Connection, post_ids: List[int]) -> List[models.Post]:
+    """Posts with the given ids (primary-key lookups), in the order of `post_ids`. Missing ids are skipped."""
+    if not post_ids:
+        return []
+    records = await db.fetch(POST_LIST_SELECT + " WHERE p.id = ANY($1::int[])", post_ids)
+    posts_by_id = {record['id']: _post_from_list_record(record) for record in records}
+    return [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+
+async def get_ranked_posts(
+    db: asyncpg.Connection, redis: redis_async.Redis, ranking_key: str, skip: int = 0, limit: int = 10
+) -> List[models.Post]:
+    """
+    One page of a precomputed ranking (sort_by=hot/top, see core.rankings): the ids come from
+    the Redis sorted set, the posts from their primary keys. A post deleted since it was ranked
+    is skipped, so a page can come back one short until the ranking is rebuilt.
+    """
+    post_ids = await rankings.page_post_ids(redis, ranking_key, skip, limit)
+    return await get_posts_by_ids(db, post_ids)
+
+# sort_by=random samples instead of sorting the filtered table. Every post carries a uniformly
+# distributed, indexed random_key; each probe picks a fresh random point and takes the first
+# matching post at or after it (one index seek), so a page costs O(limit) however large the
+# table grows. Sampling is approximately uniform (a post after a wider gap in random_key is
+# a little likelier).
+# With filters, a probe walks the index until it meets a matching post, which for a selective
+# filter is far. So each probe only looks within a random_key window of about
+# RANDOM_PROBE_MAX_ROWS posts, and requests whose matches are too few (or too sparse for a
+# window to hit) are shuffled with ORDER BY RANDOM() instead, cheap on a small set. "Too few"
+# comes from a cheap bound: the maintained tag counters and the planner's row estimate
+# (EXPLAIN, nothing is executed), which also covers multi-tag ANDs and non-tag filters.
+RANDOM_SAMPLE_OVERSAMPLING = 2 # Probes per requested post; repeats are dropped
+RANDOM_SHUFFLE_MAX_MATCHES = 5000 # Filters matching at most this many posts are shuffled directly
+RANDOM_PROBE_MAX_ROWS = 2000 # Posts (in random_key order) one probe may walk past
+RANDOM_PROBE_MIN_EXPECTED_HITS = 3 # Matches a probe's window should hold on average, else shuffle
+
+async def _random_sample_match_bound(
+    db: asyncpg.Connection, filtered_query: str, query_params: List[Any], tags_filter: Optional[List[str]]
+) -> int:
+    """Cheap estimate of the rows `filtered_query` matches: tag counters and the planner estimate, whichever is lower."""
+    normalized_tags_filter = _clean_tag_names(tags_filter or [])
+    bounds = []
+    if normalized_tags_filter:
+        # Upper bound from the maintained tag counters (a missing tag matches nothing)
+        bounds.append(await db.fetchval(
+            "SELECT MIN(COALESCE(t.post_count, 0)) FROM unnest($1::text[]) AS f(name) LEFT JOIN tags t ON t.name = f.name",
+            normalized_tags_filter
+        ))
+    if len(query_params) > 1 or len(normalized_tags_filter) > 1 or not normalized_tags_filter:
+        # Other filters, or an AND of tags: the counters alone can overstate the matches a lot
+        plan = await db.fetchval(f"EXPLAIN (FORMAT JSON) {filtered_query}", *query_params)
+        bounds.append(int(json_loads(plan)[0]["Plan"]["Plan Rows"]))
+    return min(bounds)
+
+async def _sample_random_post_records(
+    db: asyncpg.Connection, filtered_query: str, has_conditions: bool, query_params: List[Any],
+    limit: int, tags_filter: Optional[List[str]]
+) -> List[asyncpg.Record]:
+    """Up to `limit` random rows of `filtered_query` (the SELECT ... FROM ... [WHERE ...] built by _load_posts)."""
+    param_idx = len(query_params) + 1
+    shuffle_query = f"{filtered_query} ORDER BY RANDOM() LIMIT ${param_idx}"
+    probe_window = 1.0 # Width of the random_key range a probe may look in
+    if has_conditions:
+        max_matches = await _random_sample_match_bound(db, filtered_query, query_params, tags_filter)
+        if max_matches <= RANDOM_SHUFFLE_MAX_MATCHES:
+            return await db.fetch(shuffle_query, *query_params, limit)
+        table_rows = await db.fetchval("SELECT reltuples::bigint FROM pg_class WHERE oid = 'posts'::regclass")
+        if table_rows and table_rows > 0: # -1 or 0 until the table is first analyzed
+            probe_window = min(1.0, RANDOM_PROBE_MAX_ROWS / table_rows)
+            if max_matches * probe_window < RANDOM_PROBE_MIN_EXPECTED_HITS:
+                # Matches too sparse for a bounded probe to find: shuffle the (still modest) set
+                return await db.fetch(shuffle_query, *query_params, limit)
+
+    probe_points = [random.random() for _ in range(limit * RANDOM_SAMPLE_OVERSAMPLING)]
+    sampled_records = await db.fetch(f"""
+        SELECT sampled.*
+        FROM unnest(${param_idx}::float8[]) AS probe(point)
+        CROSS JOIN LATERAL (
+            {filtered_query} {"AND" if has_conditions else "WHERE"}
+                p.random_key >= probe.point AND p.random_key < probe.point + ${param_idx + 1}
+            ORDER BY p.random_key LIMIT 1
+        ) AS sampled
+    """, *query_params, probe_points, probe_window)
+    unique_records = list({record['id']: record for record in sampled_records}.values())
+    if not unique_records or (not has_conditions and len(unique_records) < limit):
+        # The estimates were far off, or (unfiltered) the whole table holds about `limit` posts:
+        # shuffle instead of returning nothing or a short page
+        return await db.fetch(shuffle_query, *query_params, limit)
+    # A sample can come back short of `limit` when the matches are sparser than estimated;
+    # the short page is served rather than paying for a full shuffle on top of the probes
+    random.shuffle(unique_records)
+    return unique_records[:limit]
+
 async def count_posts(
     db: asyncpg.Connection, redis: redis_async.Redis, tags_filter: Optional[List[str]] = None,
     sort_by: Optional[str] = None, # sort_by might be needed if filtering changes based on it
@@ -487,33 +793,36 @@ async def count_posts(
     if advanced_filters:
         for k, v in sorted(advanced_filters.items()):
              if v is not None:
-                adv_filters_key_parts.append(f"{k}_{str(v).replace(' ','_')}")
+                adv_filters_key_parts.append(f"{k}_{quote(str(v), safe='')}") # Encoded: free text (q, uploader_name) must not collide
     adv_filters_key = "_".join(adv_filters_key_parts) if adv_filters_key_parts else "no_adv_filters"
 
     # sort_by is usually not part of count cache key unless it implies different filtering logic for count
-    cache_key = f"{POST_COUNT_CACHE_PREFIX}tags_{normalized_tags_key_part}_adv_{adv_filters_key}"
-    
-    cached_count = await redis.get(cache_key)
-    if cached_count is not None:
-        try: return int(cached_count)
-        except ValueError: print(f"Error decoding cached post count for key: {cache_key}. Fetching from DB.")
-
-    # Base query for counting. We might need to join with users if filtering by uploader_name.
-    # Or calculate score if filtering by min_score.
-    # This can get complex. A subquery approach is often cleaner for counts with complex filters.
+    list_generation = await _get_cache_generation(redis, POSTS_CACHE_GENERATION_KEY)
+    cache_key = f"{POST_COUNT_CACHE_PREFIX}v{list_generation}:tags_{normalized_tags_key_part}_adv_{adv_filters_key}"
     
-    # Start with a subquery that applies all filters, then count from that.
-    sub_query_sql = """
-        SELECT p.id
-        FROM posts p
-        LEFT JOIN users u ON p.uploader_id = u.id
-        LEFT JOIN (
-            SELECT post_id, 
-                   (COUNT(CASE WHEN vote_type = 1 THEN 1 END) - COUNT(CASE WHEN vote_type = -1 THEN 1 END)) as calculated_score
-            FROM votes
-            GROUP BY post_id
-        ) v_score ON p.id = v_score.post_id
+    return await cache.get_or_compute(
+        redis, cache_key, int, lambda: _load_post_count(db, redis, cache_key, tags_filter, advanced_filters)
+    )
+
+async def _load_post_count(
+    db: asyncpg.Connection, redis: redis_async.Redis, cache_key: str,
+    tags_filter: Optional[List[str]], advanced_filters: Optional[Dict[str, Any]]
+) -> int:
+    count_sql, query_params = _post_count_sql(tags_filter, advanced_filters)
+    count_record = await db.fetchval(f"SELECT COUNT(*) {count_sql}", *query_params)
+    db_count = count_record if count_record is not None else 0
+    await cache.set_cached(redis, cache_key, db_count, db_count, ex=CACHE_EXPIRY_SECONDS)
+    return db_count
+
+def _post_count_sql(
+    tags_filter: Optional[List[str]], advanced_filters: Optional[Dict[str, Any]]
+) -> Tuple[str, List[Any]]:
+    """
+    FROM/WHERE part of the filtered posts count, with its parameters. Shared by the exact
+    count and the planner estimate. min_score reads the denormalized p.score column, and the
+    uploader name filter is a subquery on users, so no join is needed.
     """
+    count_sql = "FROM posts p"
     conditions = []
     query_params: List[Any] = []
     param_idx = 1
@@ -521,19 +830,10 @@ async def count_posts(
     if tags_filter:
         normalized_tags_filter = [tag.strip().lower().replace(' ', '_') for tag in tags_filter if tag.strip()]
         if normalized_tags_filter:
-            tag_placeholders = ', '.join([f'${i+param_idx}' for i in range(len(normalized_tags_filter))])
-            conditions.append(f"""
-                EXISTS (
-                    SELECT 1
-                    FROM post_tags pt_filter
-                    JOIN tags t_filter ON pt_filter.tag_id = t_filter.id
-                    WHERE pt_filter.post_id = p.id AND t_filter.name IN ({tag_placeholders})
-                    GROUP BY pt_filter.post_id
-                    HAVING COUNT(DISTINCT t_filter.id) = {len(normalized_tags_filter)}
-                )
-            """)
-            query_params.extend(normalized_tags_filter)
-            param_idx += len(normalized_tags_filter)
+            # Post must carry every requested tag; answered by the GIN index on tag_names
+            conditions.append(f"p.tag_names @> ${param_idx}::text[]")
+            query_params.append(normalized_tags_filter)
+            param_idx += 1
 
     if advanced_filters:
         if advanced_filters.get("uploaded_after"):
@@ -545,7 +845,7 @@ async def count_posts(
             query_params.append(advanced_filters["uploaded_before"])
             param_idx += 1
         if advanced_filters.get("min_score") is not None:
-            conditions.append(f"COALESCE(v_score.calculated_score, 0) >= ${param_idx}")
+            conditions.append(f"p.score >= ${param_idx}")
             query_params.append(advanced_filters["min_score"])
             param_idx += 1
         if advanced_filters.get("min_width"):
@@ -556,20 +856,46 @@ async def count_posts(
             conditions.append(f"p.image_height >= ${param_idx}") # Now uses actual column
             query_params.append(advanced_filters["min_height"])
             param_idx += 1
+        if advanced_filters.get("uploader_id"):
+            conditions.append(f"p.uploader_id = ${param_idx}")
+            query_params.append(advanced_filters["uploader_id"])
+            param_idx += 1
         if advanced_filters.get("uploader_name"):
-            conditions.append(f"u.username ILIKE ${param_idx}")
+            conditions.append(f"p.uploader_id IN (SELECT id FROM users WHERE username ILIKE ${param_idx})")
             query_params.append(f"%{advanced_filters['uploader_name']}%")
             param_idx += 1
+        if advanced_filters.get("q"):
+            conditions.append(f"p.search_vector @@ websearch_to_tsquery('{SEARCH_CONFIG}', ${param_idx})")
+            query_params.append(advanced_filters["q"])
+            param_idx += 1
 
     if conditions:
-        sub_query_sql += " WHERE " + " AND ".join(conditions)
-    
-    final_count_query = f"SELECT COUNT(*) FROM ({sub_query_sql}) AS filtered_posts"
+        count_sql += " WHERE " + " AND ".join(conditions)
+    return count_sql, query_params
 
-    count_record = await db.fetchval(final_count_query, *query_params)
-    db_count = count_record if count_record is not None else 0
-    await redis.set(cache_key, db_count, ex=CACHE_EXPIRY_SECONDS)
-    return db_count
+async def estimate_post_count(
+    db: asyncpg.Connection, redis: redis_async.Redis, tags_filter: Optional[List[str]] = None,
+    advanced_filters: Optional[Dict[str, Any]] = None
+) -> int:
+    """
+    Approximate number of posts matching the filters, without scanning them:
+    - unfiltered: the table's row estimate from pg_class (kept current by autovacuum/ANALYZE),
+    - a single tag: the maintained tags.post_count,
+    - filtered: the planner's row estimate for the filtered query (EXPLAIN, nothing is executed).
+    Falls back to the exact (cached) count_posts while the table has never been analyzed.
+    """
+    count_sql, query_params = _post_count_sql(tags_filter, advanced_filters)
+    if len(query_params) == 1 and isinstance(query_params[0], list) and len(query_params[0]) == 1:
+        # A single tag and nothing else: the maintained per-tag counter is exact
+        tag_count = await db.fetchval("SELECT post_count FROM tags WHERE name = $1", query_params[0][0])
+        return tag_count or 0
+    if not query_params:
+        row_estimate = await db.fetchval("SELECT reltuples::bigint FROM pg_class WHERE oid = 'posts'::regclass")
+        if row_estimate is None or row_estimate < 0:
+            return await count_posts(db, redis, tags_filter=tags_filter, advanced_filters=advanced_filters)
+        return row_estimate
+    plan = await db.fetchval(f"EXPLAIN (FORMAT JSON) SELECT 1 {count_sql}", *query_params)
+    return int(json_loads(plan)[0]["Plan"]["Plan Rows"])
 
 # Helper for count_posts query construction (internal)
 def conditions_to_str(conditions: List[str]) -> str:
@@ -590,7 +916,7 @@ async def get_user_by_username(db: asyncpg.Connection, username: str) -> Optiona
     return None
 
 async def create_user(db: asyncpg.Connection, user_in: models.UserCreate) -> models.User:
-    hashed_password = security.get_password_hash(user_in.password)
+    hashed_password = await security.get_password_hash_async(user_in.password) # Off the event loop
     existing_email_user = await get_user_by_email(db, user_in.email)
     if existing_email_user: raise ValueError(f"User with email {user_in.email} already exists.")
     existing_username_user = await get_user_by_username(db, user_in.username)
@@ -619,6 +945,86 @@ async def get_user(db: asyncpg.Connection, user_id: int) -> Optional[models.User
         return models.UserInDB(**user_record) # Return UserInDB as it contains hashed_password
     return None
 
+# Identity cache. Users are read on every authenticated request and embedded (as UserPublic)
+# in every created post, comment and vote, so they are cached at two levels: a per-process
+# TTL LRU in front of Redis. Cached users never include hashed_password; login still reads
+# the users table directly. Redis keys: user:id:{id} -> User JSON, user:name:{username} -> id.
+# Returned models are shared between requests and must be treated as read-only.
+USER_CACHE_PREFIX = "user:id:"
+USERNAME_CACHE_PREFIX = "user:name:"
+# The local level is keyed by the same strings as Redis so pub/sub invalidation reaches it.
+_identity_cache = cache.register_local_cache(
+    TTLCache(settings.cache.identity_local_max_entries, settings.cache.identity_local_ttl_seconds)
+)
+
+def _remember_user_locally(user: models.User) -> None:
+    _identity_cache.set(f"{USER_CACHE_PREFIX}{user.id}", user)
+    _identity_cache.set(f"{USERNAME_CACHE_PREFIX}{user.username}", user)
+
+async def _store_user_in_redis(redis: redis_async.Redis, user: models.User) -> None:
+    ttl = settings.cache.identity_redis_ttl_seconds
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.set(f"{USER_CACHE_PREFIX}{user.id}", user.model_dump_json(), ex=ttl)
+        pipe.set(f"{USERNAME_CACHE_PREFIX}{user.username}", user.id, ex=ttl)
+        await pipe.execute()
+
+async def get_cached_user(db: asyncpg.Connection, redis: redis_async.Redis, user_id: int) -> Optional[models.User]:
+    """User by id through the identity cache (process, then Redis, then the users table)."""
+    user = _identity_cache.get(f"{USER_CACHE_PREFIX}{user_id}")
+    if user is not None:
+        return user
+    cached_user_json = await redis.get(f"{USER_CACHE_PREFIX}{user_id}")
+    if cached_user_json:
+        try:
+            user = models.User.model_validate_json(cached_user_json)
+        except ValueError as e: # pydantic.ValidationError is a ValueError
+            print(f"Error parsing cached user {user_id}: {e}. Fetching from DB.")
+    if user is None:
+        user_in_db = await get_user(db, user_id)
+        if user_in_db is None:
+            return None
+        user = models.User(**user_in_db.model_dump(exclude={"hashed_password"}))
+        await _store_user_in_redis(redis, user)
+    _remember_user_locally(user)
+    return user
+
+async def get_cached_user_by_username(db: asyncpg.Connection, redis: redis_async.Redis, username: str) -> Optional[models.User]:
+    """User by username through the identity cache."""
+    user = _identity_cache.get(f"{USERNAME_CACHE_PREFIX}{username}")
+    if user is not None:
+        return user
+    cached_user_id = await redis.get(f"{USERNAME_CACHE_PREFIX}{username}")
+    if cached_user_id is not None:
+        user = await get_cached_user(db, redis, int(cached_user_id))
+        if user is not None and user.username == username:
+            return user
+    user_in_db = await get_user_by_username(db, username=username)
+    if user_in_db is None:
+        return None
+    user = models.User(**user_in_db.model_dump(exclude={"hashed_password"}))
+    await _store_user_in_redis(redis, user)
+    _remember_user_locally(user)
+    return user
+
+async def get_cached_user_public(db: asyncpg.Connection, redis: redis_async.Redis, user_id: int) -> Optional[models.UserPublic]:
+    """Publicly safe info (id, username, role) for embedding in posts, comments and votes."""
+    user = await get_cached_user(db, redis, user_id)
+    return models.UserPublic(id=user.id, username=user.username, role=user.role) if user else None
+
+async def invalidate_user_cache(redis: Optional[redis_async.Redis], user_id: int, username: Optional[str] = None) -> None:
+    """
+    Drop a user from the identity cache after it changes, in Redis and in every worker.
+    Without a Redis client (e.g. a script with no Redis configured) only this process is
+    cleared and other workers catch up when their entries expire.
+    """
+    keys = [f"{USER_CACHE_PREFIX}{user_id}"]
+    if username:
+        keys.append(f"{USERNAME_CACHE_PREFIX}{username}")
+    if redis is not None:
+        await cache.invalidate(redis, *keys)
+    else:
+        cache.forget_locally(*keys)
+
 # Comment CRUD operations
 COMMENTS_FOR_POST_CACHE_PREFIX = "comments_for_post:"
 
@@ -640,20 +1046,18 @@ async def create_comment(db: asyncpg.Connection, redis: redis_async.Redis, comme
         if not comment_record:
             raise Exception("Failed to create comment.")
 
-        # Fetch the user who made the comment (only fields needed for UserPublic)
-        commenter_user_record = await db.fetchrow("SELECT id, username, role FROM users WHERE id = $1", user_id)
-        if not commenter_user_record:
-            raise Exception("Commenter user not found.")
+        # Keep the denormalized counter on the post in step with the new row
+        await db.execute("UPDATE posts SET comment_count = comment_count + 1 WHERE id = $1", post_id)
 
-        commenter_public_info = models.UserPublic(**commenter_user_record)
+        # The user who made the comment (only fields needed for UserPublic)
+        commenter_public_info = await get_cached_user_public(db, redis, user_id)
+        if not commenter_public_info:
+            raise Exception("Commenter user not found.")
 
         # Invalidate post cache as comment_count has changed
-        await redis.delete(f"{POST_CACHE_PREFIX}{post_id}")
+        await cache.invalidate(redis, *post_cache_keys(post_id))
         # Invalidate the comments list cache for this post
-        comments_list_cache_keys = [key async for key in redis.scan_iter(match=f"{COMMENTS_FOR_POST_CACHE_PREFIX}{post_id}:*")]
-        if comments_list_cache_keys:
-            await redis.delete(*comments_list_cache_keys)
-            print(f"Invalidated comments list cache for post {post_id} due to new comment.")
+        await invalidate_comments_for_post(redis, post_id)
 
         return models.Comment(
             id=comment_record['id'],
@@ -669,47 +1073,117 @@ async def create_comment(db: asyncpg.Connection, redis: redis_async.Redis, comme
             downvotes=0
         )
 
-async def get_comments_for_post(db: asyncpg.Connection, redis: redis_async.Redis, post_id: int, skip: int = 0, limit: int = 10) -> List[models.Comment]:
-    cache_key = f"{COMMENTS_FOR_POST_CACHE_PREFIX}{post_id}:skip_{skip}:limit_{limit}"
-    cached_comments_json = await redis.get(cache_key)
+# Comment threads are built by one recursive query: a page of comments (a post's root
+# comments, or the replies to one comment), then, level by level, the oldest
+# max_replies_per_comment replies of every comment already in the tree, down to
+# max_reply_depth. Rows come back ordered by depth, so every parent is seen before its
+# replies and the tree is assembled in one pass.
+# Pages are keyset-paged on (created_at, id), oldest first: the page comments come from
+# idx_comments_post_roots or idx_comments_parent_created, one index range scan each.
+# {page_conditions} selects the page; $1 is the post id, $2 the page size, $3 the depth
+# limit, $4 the per-comment reply limit. One row beyond the page tells whether more follow.
+COMMENT_TREE_QUERY = """
+    WITH RECURSIVE page AS (
+        SELECT c.id, c.created_at FROM comments c
+        WHERE c.post_id = $1 AND {page_conditions}
+        ORDER BY c.created_at ASC, c.id ASC
+        LIMIT $2 + 1
+    ), tree AS (
+        SELECT page_comments.id, 0 AS depth
+        FROM (SELECT id FROM page ORDER BY created_at ASC, id ASC LIMIT $2) page_comments
+        UNION ALL
+        SELECT replies.id, tree.depth + 1
+        FROM tree
+        CROSS JOIN LATERAL (
+            SELECT r.id FROM comments r
+            WHERE r.parent_comment_id = tree.id
+            ORDER BY r.created_at ASC, r.id ASC
+            LIMIT $4
+        ) replies
+        WHERE tree.depth < $3
+    )
+    SELECT
+        c.id, c.post_id, c.user_id, c.parent_comment_id, c.content, c.created_at, c.updated_at,
+        u.id AS comment_user_id, u.username AS user_username, u.role AS user_role,
+        (SELECT COUNT(*) FROM comments r WHERE r.parent_comment_id = c.id) AS reply_count,
+        (SELECT COUNT(*) FROM votes v WHERE v.comment_id = c.id AND v.vote_type = 1) AS upvotes,
+        (SELECT COUNT(*) FROM votes v WHERE v.comment_id = c.id AND v.vote_type = -1) AS downvotes,
+        (SELECT COUNT(*) FROM page) > $2 AS has_next
+    FROM tree
+    JOIN comments c ON c.id = tree.id
+    LEFT JOIN users u ON c.user_id = u.id
+    ORDER BY tree.depth, c.created_at, c.id
+"""
+
+def make_comment_cursor(comment: models.Comment) -> str:
+    """Opaque cursor continuing a comment page (root comments or replies) after `comment`."""
+    return encode_cursor({"t": comment.created_at.isoformat(), "i": comment.id})
+
+def parse_comment_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Decode a cursor from make_comment_cursor into the {"created_at", "id"} position after
+    which to continue. Raises ValueError if it is malformed.
+    """
+    payload = decode_cursor(cursor)
+    if not isinstance(payload.get("i"), int):
+        raise ValueError("Malformed cursor: missing id.")
+    try:
+        created_at = datetime.fromisoformat(payload.get("t"))
+    except (TypeError, ValueError):
+        raise ValueError("Malformed cursor: bad timestamp.")
+    return {"created_at": created_at, "id": payload["i"]}
+
+def _comment_page_from_cache_json(raw: bytes) -> Tuple[List[models.Comment], Optional[str]]:
+    cached_page = json_loads(raw)
+    return [models.Comment.model_validate(comment_dict) for comment_dict in cached_page["comments"]], cached_page["next_cursor"]
+
+async def _get_comment_tree_page(
+    db: asyncpg.Connection, redis: redis_async.Redis, post_id: int, parent_comment_id: Optional[int],
+    limit: int, cursor: Optional[Dict[str, Any]]
+) -> Tuple[List[models.Comment], Optional[str]]:
+    """
+    One page of comments with their replies nested (COMMENT_TREE_QUERY), and the cursor for
+    the next page (None on the last). parent_comment_id=None pages the post's root comments.
+    All pages of one post are fields of one cached hash, dropped together when a comment is added.
+    """
+    comments_generation = await _get_cache_generation(redis, f"{COMMENTS_CACHE_GENERATION_PREFIX}{post_id}")
+    cache_key = f"{COMMENTS_FOR_POST_CACHE_PREFIX}{post_id}:v{comments_generation}"
+    cursor_key_part = f"after_{cursor['created_at'].isoformat()}_{cursor['id']}" if cursor else "first"
+    cache_field = f"parent_{parent_comment_id or 'none'}:{cursor_key_part}:limit_{limit}"
+    cached_page_json = await cache.get_cached_field(redis, cache_key, cache_field)
 
-    if cached_comments_json:
+    if cached_page_json:
         try:
-            comments_dict_list = json.loads(cached_comments_json)
-            response_comments = []
-            for comm_dict in comments_dict_list:
-                if comm_dict.get('user') and isinstance(comm_dict['user'], dict):
-                    # Ensure it's parsed as UserPublic
-                    comm_dict['user'] = models.UserPublic(**comm_dict['user'])
-                comm_dict['replies'] = []
-                response_comments.append(models.Comment(**comm_dict))
-            print(f"Cache HIT for comments list: {cache_key}")
-            return response_comments
-        except (json.JSONDecodeError, TypeError, KeyError) as e: # Added KeyError for safety
+            comments_page = _comment_page_from_cache_json(cached_page_json)
+            print(f"Cache HIT for comments list: {cache_key} {cache_field}")
+            return comments_page
+        except (json.JSONDecodeError, TypeError, KeyError, ValueError) as e: # pydantic's ValidationError is a ValueError
             print(f"Error decoding/parsing cached comments for post {post_id}. Error: {e}. Fetching from DB.")
 
-    query = """
-        SELECT
-            c.id, c.post_id, c.user_id, c.parent_comment_id, c.content, c.created_at, c.updated_at,
-            u.id AS comment_user_id, u.username AS user_username, u.role AS user_role, -- Removed email, added comment_user_id and role
-            (SELECT COUNT(*) FROM votes v WHERE v.comment_id = c.id AND v.vote_type = 1) AS upvotes,
-            (SELECT COUNT(*) FROM votes v WHERE v.comment_id = c.id AND v.vote_type = -1) AS downvotes
-        FROM comments c
-        JOIN users u ON c.user_id = u.id
-        WHERE c.post_id = $1 AND c.parent_comment_id IS NULL
-        ORDER BY c.created_at ASC
-        LIMIT $2 OFFSET $3;
-    """
-    comment_records = await db.fetch(query, post_id, limit, skip)
-
-    comments_list = []
+    query_params: List[Any] = [post_id, limit, settings.comments.max_reply_depth, settings.comments.max_replies_per_comment]
+    if parent_comment_id is None:
+        page_conditions = ["c.parent_comment_id IS NULL"]
+    else:
+        page_conditions = [f"c.parent_comment_id = ${len(query_params) + 1}"]
+        query_params.append(parent_comment_id)
+    if cursor:
+        page_conditions.append(f"(c.created_at, c.id) > (${len(query_params) + 1}, ${len(query_params) + 2})")
+        query_params.extend([cursor["created_at"], cursor["id"]])
+    comment_records = await db.fetch(
+        COMMENT_TREE_QUERY.format(page_conditions=" AND ".join(page_conditions)), *query_params
+    )
+
+    comments_list: List[models.Comment] = []
+    comments_by_id: Dict[int, models.Comment] = {}
     for record in comment_records:
-        commenter_public_info = models.UserPublic(
-            id=record['comment_user_id'], # Use comment_user_id from query
-            username=record['user_username'],
-            role=record['user_role']
-        )
-        comments_list.append(models.Comment(
+        commenter_public_info = None
+        if record['comment_user_id']: # NULL once the author's account is deleted
+            commenter_public_info = models.UserPublic(
+                id=record['comment_user_id'],
+                username=record['user_username'],
+                role=record['user_role']
+            )
+        comment = models.Comment(
             id=record['id'],
             post_id=record['post_id'],
             user_id=record['user_id'],
@@ -718,20 +1192,55 @@ async def get_comments_for_post(db: asyncpg.Connection, redis: redis_async.Redis
             content=record['content'],
             created_at=record['created_at'],
             updated_at=record['updated_at'],
-            replies=[], # Populate if fetching replies recursively
+            replies=[],
             upvotes=record['upvotes'],
-            downvotes=record['downvotes']
-        ))
+            downvotes=record['downvotes'],
+            reply_count=record['reply_count']
+        )
+        comments_by_id[comment.id] = comment
+        parent = comments_by_id.get(comment.parent_comment_id) if comment.parent_comment_id else None
+        if parent is not None:
+            parent.replies.append(comment)
+        else:
+            comments_list.append(comment) # Page comment (depth 0)
+
+    # Threads cut short by the reply limit continue through GET .../comments/{id}/replies
+    for comment in comments_by_id.values():
+        if comment.replies and comment.reply_count > len(comment.replies):
+            comment.replies_cursor = make_comment_cursor(comment.replies[-1])
+
+    next_cursor = None
+    if comment_records and comment_records[0]['has_next']:
+        next_cursor = make_comment_cursor(comments_list[-1])
 
     if comments_list:
         try:
-            # For caching, ensure UserBase within Comment is also serializable if not default
-            cacheable_data = json_dumps([comment.model_dump() for comment in comments_list])
-            await redis.set(cache_key, cacheable_data, ex=CACHE_EXPIRY_SECONDS)
+            cacheable_data = json_dumps_bytes({
+                "comments": [comment.model_dump() for comment in comments_list],
+                "next_cursor": next_cursor
+            })
+            await cache.set_cached_field(redis, cache_key, cache_field, cacheable_data, ex=CACHE_EXPIRY_SECONDS)
         except Exception as e:
             print(f"Error caching comments list for post {post_id}: {e}")
 
-    return comments_list
+    return comments_list, next_cursor
+
+async def get_comments_for_post(
+    db: asyncpg.Connection, redis: redis_async.Redis, post_id: int, limit: int = 10,
+    cursor: Optional[Dict[str, Any]] = None # Position from parse_comment_cursor
+) -> Tuple[List[models.Comment], Optional[str]]:
+    """A page of a post's root comments, each with its replies nested, and the next page's cursor."""
+    return await _get_comment_tree_page(db, redis, post_id, None, limit, cursor)
+
+async def get_comment_replies(
+    db: asyncpg.Connection, redis: redis_async.Redis, post_id: int, comment_id: int, limit: int = 10,
+    cursor: Optional[Dict[str, Any]] = None # Position from parse_comment_cursor
+) -> Tuple[List[models.Comment], Optional[str]]:
+    """A page of the replies to one comment, each with its own replies nested, and the next page's cursor."""
+    return await _get_comment_tree_page(db, redis, post_id, comment_id, limit, cursor)
+
+async def comment_exists(db: asyncpg.Connection, post_id: int, comment_id: int) -> bool:
+    return await db.fetchval("SELECT EXISTS (SELECT 1 FROM comments WHERE id = $1 AND post_id = $2)", comment_id, post_id)
 
 # Vote CRUD operations
 COMMENT_CACHE_PREFIX = "comment:" # For individual comment caching if implemented
@@ -757,6 +1266,9 @@ async def cast_vote(db: asyncpg.Connection, redis: redis_async.Redis, vote_data:
 
         existing_vote_record = await db.fetchrow(existing_vote_query, *params)
 
+        # Net change to the post's denormalized counters caused by this request
+        upvotes_delta, downvotes_delta = 0, 0
+
         if existing_vote_record:
             # Vote exists
             existing_vote_id = existing_vote_record['id']
@@ -765,6 +1277,8 @@ async def cast_vote(db: asyncpg.Connection, redis: redis_async.Redis, vote_data:
                 # User clicked the same vote button again - unvote (delete the vote)
                 await db.execute("DELETE FROM votes WHERE id = $1", existing_vote_id)
                 created_vote_record = None # Vote removed
+                if current_vote_type == 1: upvotes_delta -= 1
+                else: downvotes_delta -= 1
             else:
                 # User changed their vote (e.g., from up to down) - update
                 updated_vote_record = await db.fetchrow(
@@ -772,6 +1286,8 @@ async def cast_vote(db: asyncpg.Connection, redis: redis_async.Redis, vote_data:
                     new_vote_type, existing_vote_id
                 )
                 created_vote_record = updated_vote_record
+                if new_vote_type == 1: upvotes_delta, downvotes_delta = 1, -1
+                else: upvotes_delta, downvotes_delta = -1, 1
         else:
             # New vote - insert
             insert_query = """
@@ -781,50 +1297,61 @@ async def cast_vote(db: asyncpg.Connection, redis: redis_async.Redis, vote_data:
             created_vote_record = await db.fetchrow(
                 insert_query, user_id, target_post_id, target_comment_id, new_vote_type
             )
+            if new_vote_type == 1: upvotes_delta = 1
+            else: downvotes_delta = 1
+
+        ranked_post = None
+        if target_post_id and (upvotes_delta or downvotes_delta):
+            ranked_post = await db.fetchrow(
+                "UPDATE posts SET upvotes = upvotes + $1, downvotes = downvotes + $2 WHERE id = $3 RETURNING score, uploaded_at",
+                upvotes_delta, downvotes_delta, target_post_id
+            )
 
-        # Invalidate caches
-        if target_post_id:
-            await redis.delete(f"{POST_CACHE_PREFIX}{target_post_id}")
-            # Also invalidate lists where this post might appear with updated vote counts
-            # This is a broad invalidation for simplicity.
-            list_cache_keys = [key async for key in redis.scan_iter(match=f"{POST_LIST_CACHE_PREFIX}*")]
-            if list_cache_keys: await redis.delete(*list_cache_keys)
-            count_cache_keys = [key async for key in redis.scan_iter(match=f"{POST_COUNT_CACHE_PREFIX}*")]
-            if count_cache_keys: await redis.delete(*count_cache_keys)
-
-        elif target_comment_id:
-            # Invalidate specific comment cache (if we implement it)
-            # await redis.delete(f"{COMMENT_CACHE_PREFIX}{target_comment_id}")
-            # Invalidate the cache for the post this comment belongs to, as its aggregated view might change
-            comment_post_id_record = await db.fetchval("SELECT post_id FROM comments WHERE id = $1", target_comment_id)
-            if comment_post_id_record:
-                await redis.delete(f"{POST_CACHE_PREFIX}{comment_post_id_record}")
-                # Also invalidate comment list for that post
-                # A more granular approach would be to update the specific comment in the list cache if possible
-                comments_list_cache_keys = [key async for key in redis.scan_iter(match=f"{COMMENTS_FOR_POST_CACHE_PREFIX}{comment_post_id_record}:*")]
-                if comments_list_cache_keys: await redis.delete(*comments_list_cache_keys)
-
-
-        if not created_vote_record: # Case where vote was deleted (unvoted)
-            return None
-
-        # Fetch user details for the vote response (only fields needed for UserPublic)
-        voter_user_record = await db.fetchrow("SELECT id, username, role FROM users WHERE id = $1", created_vote_record['user_id'])
-        voter_public_info = models.UserPublic(**voter_user_record) if voter_user_record else None
-
-        return models.Vote(
-            id=created_vote_record['id'],
-            user_id=created_vote_record['user_id'],
-            post_id=created_vote_record['post_id'],
-            comment_id=created_vote_record['comment_id'],
-            vote_type=created_vote_record['vote_type'],
-            created_at=created_vote_record['created_at'],
-            user=voter_public_info # Use UserPublic
-        )
+    # Redis work waits for the commit, so the post row lock is not held across Redis round
+    # trips and caches are not refilled with the pre-vote state
+    if ranked_post:
+        # Re-rank the post in the hot/top sorted sets with its new score
+        await rankings.record_post(redis, target_post_id, ranked_post['score'], ranked_post['uploaded_at'])
+
+    # Invalidate caches
+    if target_post_id:
+        await cache.invalidate(redis, *post_cache_keys(target_post_id))
+        # Also invalidate lists where this post might appear with updated vote counts
+        # This is a broad invalidation for simplicity.
+        await invalidate_post_lists(redis)
+
+    elif target_comment_id:
+        # Invalidate specific comment cache (if we implement it)
+        # await redis.delete(f"{COMMENT_CACHE_PREFIX}{target_comment_id}")
+        # Invalidate the cache for the post this comment belongs to, as its aggregated view might change
+        comment_post_id_record = await db.fetchval("SELECT post_id FROM comments WHERE id = $1", target_comment_id)
+        if comment_post_id_record:
+            await cache.invalidate(redis, *post_cache_keys(comment_post_id_record))
+            # Also invalidate comment list for that post
+            # A more granular approach would be to update the specific comment in the list cache if possible
+            await invalidate_comments_for_post(redis, comment_post_id_record)
+
+
+    if not created_vote_record: # Case where vote was deleted (unvoted)
+        return None
+
+    # Fetch user details for the vote response (only fields needed for UserPublic)
+    voter_public_info = await get_cached_user_public(db, redis, created_vote_record['user_id'])
+
+    return models.Vote(
+        id=created_vote_record['id'],
+        user_id=created_vote_record['user_id'],
+        post_id=created_vote_record['post_id'],
+        comment_id=created_vote_record['comment_id'],
+        vote_type=created_vote_record['vote_type'],
+        created_at=created_vote_record['created_at'],
+        user=voter_public_info # Use UserPublic
+    )
 
-async def update_user_role(db: asyncpg.Connection, user_id: int, new_role: models.UserRole) -> Optional[models.User]:
+async def update_user_role(db: asyncpg.Connection, user_id: int, new_role: models.UserRole, redis: Optional[redis_async.Redis] = None) -> Optional[models.User]:
     """
-    Update the role of a user.
+    Update the role of a user and drop them from the identity cache
+    (pass `redis` so other workers see the change before their entries expire).
     """
     async with db.transaction():
         # Fetch the current user data first to ensure it exists and for constructing the response
@@ -847,45 +1374,156 @@ async def update_user_role(db: asyncpg.Connection, user_id: int, new_role: model
         
         # Construct the User model for the response.
         # is_superuser can be derived or kept as its current value if not directly managed by role alone.
+    await invalidate_user_cache(redis, user_id, updated_record['username'])
     # For simplicity, we'll rely on the User model's default or existing logic for is_superuser.
     return models.User(**updated_record)
 
-async def get_all_tags_with_counts(db: asyncpg.Connection, redis: redis_async.Redis) -> List[models.TagWithCount]:
+async def reconcile_post_counters(db: asyncpg.Connection) -> int:
     """
-    Retrieves all tags along with the count of posts associated with each tag.
-    Results are cached.
+    Rebuild the denormalized comment_count/upvotes/downvotes columns on posts
+    from the comments and votes tables. Only rows whose counters drifted are written.
+    Returns the number of posts that were corrected.
     """
-    cache_key = "all_tags_with_counts"
-    cached_data_json = await redis.get(cache_key)
-    if cached_data_json:
-        try:
-            tags_dict_list = json.loads(cached_data_json)
-            return [models.TagWithCount(**tag_dict) for tag_dict in tags_dict_list]
-        except (json.JSONDecodeError, TypeError) as e:
-            print(f"Error decoding/parsing cached all_tags_with_counts. Error: {e}. Fetching from DB.")
+    query = """
+        WITH actual AS (
+            SELECT
+                p.id,
+                COALESCE(c.comment_count, 0) AS comment_count,
+                COALESCE(v.upvotes, 0) AS upvotes,
+                COALESCE(v.downvotes, 0) AS downvotes
+            FROM posts p
+            LEFT JOIN (
+                SELECT post_id, COUNT(*) AS comment_count FROM comments GROUP BY post_id
+            ) c ON c.post_id = p.id
+            LEFT JOIN (
+                SELECT post_id,
+                       COUNT(*) FILTER (WHERE vote_type = 1) AS upvotes,
+                       COUNT(*) FILTER (WHERE vote_type = -1) AS downvotes
+                FROM votes WHERE post_id IS NOT NULL GROUP BY post_id
+            ) v ON v.post_id = p.id
+        )
+        UPDATE posts p SET
+            comment_count = a.comment_count,
+            upvotes = a.upvotes,
+            downvotes = a.downvotes
+        FROM actual a
+        WHERE p.id = a.id
+          AND (p.comment_count, p.upvotes, p.downvotes) IS DISTINCT FROM (a.comment_count, a.upvotes, a.downvotes)
+    """
+    result = await db.execute(query) # e.g. "UPDATE 3"
+    return int(result.split()[-1])
 
+async def rebuild_post_tag_arrays(db: asyncpg.Connection) -> int:
+    """
+    Rebuild posts.tag_ids / posts.tag_names from post_tags for every post whose arrays drifted.
+    Returns the number of posts that were corrected.
+    """
     query = """
-        SELECT t.id, t.name, COUNT(pt.post_id) as post_count
-        FROM tags t
-        LEFT JOIN post_tags pt ON t.id = pt.tag_id
-        GROUP BY t.id, t.name
-        ORDER BY post_count DESC, t.name ASC;
+        WITH actual AS (
+            SELECT
+                p.id,
+                COALESCE(agg.ids, '{}'::int[]) AS tag_ids,
+                COALESCE(agg.names, '{}'::text[]) AS tag_names
+            FROM posts p
+            LEFT JOIN (
+                SELECT pt.post_id, array_agg(t.id ORDER BY t.name) AS ids, array_agg(t.name::text ORDER BY t.name) AS names
+                FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+                GROUP BY pt.post_id
+            ) agg ON agg.post_id = p.id
+        )
+        UPDATE posts p SET tag_ids = a.tag_ids, tag_names = a.tag_names
+        FROM actual a
+        WHERE p.id = a.id
+          AND (p.tag_ids, p.tag_names) IS DISTINCT FROM (a.tag_ids, a.tag_names)
     """
-    tag_records = await db.fetch(query)
-    
-    tags_with_counts = []
-    if tag_records:
-        tags_with_counts = [
-            models.TagWithCount(id=record['id'], name=record['name'], post_count=record['post_count'])
-            for record in tag_records
-        ]
-        try:
-            cacheable_data = json_dumps([tag.model_dump() for tag in tags_with_counts])
-            await redis.set(cache_key, cacheable_data, ex=CACHE_EXPIRY_SECONDS * 2) # Longer expiry for general tag list
-        except Exception as e:
-            print(f"Error caching all_tags_with_counts: {e}")
-            
-    return tags_with_counts
+    result = await db.execute(query)
+    return int(result.split()[-1])
+
+async def reconcile_tag_counts(db: asyncpg.Connection) -> int:
+    """
+    Recompute tags.post_count from post_tags for every tag whose count drifted.
+    Returns the number of tags that were corrected.
+    """
+    query = """
+        WITH actual AS (
+            SELECT t.id, COUNT(pt.post_id) AS post_count
+            FROM tags t
+            LEFT JOIN post_tags pt ON pt.tag_id = t.id
+            GROUP BY t.id
+        )
+        UPDATE tags t SET post_count = a.post_count
+        FROM actual a
+        WHERE t.id = a.id AND t.post_count <> a.post_count
+    """
+    result = await db.execute(query)
+    return int(result.split()[-1])
+
+async def get_posts_missing_thumbnails(db: asyncpg.Connection, sizes: List[int], after_id: int = 0, limit: int = 100) -> List[asyncpg.Record]:
+    """Posts (id, filename, filepath) whose thumbnail_sizes don't cover every size in `sizes`, in id order."""
+    return await db.fetch(
+        """
+        SELECT id, filename, filepath FROM posts
+        WHERE id > $1 AND NOT (thumbnail_sizes @> $2::int[])
+        ORDER BY id LIMIT $3
+        """,
+        after_id, sizes, limit
+    )
+
+async def set_post_thumbnail_sizes(db: asyncpg.Connection, redis: redis_async.Redis, post_id: int, sizes: List[int]) -> None:
+    await db.execute("UPDATE posts SET thumbnail_sizes = $1 WHERE id = $2", sizes, post_id)
+    await cache.invalidate(redis, *post_cache_keys(post_id))
+
+# Orderings for the tag listing; both are keyset-paginated
+TAG_SORTS = ("count", "name")
+
+def parse_tag_cursor(cursor: str, sort: str) -> Dict[str, Any]:
+    """
+    Decode a tag listing cursor into the {"count", "name"} position after which to continue.
+    Raises ValueError if the cursor is malformed or was issued for a different sort.
+    """
+    payload = decode_cursor(cursor)
+    if payload.get("s") != sort:
+        raise ValueError("Cursor does not match the requested sort.")
+    if not isinstance(payload.get("n"), str) or (sort == "count" and not isinstance(payload.get("c"), int)):
+        raise ValueError("Malformed cursor: bad position.")
+    return {"count": payload.get("c"), "name": payload["n"]}
+
+async def get_tags_with_counts(
+    db: asyncpg.Connection, limit: int = 100, sort: str = "count", cursor: Optional[Dict[str, Any]] = None
+) -> Tuple[List[models.TagWithCount], Optional[str]]:
+    """
+    One page of tags with their post counts, and the cursor for the next page (None on the last).
+    Counts come from the maintained tags.post_count, so a page is an index range scan
+    (idx_tags_post_count or the unique name index) and is always current; nothing is cached.
+    sort="count" orders by count (most used first) then name; sort="name" alphabetically.
+    """
+    query_params: List[Any] = []
+    condition = ""
+    if sort == "count":
+        if cursor:
+            condition = "WHERE post_count < $1 OR (post_count = $1 AND name > $2)"
+            query_params.extend([cursor["count"], cursor["name"]])
+        order_clause = "ORDER BY post_count DESC, name ASC"
+    else:
+        if cursor:
+            condition = "WHERE name > $1"
+            query_params.append(cursor["name"])
+        order_clause = "ORDER BY name ASC"
+    query_params.append(limit + 1) # One extra row tells whether another page follows
+    tag_records = await db.fetch(
+        f"SELECT id, name, post_count FROM tags {condition} {order_clause} LIMIT ${len(query_params)}",
+        *query_params
+    )
+
+    tags_with_counts = [
+        models.TagWithCount(id=record['id'], name=record['name'], post_count=record['post_count'])
+        for record in tag_records[:limit]
+    ]
+    next_cursor = None
+    if len(tag_records) > limit:
+        last_tag = tags_with_counts[-1]
+        next_cursor = encode_cursor({"s": sort, "c": last_tag.post_count, "n": last_tag.name})
+    return tags_with_counts, next_cursor
 
 async def update_tags_for_posts(
     db: asyncpg.Connection,
@@ -910,88 +1548,50 @@ async def update_tags_for_posts(
     if not valid_post_ids:
         return {"message": "No valid post IDs provided.", "updated_posts_count": 0, "affected_tags_count": 0}
     
-    # Prepare tag objects (get or create them)
-    tag_objects_to_modify: List[models.Tag] = []
-    if tag_names_to_modify: # Only process if there are tags to modify
-        for tag_name in tag_names_to_modify:
-            tag_name_cleaned = tag_name.strip().lower()
-            if not tag_name_cleaned:
-                continue
-            try:
-                tag_obj = await get_or_create_tag(db, tag_name_cleaned)
-                tag_objects_to_modify.append(tag_obj)
-            except ValueError: # Handles empty tag name from get_or_create_tag
-                print(f"Skipping empty or invalid tag name: '{tag_name}'")
-            except Exception as e:
-                print(f"Error processing tag '{tag_name}': {e}")
-                # Decide if this should be a hard fail or just skip the tag
-    
-    tag_ids_to_modify = [tag.id for tag in tag_objects_to_modify]
-
     updated_posts_count = 0
     
-    # Use a transaction for atomicity
+    # Use a transaction for atomicity. The tag work is a fixed number of statements
+    # however many posts and tags are involved.
     async with db.transaction():
+        # Tags being removed are only looked up; there is no point creating them
+        tag_objects_to_modify = await resolve_tags(
+            db, tag_names_to_modify or [], create_missing=(action != models.BatchTagAction.REMOVE)
+        )
+        tag_ids_to_modify = [tag.id for tag in tag_objects_to_modify]
+
         # Verify existence of posts first to avoid issues later
         # This also helps in confirming which posts were actually targeted
-        placeholders = ', '.join(f'${i+1}' for i in range(len(valid_post_ids)))
-        existing_posts_records = await db.fetch(f"SELECT id FROM posts WHERE id IN ({placeholders})", *valid_post_ids)
+        existing_posts_records = await db.fetch("SELECT id FROM posts WHERE id = ANY($1::int[])", valid_post_ids)
         actual_post_ids_to_update = [record['id'] for record in existing_posts_records]
 
         if not actual_post_ids_to_update:
             return {"message": "None of the provided post IDs exist.", "updated_posts_count": 0, "affected_tags_count": 0}
 
         updated_posts_count = len(actual_post_ids_to_update)
-        post_id_placeholders = ', '.join(f'${i+1}' for i in range(len(actual_post_ids_to_update)))
 
         if action == models.BatchTagAction.SET:
-            # Delete all existing tags for these posts
-            await db.execute(f"DELETE FROM post_tags WHERE post_id IN ({post_id_placeholders})", *actual_post_ids_to_update)
-            # Then add the new tags (if any)
-            if tag_ids_to_modify:
-                # Prepare for bulk insert
-                insert_values = []
-                for post_id in actual_post_ids_to_update:
-                    for tag_id in tag_ids_to_modify:
-                        insert_values.append((post_id, tag_id))
-                if insert_values:
-                    await db.executemany(
-                        "INSERT INTO post_tags (post_id, tag_id) VALUES ($1, $2) ON CONFLICT DO NOTHING",
-                        insert_values
-                    )
-        
-        elif action == models.BatchTagAction.ADD:
+            # Old and new tags in one ordered lock, then delete all existing tags for these posts
+            await _lock_tag_rows(db, tag_ids_to_modify, actual_post_ids_to_update)
+            await _unlink_post_tags(db, actual_post_ids_to_update)
+
+        if action in (models.BatchTagAction.SET, models.BatchTagAction.ADD):
+            # Link every post to every tag in one statement
             if tag_ids_to_modify:
-                insert_values = []
-                for post_id in actual_post_ids_to_update:
-                    for tag_id in tag_ids_to_modify:
-                        insert_values.append((post_id, tag_id))
-                if insert_values:
-                    await db.executemany(
-                        "INSERT INTO post_tags (post_id, tag_id) VALUES ($1, $2) ON CONFLICT DO NOTHING",
-                        insert_values
-                    )
+                await _link_post_tags(db, actual_post_ids_to_update, tag_ids_to_modify)
 
         elif action == models.BatchTagAction.REMOVE:
             if tag_ids_to_modify:
-                tag_id_placeholders = ', '.join(f'${i+1+len(actual_post_ids_to_update)}' for i in range(len(tag_ids_to_modify)))
-                query_params = actual_post_ids_to_update + tag_ids_to_modify
-                await db.execute(
-                    f"DELETE FROM post_tags WHERE post_id IN ({post_id_placeholders}) AND tag_id IN ({tag_id_placeholders})",
-                    *query_params
-                )
+                await _unlink_post_tags(db, actual_post_ids_to_update, tag_ids_to_modify)
+
+        # Keep the denormalized tag arrays in step with post_tags
+        await _sync_post_tag_arrays(db, actual_post_ids_to_update)
     
     # Invalidate Redis caches for affected posts and lists
     if updated_posts_count > 0:
-        for post_id in actual_post_ids_to_update:
-            await redis.delete(f"{POST_CACHE_PREFIX}{post_id}")
+        await cache.invalidate(redis, *[key for post_id in actual_post_ids_to_update for key in post_cache_keys(post_id)])
         
         # Broad invalidation for list caches, as their content might have changed
-        list_cache_keys = [key async for key in redis.scan_iter(match=f"{POST_LIST_CACHE_PREFIX}*")]
-        if list_cache_keys: await redis.delete(*list_cache_keys)
-        
-        count_cache_keys = [key async for key in redis.scan_iter(match=f"{POST_COUNT_CACHE_PREFIX}*")]
-        if count_cache_keys: await redis.delete(*count_cache_keys)
+        await invalidate_post_lists(redis)
 
     return {
         "message": f"Successfully performed '{action.value}' operation.",
@@ -10,6 +10,8 @@ from slowapi.errors import RateLimitExceeded # Added
 from slowapi.middleware import SlowAPIMiddleware # Added
 
 from .core.config import settings
+import asyncio
+from .core import cache, imaging, phash, rankings, security, tag_index
 # We will define db connection functions in db.py and import them or use dependencies
 
 # Custom key function to get IP from X-Real-IP or fallback to remote address
@@ -28,6 +30,22 @@ app.state.limiter = limiter # Add limiter to app state
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler) # Handle rate limit exceeded
 app.add_middleware(SlowAPIMiddleware) # Add SlowAPI middleware
 
+# Starlette spools the whole multipart body before an endpoint runs, so the size check in
+# core.ingest only stops the second copy, not the network and spool-file cost of an oversized
+# upload. Single uploads that declare a Content-Length above the limit are refused here,
+# before any of the body is read. Chunked requests (no Content-Length) still rely on the
+# check in core.ingest.
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024 # Multipart boundaries/headers and the title, description and tags fields
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    if request.method == "POST" and request.url.path.rstrip("/") == f"{settings.API_V1_STR}/posts":
+        content_length = request.headers.get("content-length", "")
+        max_body_bytes = settings.MAX_FILE_SIZE_MB * 1024 * 1024 + UPLOAD_FORM_OVERHEAD_BYTES
+        if content_length.isdigit() and int(content_length) > max_body_bytes:
+            return JSONResponse(status_code=413, content={"detail": f"File too large. Max size: {settings.MAX_FILE_SIZE_MB}MB"})
+    return await call_next(request)
+
 # Database and Redis connection pools will be stored in app.state
 # app.state.pg_pool = None
 # app.state.redis_pool = None
@@ -38,6 +56,10 @@ async def startup_event():
     Application startup:
     - Create PostgreSQL connection pool.
     - Create Redis connection pool.
+    - Start the cache invalidation listener.
+    - Load the perceptual hash index.
+    - Load the tag suggestion index and start its refresh task.
+    - Start the hot/top rankings rebuild task.
     - Create uploads directory if it doesn't exist.
     """
     try:
@@ -66,6 +88,32 @@ async def startup_event():
         # Optionally, re-raise or handle critical failure
         raise
 
+    # Keep this worker's in-process cache in step with invalidations published by every worker
+    app.state.cache_listener_task = asyncio.create_task(cache.invalidation_listener(app.state.redis_pool))
+    print("Cache invalidation listener started.")
+
+    # Near-duplicate lookups are served from memory; later uploads are added incrementally
+    try:
+        async with app.state.pg_pool.acquire() as conn:
+            indexed = await phash.load_index(conn)
+        print(f"Perceptual hash index loaded: {indexed} post(s).")
+    except Exception as e:
+        # Not fatal: the index fills in as duplicate lookups sync new posts
+        print(f"Error loading perceptual hash index: {e}")
+
+    # Tag autocomplete is answered from memory and reloaded in the background
+    try:
+        async with app.state.pg_pool.acquire() as conn:
+            indexed = await tag_index.load_index(conn)
+        print(f"Tag suggestion index loaded: {indexed} tag(s).")
+    except Exception as e:
+        # Not fatal: the first suggestion request (or the refresh task) loads it
+        print(f"Error loading tag suggestion index: {e}")
+    app.state.tag_index_task = asyncio.create_task(tag_index.refresh_loop(app.state.pg_pool))
+
+    # sort_by=hot/top rankings live in Redis; one worker per interval rebuilds them (first one right away)
+    app.state.rankings_task = asyncio.create_task(rankings.refresh_loop(app.state.pg_pool, app.state.redis_pool))
+
     # Create uploads directory if it doesn't exist
     # UPLOADS_DIR is relative to project root, ensure correct path resolution
     # For StaticFiles, the path should be relative to where main.py is if not absolute
@@ -103,9 +151,34 @@ async def startup_event():
 async def shutdown_event():
     """
     Application shutdown:
+    - Stop the cache invalidation listener, the tag index refresh and the rankings rebuild.
     - Close PostgreSQL connection pool.
     - Close Redis connection pool.
+    - Shut down the media worker pools.
+    - Shut down the password hashing executor.
     """
+    if getattr(app.state, 'cache_listener_task', None):
+        app.state.cache_listener_task.cancel()
+        try:
+            await app.state.cache_listener_task
+        except asyncio.CancelledError:
+            pass
+        print("Cache invalidation listener stopped.")
+
+    if getattr(app.state, 'tag_index_task', None):
+        app.state.tag_index_task.cancel()
+        try:
+            await app.state.tag_index_task
+        except asyncio.CancelledError:
+            pass
+
+    if getattr(app.state, 'rankings_task', None):
+        app.state.rankings_task.cancel()
+        try:
+            await app.state.rankings_task
+        except asyncio.CancelledError:
+            pass
+
     if hasattr(app.state, 'pg_pool') and app.state.pg_pool:
         await app.state.pg_pool.close()
         print("PostgreSQL connection pool closed.")
@@ -116,8 +189,14 @@ async def shutdown_event():
         # await app.state.redis_pool.disconnect() # if it were a client
         print("Redis connection pool resources released (if applicable).")
 
+    imaging.shutdown_executors()
+    print("Media worker pools shut down.")
+
+    security.shutdown_password_executor()
+    print("Password hashing executor shut down.")
+
 # Further imports and API routers will be added here.
-from .routers import posts, auth, admin, utils, comments, votes, tags # Import new routers
+from .routers import posts, auth, admin, utils, comments, votes, tags, users # Import new routers
 
 app.include_router(posts.router, prefix=settings.API_V1_STR, tags=["Posts"])
 app.include_router(auth.router, prefix=settings.API_V1_STR + "/auth", tags=["Authentication"])
@@ -126,3 +205,4 @@ app.include_router(utils.router, prefix=settings.API_V1_STR, tags=["Utils"])
 app.include_router(comments.router, prefix=settings.API_V1_STR, tags=["Comments"]) # Added comments router
 app.include_router(votes.router, prefix=settings.API_V1_STR, tags=["Votes"]) # Added votes router
 app.include_router(tags.router, prefix=settings.API_V1_STR, tags=["Tags"]) # Include tags router
+app.include_router(users.router, prefix=settings.API_V1_STR, tags=["Users"])
@@ -86,12 +86,15 @@ class PostBase(BaseModel):
     filesize: Optional[int] = None
     image_width: Optional[int] = None # Added
     image_height: Optional[int] = None # Added
+    thumbnail_sizes: List[int] = [] # Sizes of the generated thumbnails (see core.imaging)
+    file_hash: Optional[str] = None # Hex SHA-256 of the file contents
     title: Optional[str] = Field(None, max_length=255)
     description: Optional[str] = Field(None)
     # uploader_id will be set by the backend based on authenticated user
 
 class PostCreate(PostBase):
     tags: Optional[List[constr(strip_whitespace=True, to_lower=True, min_length=1, max_length=50)]] = Field(default_factory=list, max_items=20) # Increased max_items for tags
+    phash: Optional[int] = None # Unsigned 64-bit perceptual hash; internal, not returned to clients
 
 class Post(PostBase):
     id: int
@@ -110,6 +113,9 @@ class Post(PostBase):
 
     model_config = {"from_attributes": True}
 
+class DuplicatePost(Post):
+    distance: int # Hamming distance between perceptual hashes (0 = visually identical)
+
 class PostInDB(Post):
     pass # May include fields not always sent to client
 
@@ -139,9 +145,12 @@ class PostForFrontend(BaseModel):
 
 class PaginatedPosts(BaseModel):
     data: List[PostForFrontend]
-    total_items: int
-    total_pages: int
+    total_items: Optional[int] = None # None when the client asked for include_total=false
+    total_pages: Optional[int] = None
+    total_is_estimate: bool = False # True when total_items comes from statistics (include_total=estimated)
     current_page: int
+    has_next: bool = False # Whether another page follows this one, known without counting
+    next_cursor: Optional[str] = None # Opaque keyset cursor for the next page (None on the last page or for random sort)
 
 # Comment models
 class CommentBase(BaseModel):
@@ -157,7 +166,7 @@ class CommentUpdate(BaseModel):
 class Comment(CommentBase):
     id: int
     post_id: int
-    user_id: int
+    user_id: Optional[int] # NULL once the author's account is deleted
     user: Optional[UserPublic] = None # Embed basic user info (publicly safe)
     parent_comment_id: Optional[int] = None
     created_at: datetime
@@ -165,6 +174,8 @@ class Comment(CommentBase):
     replies: List['Comment'] = [] # For nested comments
     upvotes: int = 0
     downvotes: int = 0
+    reply_count: int = 0 # Direct replies in the database; `replies` may hold fewer (see [comments] settings)
+    replies_cursor: Optional[str] = None # Continues `replies` via GET .../comments/{id}/replies when more exist
     # depth: Optional[int] = 0 # Could be useful for frontend rendering
 
     model_config = {"from_attributes": True}
@@ -7,6 +7,7 @@ from . import admin
 from . import utils
 from . import comments # Importing placeholder comments router
 from . import votes # Importing placeholder votes router
+from . import users
 
 
 # You could also define an __all__ variable if you want to control
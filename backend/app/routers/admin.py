@@ -2,13 +2,16 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from typing import Annotated, List, Optional
 import asyncpg
 import redis.asyncio as redis_async
+import asyncio
 import os # For file deletion
 
 from .. import models, crud
 from ..core.config import settings
+from ..core import cache, imaging, ingest, phash, rankings
 from ..db import get_db_connection, get_redis_connection
 # from .auth import get_current_active_superuser # This is removed
 from .auth import require_admin_owner # Import new role-based dependency
+from .posts import get_post_thumbnail_url, discard_ingested_file, find_near_duplicate, public_base_url
 
 router = APIRouter()
 
@@ -59,31 +62,22 @@ async def delete_image_admin( # Renamed to delete_post_admin
     file_to_delete_path = os.path.join(project_root_from_router, post_to_delete.filepath)
 
     try:
-        # 1. Delete from database (CASCADE should handle post_tags, comments, votes)
-        # A proper crud.delete_post function should be created.
-        async with db.transaction():
-            # CASCADE constraints on foreign keys in post_tags, comments, votes referencing posts.id
-            # should handle deletion of related records.
-            result = await db.execute("DELETE FROM posts WHERE id = $1", post_id)
-            if result == "DELETE 0": # Check if any row was actually deleted
-                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found in DB for deletion.")
-
-        # 2. Delete file from disk
+        # 1. Delete from database (tag links and tag counts first; CASCADE handles comments, votes)
+        if not await crud.delete_post(db, post_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found in DB for deletion.")
+
+        # 2. Delete file (and its thumbnails) from disk
         if os.path.exists(file_to_delete_path):
             os.remove(file_to_delete_path)
         else:
             print(f"Warning: File not found for deletion: {file_to_delete_path}")
+        imaging.remove_thumbnails(Path(file_to_delete_path), post_to_delete.thumbnail_sizes)
+        await phash.publish_removed(redis, post_id)
+        await rankings.forget_post(redis, post_id)
 
         # 3. Invalidate cache for the deleted post and any lists
-        await redis.delete(f"{crud.POST_CACHE_PREFIX}{post_id}") # Use POST_CACHE_PREFIX
-        
-        list_cache_keys = [key async for key in redis.scan_iter(match=f"{crud.POST_LIST_CACHE_PREFIX}*")]
-        if list_cache_keys:
-            await redis.delete(*list_cache_keys)
-        
-        count_cache_keys = [key async for key in redis.scan_iter(match=f"{crud.POST_COUNT_CACHE_PREFIX}*")]
-        if count_cache_keys:
-            await redis.delete(*count_cache_keys)
+        await cache.invalidate(redis, *crud.post_cache_keys(post_id)) # Redis and every worker's L1
+        await crud.invalidate_post_lists(redis) # Single INCR; stale list/count generations expire on their own
             
     except Exception as e:
         print(f"Error deleting post {post_id}: {e}")
@@ -109,7 +103,7 @@ async def list_all_posts_admin(
 
     for post_model in posts_list: # post_model is models.Post
         if post_model.filename:
-            base_url_str = str(request.base_url).rstrip('/')
+            base_url_str = public_base_url(request)
             api_v1_segment = settings.API_V1_STR.strip('/')
             static_segment = "static/uploads"
             filename_segment = post_model.filename.strip('/')
@@ -117,7 +111,7 @@ async def list_all_posts_admin(
             full_path = "/".join(path_parts)
             post_model.image_url = f"{base_url_str}/{full_path}"
             if hasattr(post_model, 'thumbnail_url'): # Ensure thumbnail_url is also populated
-                post_model.thumbnail_url = post_model.image_url # Placeholder
+                post_model.thumbnail_url = get_post_thumbnail_url(request, post_model)
 
     total_pages_val = (total_posts + limit - 1) // limit if limit > 0 else 0
     current_page_val = (skip // limit) + 1 if limit > 0 else 1
@@ -155,20 +149,12 @@ async def list_all_posts_admin(
         current_page=current_page_val
     )
 
-# For python-magic, ensure it's available
-try:
-    import magic
-except ImportError:
-    magic = None # Fallback if not installed, though it's in requirements.txt
-
-import uuid
-import shutil
 from pathlib import Path
 from fastapi import File, UploadFile, Form # For File and UploadFile
 
 # Helper to construct image URLs, similar to posts.py
 def get_admin_post_image_url(request: Request, filename: str) -> str:
-    base_url_str = str(request.base_url).rstrip('/')
+    base_url_str = public_base_url(request)
     api_v1_segment = settings.API_V1_STR.strip('/')
     static_segment = "static/uploads"
     filename_segment = filename.strip('/')
@@ -190,91 +176,127 @@ async def batch_upload_posts_admin(
     Batch upload multiple images. Admins/Owners only.
     Applies a common set of tags to all uploaded images.
     Titles and descriptions can be auto-generated or left blank.
+    Files are ingested and processed concurrently, then all posts are created in one transaction.
     """
     if not files:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No files provided for batch upload.")
 
-    if not magic:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="File type verification (magic) is not available.")
-
     project_root = Path(__file__).resolve().parent.parent.parent.parent # z:/projects_git/spectra
     uploads_abs_path = project_root / settings.UPLOADS_DIR # z:/projects_git/spectra/backend/uploads
     if not uploads_abs_path.exists():
         uploads_abs_path.mkdir(parents=True, exist_ok=True)
 
-    results = {"successful": [], "failed": []}
+    # "duplicates" lists files whose exact bytes already belong to a post; they are not failures
+    results = {"successful": [], "failed": [], "duplicates": []}
     common_tags_list = tags_str.split(',') if tags_str and tags_str.strip() else []
 
-    for file in files:
+    # 1. Ingest every file concurrently: sniff, size limit, SHA-256, temp write + atomic rename.
+    # media.batch_upload_concurrency bounds how many bodies are read and written at once.
+    semaphore = asyncio.Semaphore(settings.media.batch_upload_concurrency)
+
+    async def ingest_one(file: UploadFile) -> Optional[ingest.IngestedFile]:
         original_filename = file.filename or "unknown_file"
-        file_location_on_disk = None # Initialize
+        async with semaphore:
+            try:
+                return await ingest.ingest_upload(file, uploads_abs_path)
+            except HTTPException as e: # Rejections from validation steps
+                results["failed"].append({"filename": original_filename, "error": e.detail})
+            except Exception as e:
+                results["failed"].append({"filename": original_filename, "error": f"An unexpected error occurred: {str(e)}"})
+            finally:
+                await file.close()
+        return None
+
+    ingested_files = await asyncio.gather(*[ingest_one(file) for file in files])
+
+    # 2. Skip bytes that already belong to a post, with one lookup for the whole batch.
+    # A file repeated within the batch is stored once; its copies are reported as duplicates
+    # of whichever post the first copy becomes (the shared file is never discarded).
+    existing_post_ids = await crud.get_post_ids_by_hashes(db, [i.sha256 for i in ingested_files if i])
+    pending = [] # (original filename, IngestedFile)
+    repeated_in_batch = [] # (original filename, sha256)
+    seen_hashes = set()
+    for file, ingested in zip(files, ingested_files):
+        if ingested is None:
+            continue
+        original_filename = file.filename or "unknown_file"
+        if ingested.sha256 in existing_post_ids: # The stored file is that post's; keep it
+            results["duplicates"].append({"filename": original_filename, "post_id": existing_post_ids[ingested.sha256]})
+        elif ingested.sha256 in seen_hashes:
+            repeated_in_batch.append((original_filename, ingested.sha256))
+        else:
+            seen_hashes.add(ingested.sha256)
+            pending.append((original_filename, ingested))
+
+    # 3. Dimensions, perceptual hashes and thumbnails; the process pool bounds the parallelism
+    processed_images = await asyncio.gather(*[imaging.process_upload(ingested.path) for _, ingested in pending])
+
+    to_create = [] # (original filename, IngestedFile, ProcessedImage, PostCreate)
+    await phash.sync_index(db) # Once for the whole batch
+    for (original_filename, ingested), processed_image in zip(pending, processed_images):
+        near_duplicate_id = await find_near_duplicate(db, processed_image.phash, sync=False)
+        if near_duplicate_id is not None:
+            await discard_ingested_file(db, ingested, processed_image.thumbnail_sizes)
+            results["duplicates"].append({"filename": original_filename, "post_id": near_duplicate_id})
+            continue
         try:
-            if file.content_type not in settings.ALLOWED_MIME_TYPES:
-                results["failed"].append({"filename": original_filename, "error": f"Invalid MIME type (header): {file.content_type}. Allowed: {', '.join(settings.ALLOWED_MIME_TYPES)}"})
-                continue
-
-            file_content_chunk = await file.read(2048) # Read a chunk for magic
-            await file.seek(0) # Reset file pointer
-            true_mime_type = magic.from_buffer(file_content_chunk, mime=True)
-
-            if true_mime_type not in settings.ALLOWED_MIME_TYPES:
-                results["failed"].append({"filename": original_filename, "error": f"Invalid MIME type (content: {true_mime_type}). Allowed: {', '.join(settings.ALLOWED_MIME_TYPES)}"})
-                continue
-            
-            file.file.seek(0, os.SEEK_END)
-            file_size = file.file.tell()
-            await file.seek(0) # Reset file pointer again for saving
-
-            if file_size > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
-                results["failed"].append({"filename": original_filename, "error": f"File too large. Max size: {settings.MAX_FILE_SIZE_MB}MB"})
-                continue
-
-            file_extension = Path(original_filename).suffix
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            file_location_on_disk = uploads_abs_path / unique_filename
-
-            with open(file_location_on_disk, "wb+") as file_object:
-                shutil.copyfileobj(file.file, file_object)
-
             # Simple title/description for batch upload
-            post_title = Path(original_filename).stem 
-            post_description = f"Uploaded by admin: {original_filename}"
-
             post_data_create = models.PostCreate(
-                filename=unique_filename,
-                mimetype=true_mime_type,
-                filesize=file_size,
-                title=post_title,
-                description=post_description,
+                filename=ingested.filename,
+                mimetype=ingested.mimetype,
+                filesize=ingested.filesize,
+                image_width=processed_image.image_width,
+                image_height=processed_image.image_height,
+                thumbnail_sizes=processed_image.thumbnail_sizes,
+                file_hash=ingested.sha256,
+                phash=processed_image.phash,
+                title=Path(original_filename).stem,
+                description=f"Uploaded by admin: {original_filename}",
                 tags=common_tags_list
             )
-            db_filepath = f"{settings.UPLOADS_DIR}/{unique_filename}" # Relative path for DB
-
-            created_post_record = await crud.create_post_with_tags(
-                db=db, redis=redis, post_data=post_data_create,
-                filepath_on_disk=str(db_filepath), # Ensure it's a string
-                uploader_id=current_user.id
+        except Exception as e:
+            await discard_ingested_file(db, ingested, processed_image.thumbnail_sizes)
+            results["failed"].append({"filename": original_filename, "error": f"Invalid post data: {str(e)}"})
+            continue
+        to_create.append((original_filename, ingested, processed_image, post_data_create))
+
+    # 4. One transaction for every post and post_tags row; caches are invalidated once
+    created_by_hash = {}
+    if to_create:
+        try:
+            created_posts = await crud.create_posts_bulk(
+                db=db, redis=redis,
+                posts_data=[entry[3] for entry in to_create],
+                filepaths_on_disk=[f"{settings.UPLOADS_DIR}/{entry[1].filename}" for entry in to_create], # Relative paths for DB
+                uploader_id=current_user.id,
+                tag_names=to_create[0][3].tags or [] # Validated by PostCreate
             )
-
-            if not created_post_record:
-                if file_location_on_disk.exists(): os.remove(file_location_on_disk)
-                results["failed"].append({"filename": original_filename, "error": "Could not create post record in database."})
-                continue
-            
-            # Construct the response model for this successful upload
-            created_post_record.image_url = get_admin_post_image_url(request, created_post_record.filename)
-            created_post_record.thumbnail_url = created_post_record.image_url # Placeholder
-            results["successful"].append(models.Post.model_validate(created_post_record).model_dump())
-
-        except HTTPException as e: # Catch HTTPExceptions from validation steps
-            if file_location_on_disk and file_location_on_disk.exists(): os.remove(file_location_on_disk)
-            results["failed"].append({"filename": original_filename, "error": e.detail})
+            created_by_hash = {post.file_hash: post for post in created_posts}
         except Exception as e:
-            if file_location_on_disk and file_location_on_disk.exists(): os.remove(file_location_on_disk)
-            results["failed"].append({"filename": original_filename, "error": f"An unexpected error occurred: {str(e)}"})
-        finally:
-            if hasattr(file, 'file') and file.file: # Ensure file object exists and is open
-                file.file.close()
+            print(f"Error during batch post creation: {e}")
+            for original_filename, ingested, processed_image, _ in to_create:
+                await discard_ingested_file(db, ingested, processed_image.thumbnail_sizes)
+                results["failed"].append({"filename": original_filename, "error": f"Could not create post record in database: {str(e)}"})
+            to_create = []
+
+    for original_filename, ingested, processed_image, _ in to_create:
+        created_post_record = created_by_hash.get(ingested.sha256)
+        if created_post_record is None:
+            # Same bytes committed concurrently by another upload; the stored file belongs to that post
+            results["duplicates"].append({"filename": original_filename, "post_id": await crud.get_post_id_by_hash(db, ingested.sha256)})
+            continue
+        if processed_image.phash is not None:
+            await phash.publish_added(redis, created_post_record.id, processed_image.phash)
+
+        # Construct the response model for this successful upload
+        created_post_record.image_url = get_admin_post_image_url(request, created_post_record.filename)
+        created_post_record.thumbnail_url = get_post_thumbnail_url(request, created_post_record)
+        results["successful"].append(models.Post.model_validate(created_post_record).model_dump())
+
+    for original_filename, file_hash in repeated_in_batch:
+        post_for_hash = created_by_hash.get(file_hash)
+        post_id = post_for_hash.id if post_for_hash else await crud.get_post_id_by_hash(db, file_hash)
+        results["duplicates"].append({"filename": original_filename, "post_id": post_id})
     
     if not results["successful"] and results["failed"]:
          # If all uploads failed, return a 400 or 500 level error
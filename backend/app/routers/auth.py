@@ -2,11 +2,12 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from typing import Annotated, List
 import asyncpg
+import redis.asyncio as redis_async
 from datetime import timedelta
 
 from .. import models, crud
 from ..core import security
-from ..db import get_db_connection
+from ..db import get_db_connection, get_redis_connection
 from ..core.config import settings
 from ..models import UserRole # Import UserRole
 
@@ -22,7 +23,8 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/token
 
 async def get_current_user_from_token(
     token: Annotated[str, Depends(oauth2_scheme)],
-    db: asyncpg.Connection = Depends(get_db_connection) # Use correct DB dependency
+    db: asyncpg.Connection = Depends(get_db_connection), # Use correct DB dependency
+    redis: redis_async.Redis = Depends(get_redis_connection)
 ) -> models.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -36,19 +38,23 @@ async def get_current_user_from_token(
     if username is None:
         raise credentials_exception
     
-    user_in_db = await crud.get_user_by_username(db, username=username) # Returns UserInDB
-    if user_in_db is None:
+    # Served from the identity cache; the users table is only read on a miss.
+    # Tokens carry the user id ("uid"), which keys the cache directly; older tokens only have "sub".
+    # The role claim is informational: authorization always uses the cached user's current role,
+    # so role changes apply within the cache TTL instead of at token expiry.
+    user_id = payload.get("uid")
+    if isinstance(user_id, int):
+        user = await crud.get_cached_user(db, redis, user_id)
+        if user is not None and user.username != username:
+            user = None # Username changed since the token was issued
+    else:
+        user = await crud.get_cached_user_by_username(db, redis, username)
+    if user is None:
         raise credentials_exception
-    
-    # Construct models.User from models.UserInDB
-    # UserInDB has 'role' and 'hashed_password'. User model has 'role' (from UserBase)
-    # and 'is_superuser' (defaults to False, can be derived from role if needed for response).
-    user_data = user_in_db.model_dump(exclude={"hashed_password"})
-    
-    # Explicitly set is_superuser based on role for the response model if desired
-    # user_data['is_superuser'] = user_in_db.role in [UserRole.admin, UserRole.owner]
 
-    return models.User(**user_data)
+    # is_superuser could be derived from role here if desired:
+    # user.role in [UserRole.admin, UserRole.owner]
+    return user
 
 async def get_current_active_user(
     current_user: Annotated[models.User, Depends(get_current_user_from_token)]
@@ -80,7 +86,8 @@ async def login_for_access_token(
     db: asyncpg.Connection = Depends(get_db_connection)
 ):
     user = await crud.get_user_by_username(db, username=form_data.username) # Returns UserInDB
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    # bcrypt runs on the password executor, not the event loop
+    if not user or not await security.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -91,7 +98,7 @@ async def login_for_access_token(
 
     access_token_expires = timedelta(minutes=settings.security.access_token_expire_minutes)
     access_token = security.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id, "role": user.role.value}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import List, Optional
 import asyncpg
 import redis.asyncio as redis_async
@@ -14,6 +14,15 @@ router = APIRouter(
     tags=["comments"],
 )
 
+def _parse_cursor(cursor: Optional[str]) -> Optional[dict]:
+    """Decode a comment page cursor; 400 if malformed."""
+    if not cursor:
+        return None
+    try:
+        return crud.parse_comment_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
 @router.post("/", response_model=models.Comment, status_code=201)
 async def create_new_comment( # Renamed for clarity
     post_id: int, # Now a path parameter due to prefix
@@ -43,30 +52,57 @@ async def create_new_comment( # Renamed for clarity
 @router.get("/", response_model=List[models.Comment]) # Path is now relative to prefix
 async def list_comments_for_post( # Renamed for clarity
     post_id: int, # Now a path parameter
-    skip: int = 0,
-    limit: int = 10,
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous response's X-Next-Cursor header."),
+    limit: int = Query(10, ge=1, le=100),
     db: asyncpg.Connection = Depends(get_db_connection),
     redis: redis_async.Redis = Depends(get_redis_connection),
 ):
     """
-    Get comments for a specific post.
+    Get a page of a post's top-level comments (oldest first), each with its replies nested.
+    The cursor for the next page is sent in the X-Next-Cursor header (absent on the last page);
+    longer threads continue through GET /{comment_id}/replies.
     """
+    cursor_position = _parse_cursor(cursor)
     try:
-        # Optional: Check if post exists first, though get_comments_for_post might return empty list if post has no comments
-        # target_post = await crud.get_post(db=db, redis=redis, post_id=post_id)
-        # if not target_post:
-        #     raise HTTPException(status_code=404, detail=f"Post with id {post_id} not found.")
-            
-        comments = await crud.get_comments_for_post(db=db, redis=redis, post_id=post_id, skip=skip, limit=limit)
+        comments, next_cursor = await crud.get_comments_for_post(db=db, redis=redis, post_id=post_id, limit=limit, cursor=cursor_position)
         # If post exists but has no comments, an empty list is the correct response.
-        # If crud.get_comments_for_post needs to differentiate "post not found" vs "post has no comments",
-        # it should handle that, or we check post existence here.
-        # For now, assume crud.get_comments_for_post returns empty list if post has no comments.
-        return comments
     except Exception as e:
         # Log the exception e
         print(f"Error fetching comments for post {post_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error fetching comments: {str(e)}")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return comments
+
+@router.get("/{comment_id}/replies", response_model=List[models.Comment])
+async def list_comment_replies(
+    post_id: int,
+    comment_id: int,
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Opaque cursor: a comment's replies_cursor, or a previous response's X-Next-Cursor header."),
+    limit: int = Query(10, ge=1, le=100),
+    db: asyncpg.Connection = Depends(get_db_connection),
+    redis: redis_async.Redis = Depends(get_redis_connection),
+):
+    """
+    "Load more replies": a page of the replies to one comment (oldest first), each with its own
+    replies nested, paged by keyset on the (parent_comment_id, created_at, id) index.
+    The cursor for the next page is sent in the X-Next-Cursor header (absent on the last page).
+    """
+    cursor_position = _parse_cursor(cursor)
+    try:
+        replies, next_cursor = await crud.get_comment_replies(
+            db=db, redis=redis, post_id=post_id, comment_id=comment_id, limit=limit, cursor=cursor_position
+        )
+    except Exception as e:
+        print(f"Error fetching replies to comment {comment_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error fetching replies: {str(e)}")
+    if not replies and not cursor and not await crud.comment_exists(db, post_id, comment_id):
+        raise HTTPException(status_code=404, detail=f"Comment {comment_id} not found on post {post_id}.")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return replies
 
 # TODO: Add routes for:
 # - Replying to a comment (e.g., POST /posts/{post_id}/comments/{comment_id}/replies/ or similar)
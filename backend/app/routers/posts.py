@@ -1,20 +1,19 @@
 import os
-import shutil
-import uuid
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import date # Import date for type hinting
-import magic # For python-magic
 import math
 
 import asyncpg
 import redis.asyncio as redis_async
 from fastapi import (APIRouter, Depends, File, Form, HTTPException, Query,
-                     UploadFile, Request)
+                     UploadFile, Request, Response)
+from fastapi import Path as PathParam # pathlib.Path is used for filesystem paths here
 from pydantic import HttpUrl
 
 from .. import crud, models
 from ..core.config import settings
+from ..core import cache, imaging, ingest, phash, rankings
 # from ..core import security # No longer needed for get_current_active_user here
 from .auth import get_current_active_user # Import from auth router
 from ..db import get_db_connection, get_redis_connection
@@ -25,8 +24,12 @@ router = APIRouter(
     tags=["posts"],
 )
 
+def public_base_url(request: Request) -> str:
+    """Origin for absolute URLs: site.public_url if configured, else the one the request was addressed to."""
+    return (settings.site.public_url or str(request.base_url)).rstrip('/')
+
 def get_post_image_url(request: Request, filename: str) -> str:
-    base_url_str = str(request.base_url).rstrip('/')
+    base_url_str = public_base_url(request)
     api_v1_segment = settings.API_V1_STR.strip('/')
     static_segment = "static/uploads" # Assuming uploads are still served from here
     filename_segment = filename.strip('/')
@@ -34,6 +37,71 @@ def get_post_image_url(request: Request, filename: str) -> str:
     full_path = "/".join(path_parts)
     return f"{base_url_str}/{full_path}"
 
+def get_post_thumbnail_url(request: Request, post: models.Post) -> str:
+    # Prefer the configured default size, then the smallest generated one; fall back to the original image
+    if not post.thumbnail_sizes:
+        return get_post_image_url(request, post.filename)
+    if settings.media.default_thumbnail_size in post.thumbnail_sizes:
+        size = settings.media.default_thumbnail_size
+    else:
+        size = min(post.thumbnail_sizes)
+    return get_post_image_url(request, imaging.thumbnail_filename(post.filename, size))
+
+async def discard_ingested_file(db: asyncpg.Connection, ingested: ingest.IngestedFile, thumbnail_sizes: List[int]) -> None:
+    """
+    Remove a rejected upload and its thumbnails, unless the bytes were already stored before
+    this request or a post now references them. Files are content-addressed: a concurrent
+    upload of the same bytes may have committed a post pointing at this very file.
+    """
+    if not ingested.is_new_file:
+        return
+    if await crud.get_post_id_by_hash(db, ingested.sha256) is not None:
+        return # Owned by a committed post
+    if ingested.path.exists(): os.remove(ingested.path)
+    imaging.remove_thumbnails(ingested.path, thumbnail_sizes)
+
+def duplicate_upload_exception(existing_post_id: int) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={"message": "This image has already been uploaded.", "post_id": existing_post_id},
+        headers={"X-Post-Id": str(existing_post_id)}
+    )
+
+async def find_near_duplicate(db: asyncpg.Connection, image_phash: Optional[int], sync: bool = True) -> Optional[int]:
+    """
+    Id of an existing post within media.duplicate_reject_distance of this hash, if rejection is
+    enabled. Pass sync=False after calling phash.sync_index() once for a whole batch.
+    """
+    max_distance = settings.media.duplicate_reject_distance
+    if max_distance is None or image_phash is None:
+        return None
+    if sync:
+        await phash.sync_index(db) # No-op unless this worker may have missed changes
+    matches = phash.phash_index.search(image_phash, max_distance)
+    if not matches:
+        return None
+    # Never reject in favour of a post that is gone (its removal message may have been missed)
+    existing_post_ids = await crud.get_existing_post_ids(db, [post_id for post_id, _ in matches])
+    for post_id, _ in matches:
+        if post_id in existing_post_ids:
+            return post_id
+        phash.phash_index.remove(post_id)
+    return None
+
+@router.head("/by-hash/{sha256}")
+async def check_post_by_hash(
+    sha256: str = PathParam(..., pattern="^[0-9a-fA-F]{64}$", description="Hex SHA-256 of the file contents"),
+    db: asyncpg.Connection = Depends(get_db_connection)
+):
+    """
+    Pre-upload check: 200 with an X-Post-Id header if a post with these exact bytes exists, 404 otherwise.
+    Lets clients hash locally and skip sending files the server already has.
+    """
+    existing_post_id = await crud.get_post_id_by_hash(db, sha256)
+    if existing_post_id is None:
+        return Response(status_code=404)
+    return Response(status_code=200, headers={"X-Post-Id": str(existing_post_id)})
+
 @router.post("/", response_model=models.Post, status_code=201) # Changed from /upload/ to /
 @limiter.limit(settings.security.upload_rate_limit)
 async def upload_post(
@@ -54,48 +122,47 @@ async def upload_post(
     if title and len(title) > 255:
         raise HTTPException(status_code=413, detail="Title too long. Maximum 255 characters.")
 
-    if file.content_type not in settings.ALLOWED_MIME_TYPES:
-        raise HTTPException(status_code=400, detail=f"Invalid image type (header). Allowed: {settings.ALLOWED_MIME_TYPES}")
-
-    try:
-        file_content_chunk = await file.read(2048)
-        await file.seek(0)
-        true_mime_type = magic.from_buffer(file_content_chunk, mime=True)
-        if true_mime_type not in settings.ALLOWED_MIME_TYPES:
-            raise HTTPException(status_code=400, detail=f"Invalid image type (content: {true_mime_type}). Allowed: {settings.ALLOWED_MIME_TYPES}")
-    except Exception as e:
-        print(f"Error during magic number check: {e}")
-        raise HTTPException(status_code=500, detail="Could not verify file content.")
-
-    file.file.seek(0, os.SEEK_END)
-    file_size = file.file.tell()
-    file.file.seek(0)
-    if file_size > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
-        raise HTTPException(status_code=413, detail=f"File too large. Max size: {settings.MAX_FILE_SIZE_MB}MB")
-
     project_root = Path(__file__).resolve().parent.parent.parent.parent
     uploads_abs_path = project_root / settings.UPLOADS_DIR
     if not uploads_abs_path.exists():
         uploads_abs_path.mkdir(parents=True, exist_ok=True)
 
-    original_filename = file.filename or "unknown_file"
-    file_extension = Path(original_filename).suffix
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_location_on_disk = uploads_abs_path / unique_filename
-
+    # Single pass over the body: type sniffing, size limit, SHA-256 and the write to disk
     try:
-        with open(file_location_on_disk, "wb+") as file_object:
-            shutil.copyfileobj(file.file, file_object)
+        ingested = await ingest.ingest_upload(file, uploads_abs_path)
+    except HTTPException:
+        raise
     except Exception as e:
-        if file_location_on_disk.exists(): os.remove(file_location_on_disk)
         raise HTTPException(status_code=500, detail=f"Could not save image file: {e}")
     finally:
-        file.file.close()
+        await file.close()
+    unique_filename = ingested.filename
+    file_location_on_disk = ingested.path
+
+    # Identical bytes are stored once and belong to a single post
+    existing_post_id = await crud.get_post_id_by_hash(db, ingested.sha256)
+    if existing_post_id is not None:
+        raise duplicate_upload_exception(existing_post_id) # The stored file is that post's; keep it
+
+    # Dimensions and thumbnails come from the process pool, before any DB transaction is opened
+    processed_image = await imaging.process_upload(file_location_on_disk)
+    thumbnail_sizes = processed_image.thumbnail_sizes
+
+    # Optionally reject re-encoded/resized copies of an existing post
+    near_duplicate_id = await find_near_duplicate(db, processed_image.phash)
+    if near_duplicate_id is not None:
+        await discard_ingested_file(db, ingested, thumbnail_sizes)
+        raise duplicate_upload_exception(near_duplicate_id)
 
     post_data_create = models.PostCreate(
         filename=unique_filename,
-        mimetype=true_mime_type,
-        filesize=file_size,
+        mimetype=ingested.mimetype,
+        filesize=ingested.filesize,
+        image_width=processed_image.image_width,
+        image_height=processed_image.image_height,
+        thumbnail_sizes=thumbnail_sizes,
+        file_hash=ingested.sha256,
+        phash=processed_image.phash,
         title=title,
         description=description,
         tags=tags_str.split(',') if tags_str else []
@@ -109,74 +176,149 @@ async def upload_post(
             filepath_on_disk=db_filepath, uploader_id=current_user.id
         )
         if not created_post_record:
-            if file_location_on_disk.exists(): os.remove(file_location_on_disk)
+            await discard_ingested_file(db, ingested, thumbnail_sizes)
             raise HTTPException(status_code=500, detail="Could not create post record in database.")
 
+        if processed_image.phash is not None:
+            await phash.publish_added(redis, created_post_record.id, processed_image.phash)
+
         created_post_record.image_url = get_post_image_url(request, created_post_record.filename)
-        created_post_record.thumbnail_url = created_post_record.image_url # Placeholder
+        created_post_record.thumbnail_url = get_post_thumbnail_url(request, created_post_record)
         return created_post_record
+    except asyncpg.UniqueViolationError:
+        # A concurrent upload of the same bytes won the race; the file on disk is now theirs
+        existing_post_id = await crud.get_post_id_by_hash(db, ingested.sha256)
+        if existing_post_id is None:
+            raise HTTPException(status_code=409, detail="This image has already been uploaded.")
+        raise duplicate_upload_exception(existing_post_id)
+    except HTTPException:
+        raise # Already answered (and the file already discarded) above
     except Exception as e:
-        if file_location_on_disk.exists(): os.remove(file_location_on_disk)
+        await discard_ingested_file(db, ingested, thumbnail_sizes)
         print(f"Error during post upload DB processing: {e}")
         raise HTTPException(status_code=500, detail=f"Database error during post upload: {str(e)}")
 
 
-@router.get("/", response_model=models.PaginatedPosts)
-async def list_posts(
+async def post_listing_response(
     request: Request,
-    page: int = Query(1, ge=1),
-    limit: int = Query(settings.DEFAULT_IMAGES_PER_PAGE, ge=1, le=settings.MAX_IMAGES_PER_PAGE),
-    tags: Optional[str] = Query(None),
-    sort_by: Optional[str] = Query(None, description="Sort posts by: 'date', 'score', 'id', 'random'"),
-    order: Optional[str] = Query("desc", description="Sort order: 'asc' or 'desc'"),
-    # Advanced search parameters
-    uploaded_after: Optional[date] = Query(None, description="Filter posts uploaded after this date (YYYY-MM-DD)"),
-    uploaded_before: Optional[date] = Query(None, description="Filter posts uploaded before this date (YYYY-MM-DD)"),
-    min_score: Optional[int] = Query(None, description="Filter posts with a score greater than or equal to this value"),
-    min_width: Optional[int] = Query(None, ge=1, description="Filter posts with a width greater than or equal to this value"),
-    min_height: Optional[int] = Query(None, ge=1, description="Filter posts with a height greater than or equal to this value"),
-    uploader_name: Optional[str] = Query(None, min_length=1, max_length=50, description="Filter posts by uploader's username"),
-    db: asyncpg.Connection = Depends(get_db_connection),
-    redis: redis_async.Redis = Depends(get_redis_connection)
-):
-    tags_list = tags.split(',') if tags and tags.strip() else None
-    skip = (page - 1) * limit
-
-    advanced_filters = {
-        "uploaded_after": uploaded_after,
-        "uploaded_before": uploaded_before,
-        "min_score": min_score,
-        "min_width": min_width,
-        "min_height": min_height,
-        "uploader_name": uploader_name,
-    }
-    # Remove None values from advanced_filters to pass only active filters to CRUD
-    active_advanced_filters = {k: v for k, v in advanced_filters.items() if v is not None}
+    db: asyncpg.Connection,
+    redis: redis_async.Redis,
+    page: int,
+    cursor: Optional[str],
+    limit: int,
+    tags_list: Optional[List[str]],
+    sort_by: Optional[str],
+    order: Optional[str],
+    include_total: str,
+    active_advanced_filters: Dict[str, Any],
+    period: Optional[str] = None
+) -> Response:
+    """
+    Shared body of the post listings (GET /posts/, GET /users/{username}/posts): validates the
+    sort/paging parameters, fetches the page and its total, and answers with the serialized
+    PaginatedPosts.
+    """
+    # Searches rank by relevance unless another order is asked for
+    if sort_by is None and "q" in active_advanced_filters:
+        sort_by = "relevance"
 
     # Validate sort_by and order parameters
-    allowed_sort_by = ['date', 'score', 'id', 'random', None] # None means default (usually date)
+    allowed_sort_by = ['date', 'score', 'id', 'random', 'relevance', 'hot', 'top', None] # None means default (usually date)
     allowed_order = ['asc', 'desc']
     if sort_by not in allowed_sort_by:
         raise HTTPException(status_code=400, detail=f"Invalid sort_by parameter. Allowed values: {allowed_sort_by}")
     if order not in allowed_order:
         raise HTTPException(status_code=400, detail=f"Invalid order parameter. Allowed values: {allowed_order}")
+    if sort_by == "relevance" and "q" not in active_advanced_filters:
+        raise HTTPException(status_code=400, detail="sort_by=relevance requires a search query (q).")
+    allowed_include_total = ['exact', 'estimated', 'false']
+    if include_total not in allowed_include_total:
+        raise HTTPException(status_code=400, detail=f"Invalid include_total parameter. Allowed values: {allowed_include_total}")
 
-    posts_from_db = await crud.get_posts(
-        db=db, redis=redis, skip=skip, limit=limit,
-        tags_filter=tags_list, sort_by=sort_by, order=order,
-        advanced_filters=active_advanced_filters # Pass active advanced filters
-    )
-    total_items = await crud.count_posts(
-        db=db, redis=redis, tags_filter=tags_list,
-        sort_by=sort_by, # sort_by might affect count if filtering changes
-        advanced_filters=active_advanced_filters # Pass active advanced filters
-    )
-    total_pages = math.ceil(total_items / limit) if total_items > 0 else 0
+    # hot/top are precomputed rankings (Redis sorted sets) over all posts: best first, page mode only
+    ranking_key = None
+    if sort_by == "top":
+        period = period or rankings.DEFAULT_TOP_PERIOD
+        if period not in rankings.TOP_PERIODS:
+            raise HTTPException(status_code=400, detail=f"Invalid period parameter. Allowed values: {list(rankings.TOP_PERIODS)}")
+        ranking_key = rankings.top_key(period)
+    elif period is not None:
+        raise HTTPException(status_code=400, detail="period is only supported with sort_by=top.")
+    elif sort_by == "hot":
+        ranking_key = rankings.HOT_KEY
+    if ranking_key:
+        if tags_list or active_advanced_filters:
+            raise HTTPException(status_code=400, detail=f"sort_by={sort_by} cannot be combined with tag or search filters.")
+        if order != "desc":
+            raise HTTPException(status_code=400, detail=f"sort_by={sort_by} only supports order=desc.")
+
+    # Keyset mode (cursor) for infinite scroll; page-number mode (OFFSET) for existing clients
+    cursor_position = None
+    if cursor:
+        try:
+            cursor_position = crud.parse_post_cursor(cursor, sort_by, order)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+        skip = 0
+    else:
+        skip = (page - 1) * limit
+
+    # The serialized page is cached under its validated, normalized parameters (the key embeds
+    # the list generation), never the raw URL: unknown parameters and spelling variants of the
+    # same listing share one entry. A hit is returned byte-for-byte, without building any model.
+    # The body holds absolute URLs, so it is only cached when site.public_url fixes their origin.
+    # Random order is never cached.
+    response_cache_key = None
+    if sort_by != "random" and settings.site.public_url:
+        response_cache_key = await crud.post_list_response_cache_key(redis, {
+            "page": page, # Echoed as current_page even in cursor mode
+            "cursor": f"{cursor_position['key']}/{cursor_position['id']}" if cursor_position else None,
+            "limit": limit, "tags": tags_list,
+            "sort_by": sort_by, "order": order, "include_total": include_total, "period": period,
+            **{f"f_{name}": value for name, value in active_advanced_filters.items()},
+        })
+        cached_body = await cache.get_cached(redis, response_cache_key, bytes)
+        if cached_body is not None:
+            return Response(content=cached_body, media_type="application/json")
+
+    # One extra row tells whether a next page exists without counting
+    if ranking_key:
+        posts_from_db = await crud.get_ranked_posts(db=db, redis=redis, ranking_key=ranking_key, skip=skip, limit=limit + 1)
+    else:
+        posts_from_db = await crud.get_posts(
+            db=db, redis=redis, skip=skip, limit=limit + 1,
+            tags_filter=tags_list, sort_by=sort_by, order=order,
+            advanced_filters=active_advanced_filters, # Pass active advanced filters
+            cursor=cursor_position
+        )
+    has_next = len(posts_from_db) > limit
+    posts_from_db = posts_from_db[:limit]
+
+    total_items = None
+    total_is_estimate = False
+    if not cursor and not has_next and (posts_from_db or skip == 0):
+        total_items = skip + len(posts_from_db) # Last page in page mode: the total is already known
+    elif ranking_key and include_total != 'false':
+        total_items = await rankings.count_ranked(redis, ranking_key) # ZCARD: exact and O(1)
+    elif include_total == 'exact':
+        total_items = await crud.count_posts(
+            db=db, redis=redis, tags_filter=tags_list,
+            sort_by=sort_by, # sort_by might affect count if filtering changes
+            advanced_filters=active_advanced_filters # Pass active advanced filters
+        )
+    elif include_total == 'estimated':
+        estimate = await crud.estimate_post_count(db=db, redis=redis, tags_filter=tags_list, advanced_filters=active_advanced_filters)
+        # Never report fewer posts than this response has already proven to exist
+        total_items = max(estimate, skip + len(posts_from_db) + (1 if has_next else 0))
+        total_is_estimate = True
+    total_pages = None
+    if total_items is not None:
+        total_pages = math.ceil(total_items / limit) if total_items > 0 else 0
 
     frontend_posts: List[models.PostForFrontend] = []
     for post_model in posts_from_db: # post_model is models.Post
         image_url = get_post_image_url(request, post_model.filename)
-        thumbnail_url = image_url # Placeholder
+        thumbnail_url = get_post_thumbnail_url(request, post_model)
 
         # Transform tags from List[models.Tag] to List[models.FrontendTag]
         frontend_tags = [models.FrontendTag(name=tag.name) for tag in post_model.tags]
@@ -203,12 +345,101 @@ async def list_posts(
             )
         )
 
-    return models.PaginatedPosts(
+    next_cursor = None
+    if has_next:
+        next_cursor = crud.make_post_cursor(posts_from_db[-1], sort_by, order)
+
+    paginated_posts = models.PaginatedPosts(
         data=frontend_posts,
         total_items=total_items,
         total_pages=total_pages,
-        current_page=page
+        total_is_estimate=total_is_estimate,
+        current_page=page,
+        has_next=has_next,
+        next_cursor=next_cursor
     )
+    # Serialized once here (pydantic-core, same output as FastAPI's response_model encoding)
+    body = paginated_posts.model_dump_json().encode("utf-8")
+    if response_cache_key:
+        await cache.set_cached(redis, response_cache_key, body, body, ex=crud.CACHE_EXPIRY_SECONDS)
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/", response_model=models.PaginatedPosts)
+async def list_posts(
+    request: Request,
+    page: int = Query(1, ge=1),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous response's next_cursor. When given, `page` is ignored."),
+    limit: int = Query(settings.DEFAULT_IMAGES_PER_PAGE, ge=1, le=settings.MAX_IMAGES_PER_PAGE),
+    tags: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, max_length=200, description="Full-text search over titles and descriptions (web search syntax: quotes, OR, -word)"),
+    sort_by: Optional[str] = Query(None, description="Sort posts by: 'date', 'score', 'id', 'random', 'relevance' (default when q is given), 'hot', 'top'"),
+    period: Optional[str] = Query(None, description="With sort_by=top: 'day', 'week', 'month' or 'all' (default)"),
+    order: Optional[str] = Query("desc", description="Sort order: 'asc' or 'desc'"),
+    include_total: str = Query("exact", description="Totals: 'exact' (COUNT), 'estimated' (table/planner statistics) or 'false' (only has_next)"),
+    # Advanced search parameters
+    uploaded_after: Optional[date] = Query(None, description="Filter posts uploaded after this date (YYYY-MM-DD)"),
+    uploaded_before: Optional[date] = Query(None, description="Filter posts uploaded before this date (YYYY-MM-DD)"),
+    min_score: Optional[int] = Query(None, description="Filter posts with a score greater than or equal to this value"),
+    min_width: Optional[int] = Query(None, ge=1, description="Filter posts with a width greater than or equal to this value"),
+    min_height: Optional[int] = Query(None, ge=1, description="Filter posts with a height greater than or equal to this value"),
+    uploader_name: Optional[str] = Query(None, min_length=1, max_length=50, description="Filter posts by uploader's username"),
+    db: asyncpg.Connection = Depends(get_db_connection),
+    redis: redis_async.Redis = Depends(get_redis_connection)
+):
+    tags_list = tags.split(',') if tags and tags.strip() else None
+
+    advanced_filters = {
+        "uploaded_after": uploaded_after,
+        "uploaded_before": uploaded_before,
+        "min_score": min_score,
+        "min_width": min_width,
+        "min_height": min_height,
+        "uploader_name": uploader_name,
+        "q": q.strip() if q and q.strip() else None,
+    }
+    # Remove None values from advanced_filters to pass only active filters to CRUD
+    active_advanced_filters = {k: v for k, v in advanced_filters.items() if v is not None}
+
+    return await post_listing_response(
+        request, db, redis, page=page, cursor=cursor, limit=limit, tags_list=tags_list,
+        sort_by=sort_by, order=order, include_total=include_total,
+        active_advanced_filters=active_advanced_filters, period=period
+    )
+
+@router.get("/{post_id}/duplicates", response_model=List[models.DuplicatePost])
+async def get_post_duplicates(
+    request: Request,
+    post_id: int,
+    max_distance: Optional[int] = Query(None, ge=0, le=phash.MAX_SEARCH_DISTANCE, description="Max Hamming distance between perceptual hashes (default from config)"),
+    limit: int = Query(20, ge=1, le=100),
+    db: asyncpg.Connection = Depends(get_db_connection),
+    redis: redis_async.Redis = Depends(get_redis_connection)
+):
+    """
+    Posts that look like this one (re-encoded, resized or lightly edited copies), nearest first.
+    Served from the in-memory perceptual hash index.
+    """
+    post_phash = await crud.get_post_phash(db, post_id)
+    if post_phash is None:
+        if await crud.get_post(db=db, redis=redis, post_id=post_id) is None:
+            raise HTTPException(status_code=404, detail="Post not found")
+        return [] # Not hashed yet (see backfill_media.py --phash)
+
+    await phash.sync_index(db)
+    distance = max_distance if max_distance is not None else settings.media.duplicate_search_distance
+    duplicates: List[models.DuplicatePost] = []
+    for duplicate_id, duplicate_distance in phash.phash_index.search(post_phash, distance, exclude_post_id=post_id):
+        post_model = await crud.get_post(db=db, redis=redis, post_id=duplicate_id)
+        if post_model is None:
+            phash.phash_index.remove(duplicate_id) # Deleted since the index was loaded
+            continue
+        post_model.image_url = get_post_image_url(request, post_model.filename)
+        post_model.thumbnail_url = get_post_thumbnail_url(request, post_model)
+        duplicates.append(models.DuplicatePost(**post_model.model_dump(), distance=duplicate_distance))
+        if len(duplicates) >= limit:
+            break
+    return duplicates
 
 @router.get("/{post_id}", response_model=models.Post)
 @router.get("/{post_id}/", response_model=models.Post)  # Add duplicate route with trailing slash
@@ -218,10 +449,22 @@ async def get_post_details(
     db: asyncpg.Connection = Depends(get_db_connection),
     redis: redis_async.Redis = Depends(get_redis_connection)
 ):
+    # Serialized post, per configured origin (its URLs are absolute); dropped with the post's
+    # other keys. Not cached without site.public_url, as the URLs would follow the Host header.
+    response_cache_key = f"{crud.POST_RESPONSE_CACHE_PREFIX}{post_id}"
+    origin = settings.site.public_url
+    if origin:
+        cached_body = await cache.get_cached_field(redis, response_cache_key, origin)
+        if cached_body is not None:
+            return Response(content=cached_body, media_type="application/json")
+
     post_model = await crud.get_post(db=db, redis=redis, post_id=post_id)
     if post_model is None:
         raise HTTPException(status_code=404, detail="Post not found")
 
     post_model.image_url = get_post_image_url(request, post_model.filename)
-    post_model.thumbnail_url = post_model.image_url # Placeholder
-    return post_model
+    post_model.thumbnail_url = get_post_thumbnail_url(request, post_model)
+    body = post_model.model_dump_json().encode("utf-8")
+    if origin:
+        await cache.set_cached_field(redis, response_cache_key, origin, body, ex=crud.CACHE_EXPIRY_SECONDS)
+    return Response(content=body, media_type="application/json")
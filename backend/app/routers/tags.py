@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import List, Optional
 import asyncpg
-import redis.asyncio as redis_async
 
 from .. import crud, models
-from ..db import get_db_connection, get_redis_connection
+from ..core import tag_index
+from ..db import get_db_connection
 from ..main import limiter # Assuming limiter is accessible from main
 
 router = APIRouter(
@@ -16,16 +16,49 @@ router = APIRouter(
 @limiter.limit("30/minute") # Example rate limit
 async def list_all_tags_with_counts(
     request: Request, # Added request parameter
-    db: asyncpg.Connection = Depends(get_db_connection),
-    redis: redis_async.Redis = Depends(get_redis_connection)
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous response's X-Next-Cursor header."),
+    sort: str = Query("count", description="Sort tags by: 'count' (most used first) or 'name'"),
+    db: asyncpg.Connection = Depends(get_db_connection)
 ):
     """
-    Retrieve all tags with their associated post counts.
+    Retrieve one page of tags with their associated post counts.
+    The body stays a plain list; the cursor for the next page is sent in the X-Next-Cursor
+    header (absent on the last page).
     """
+    if sort not in crud.TAG_SORTS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort parameter. Allowed values: {list(crud.TAG_SORTS)}")
+    cursor_position = None
+    if cursor:
+        try:
+            cursor_position = crud.parse_tag_cursor(cursor, sort)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
     try:
-        tags_with_counts = await crud.get_all_tags_with_counts(db=db, redis=redis)
-        return tags_with_counts
+        tags_with_counts, next_cursor = await crud.get_tags_with_counts(db=db, limit=limit, sort=sort, cursor=cursor_position)
     except Exception as e:
         # Log the exception e
         print(f"Error fetching all tags with counts: {e}")
         raise HTTPException(status_code=500, detail="Could not retrieve tags.")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return tags_with_counts
+
+@router.get("/suggest", response_model=List[models.TagWithCount])
+async def suggest_tags(
+    request: Request,
+    prefix: str = Query("", max_length=100, description="Start of the tag name being typed"),
+    limit: int = Query(10, ge=1, le=tag_index.SUGGEST_MAX_LIMIT)
+):
+    """
+    Autocomplete: the most used tags whose name starts with `prefix`.
+    Served from the in-memory index (no database connection once it is loaded); counts may lag
+    by up to [cache] tag_suggest_refresh_seconds.
+    """
+    # Only if the startup load failed; the refresh task keeps it current afterwards
+    await tag_index.ensure_loaded(request.app.state.pg_pool)
+    return [
+        models.TagWithCount(id=tag_id, name=name, post_count=post_count)
+        for tag_id, name, post_count in tag_index.tag_index.suggest(tag_index.normalize_prefix(prefix), limit)
+    ]
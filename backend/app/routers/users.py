@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from typing import Optional
+import asyncpg
+import redis.asyncio as redis_async
+
+from .. import crud, models
+from ..core.config import settings
+from ..db import get_db_connection, get_redis_connection
+from .posts import post_listing_response
+
+router = APIRouter(
+    prefix="/users",
+    tags=["users"],
+)
+
+@router.get("/{username}/posts", response_model=models.PaginatedPosts)
+async def list_user_posts(
+    request: Request,
+    username: str = Path(..., min_length=1, max_length=50),
+    page: int = Query(1, ge=1),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous response's next_cursor. When given, `page` is ignored."),
+    limit: int = Query(settings.DEFAULT_IMAGES_PER_PAGE, ge=1, le=settings.MAX_IMAGES_PER_PAGE),
+    sort_by: Optional[str] = Query(None, description="Sort posts by: 'date' (default), 'score', 'id', 'random'"),
+    order: Optional[str] = Query("desc", description="Sort order: 'asc' or 'desc'"),
+    include_total: str = Query("exact", description="Totals: 'exact' (COUNT), 'estimated' (planner statistics) or 'false' (only has_next)"),
+    db: asyncpg.Connection = Depends(get_db_connection),
+    redis: redis_async.Redis = Depends(get_redis_connection)
+):
+    """
+    Posts uploaded by one user, newest first by default.
+    The username is resolved to an id through the identity cache, and the listing pages over
+    the (uploader_id, uploaded_at, id) index; cursors work as on GET /posts/.
+    """
+    uploader = await crud.get_cached_user_by_username(db, redis, username)
+    if uploader is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return await post_listing_response(
+        request, db, redis, page=page, cursor=cursor, limit=limit, tags_list=None,
+        sort_by=sort_by, order=order, include_total=include_total,
+        active_advanced_filters={"uploader_id": uploader.id}
+    )
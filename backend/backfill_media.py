@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+from pathlib import Path
+
+import asyncpg
+import redis.asyncio as redis_async
+
+# Adjust imports to match your project structure
+# Assuming this script is run from the 'backend' directory
+from app.core.config import settings
+from app.core import imaging
+from app import crud
+
+# Generates derived media for posts uploaded before the pipeline existed (or whose generation failed).
+# Safe to re-run: posts that already have every configured size are skipped.
+# You can run this script from the 'backend' directory:
+# python backfill_media.py
+
+async def backfill_thumbnails(conn: asyncpg.Connection, redis_client: redis_async.Redis, batch_size: int) -> int:
+    sizes = settings.media.thumbnail_sizes
+    processed = 0
+    last_id = 0
+    while True:
+        batch = await crud.get_posts_missing_thumbnails(conn, sizes, after_id=last_id, limit=batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]['id']
+
+        source_paths = [Path(settings.PROJECT_ROOT_DIR) / record['filepath'] for record in batch]
+        # One task per post; the process pool bounds how many actually run at once
+        results = await asyncio.gather(*[
+            imaging.create_thumbnails(path) if path.exists() else asyncio.sleep(0, result=[])
+            for path in source_paths
+        ])
+        for record, path, written_sizes in zip(batch, source_paths, results):
+            if not written_sizes:
+                print(f"Skipped post {record['id']}: {'no thumbnails generated' if path.exists() else f'file missing at {path}'}")
+                continue
+            await crud.set_post_thumbnail_sizes(conn, redis_client, record['id'], written_sizes)
+            processed += 1
+        print(f"Thumbnails: {processed} post(s) done so far (last id {last_id}).")
+    return processed
+
+async def backfill_phashes(conn: asyncpg.Connection, batch_size: int) -> int:
+    processed = 0
+    last_id = 0
+    while True:
+        batch = await crud.get_posts_missing_phash(conn, after_id=last_id, limit=batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]['id']
+
+        source_paths = [Path(settings.PROJECT_ROOT_DIR) / record['filepath'] for record in batch]
+        results = await asyncio.gather(*[
+            imaging.compute_phash(path) if path.exists() else asyncio.sleep(0, result=None)
+            for path in source_paths
+        ])
+        for record, path, value in zip(batch, source_paths, results):
+            if value is None:
+                print(f"Skipped post {record['id']}: {'could not hash image' if path.exists() else f'file missing at {path}'}")
+                continue
+            await crud.set_post_phash(conn, record['id'], value)
+            processed += 1
+        print(f"Perceptual hashes: {processed} post(s) done so far (last id {last_id}).")
+    return processed
+
+async def main(cli_args):
+    conn = None
+    redis_client = redis_async.from_url(str(settings.REDIS_URL))
+    try:
+        conn = await asyncpg.connect(str(settings.DATABASE_URL))
+        print("Database connection established.")
+
+        if cli_args.thumbnails:
+            processed = await backfill_thumbnails(conn, redis_client, cli_args.batch_size)
+            print(f"Thumbnail backfill finished: {processed} post(s) updated.")
+        if cli_args.phash:
+            processed = await backfill_phashes(conn, cli_args.batch_size)
+            print(f"Perceptual hash backfill finished: {processed} post(s) updated. Restart the API to load them into the duplicate index.")
+
+        await crud.invalidate_post_lists(redis_client)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if conn:
+            await conn.close()
+            print("Database connection closed.")
+        await redis_client.aclose()
+        imaging.shutdown_executors()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill derived media (thumbnails, perceptual hashes) for existing posts.")
+    parser.add_argument("--thumbnails", action="store_true", help="Generate missing thumbnails.")
+    parser.add_argument("--phash", action="store_true", help="Compute missing perceptual hashes (near-duplicate detection).")
+    parser.add_argument("--batch-size", type=int, default=100, help="Posts fetched per batch (default: 100).")
+    cli_args_parsed = parser.parse_args()
+    # With no explicit selection, backfill everything
+    if not (cli_args_parsed.thumbnails or cli_args_parsed.phash):
+        cli_args_parsed.thumbnails = True
+        cli_args_parsed.phash = True
+    asyncio.run(main(cli_args_parsed))
@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+# Measures how a burst of logins affects unrelated requests on a running API.
+# A probe loop issues a cheap GET at a fixed rate; the script records its latency first with
+# no other load (baseline) and then while many clients log in concurrently (storm).
+# With bcrypt on the event loop, probe p99 grows with every concurrent login; with hashing on
+# the password executor it should stay close to the baseline.
+#
+# Requires httpx (not an app dependency): pip install httpx
+# The API rate-limits per client IP, so run it against an instance with a generous limit,
+# e.g. default_rate_limit = "100000/minute" under [security] in config.toml; otherwise most
+# requests are answered 429 and never reach bcrypt. Non-200 logins are reported as failed.
+# Create a test account first (POST /api/v1/auth/register), then run from the 'backend' directory:
+# python bench_login_storm.py --username bench_user --password 'bench-password-123'
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+async def probe(client: "httpx.AsyncClient", path: str, interval: float, stop: asyncio.Event, latencies: List[float]) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get(path)
+            latencies.append((time.perf_counter() - started) * 1000)
+        except httpx.HTTPError as e:
+            print(f"Probe error: {e}")
+        await asyncio.sleep(interval)
+
+async def login_worker(client: "httpx.AsyncClient", username: str, password: str, stop: asyncio.Event, counters: dict) -> None:
+    while not stop.is_set():
+        try:
+            response = await client.post("/api/v1/auth/token", data={"username": username, "password": password})
+            counters["ok" if response.status_code == 200 else "failed"] += 1
+        except httpx.HTTPError:
+            counters["failed"] += 1
+
+async def run_phase(base_url: str, args, concurrency: int) -> dict:
+    latencies: List[float] = []
+    counters = {"ok": 0, "failed": 0}
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=concurrency + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        tasks = [asyncio.create_task(probe(client, args.probe_path, args.probe_interval, stop, latencies))]
+        tasks += [
+            asyncio.create_task(login_worker(client, args.username, args.password, stop, counters))
+            for _ in range(concurrency)
+        ]
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        "probes": len(latencies),
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies) if latencies else float("nan"),
+        "mean": statistics.fmean(latencies) if latencies else float("nan"),
+        "logins_per_second": counters["ok"] / args.duration,
+        "failed_logins": counters["failed"],
+    }
+
+def print_phase(name: str, result: dict) -> None:
+    print(
+        f"{name:<10} probes={result['probes']:<5} p50={result['p50']:8.1f} ms  p99={result['p99']:8.1f} ms  "
+        f"max={result['max']:8.1f} ms  logins/s={result['logins_per_second']:6.1f}  failed={result['failed_logins']}"
+    )
+
+async def main(args):
+    print(f"Target: {args.base_url}  probe: GET {args.probe_path} every {args.probe_interval * 1000:.0f} ms  phase: {args.duration}s")
+    baseline = await run_phase(args.base_url, args, concurrency=0)
+    print_phase("baseline", baseline)
+    storm = await run_phase(args.base_url, args, concurrency=args.concurrency)
+    print_phase(f"storm x{args.concurrency}", storm)
+    if baseline["p99"] > 0:
+        print(f"Probe p99 during the storm: {storm['p99'] / baseline['p99']:.1f}x baseline.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login storm benchmark: latency of unrelated GETs while many clients log in.")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="API origin (default: http://localhost:8000).")
+    parser.add_argument("--username", required=True, help="Existing account used for the logins.")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent login clients during the storm (default: 32).")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per phase (default: 15).")
+    parser.add_argument("--probe-path", default="/api/v1/tags/", help="Cheap GET used as the probe (default: /api/v1/tags/).")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="Seconds between probes (default: 0.05).")
+    cli_args_parsed = parser.parse_args()
+    if httpx is None:
+        raise SystemExit("This benchmark needs httpx: pip install httpx")
+    asyncio.run(main(cli_args_parsed))
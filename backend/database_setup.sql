@@ -15,10 +15,27 @@ CREATE TABLE IF NOT EXISTS posts (
     uploader_id INTEGER REFERENCES users(id) ON DELETE SET NULL, -- Link to the user who uploaded
     uploaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     -- Consider adding fields like width, height
-    -- A hash of the file could also be useful for de-duplication:
-    -- file_hash VARCHAR(64) UNIQUE -- e.g., SHA256 hash
+    file_hash VARCHAR(64) DEFAULT NULL,          -- SHA-256 of the file contents (hex); files are stored as <hash>.<ext>
+    phash BIGINT DEFAULT NULL,                   -- 64-bit perceptual hash (dHash) for near-duplicate detection
     image_width INTEGER DEFAULT NULL,           -- Width of the image in pixels
     image_height INTEGER DEFAULT NULL,          -- Height of the image in pixels
+    -- Denormalized counters, maintained by crud.create_comment / crud.cast_vote
+    -- (rebuild with reconcile_denormalized.py if they ever drift)
+    comment_count INTEGER NOT NULL DEFAULT 0,
+    upvotes INTEGER NOT NULL DEFAULT 0,
+    downvotes INTEGER NOT NULL DEFAULT 0,
+    score INTEGER GENERATED ALWAYS AS (upvotes - downvotes) STORED,
+    -- Denormalized copy of the post's tags (sorted by name, arrays aligned by position),
+    -- kept in sync with post_tags by crud.create_post_with_tags / crud.update_tags_for_posts
+    tag_ids INTEGER[] NOT NULL DEFAULT '{}',
+    tag_names TEXT[] NOT NULL DEFAULT '{}',
+    thumbnail_sizes INTEGER[] NOT NULL DEFAULT '{}', -- Sizes of the generated <stem>_<size> thumbnails next to the upload
+    random_key DOUBLE PRECISION NOT NULL DEFAULT random(), -- Uniform in [0, 1); sort_by=random samples by probing its index
+    -- Full-text search document (title weighted above description); maintained by Postgres
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED,
     CONSTRAINT uq_filepath_posts UNIQUE (filepath) -- Ensure filepath is unique
 );
 
@@ -33,10 +50,96 @@ BEGIN
     END IF;
 END $$;
 
+-- Add denormalized vote/comment counters to existing posts table if they don't exist.
+-- The backfill only runs when the columns are first created; afterwards the
+-- application keeps them up to date.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='posts' AND column_name='comment_count') THEN
+        ALTER TABLE posts ADD COLUMN comment_count INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE posts ADD COLUMN upvotes INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE posts ADD COLUMN downvotes INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE posts ADD COLUMN score INTEGER GENERATED ALWAYS AS (upvotes - downvotes) STORED;
+        IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name='votes') THEN
+            UPDATE posts p SET
+                comment_count = (SELECT COUNT(*) FROM comments c WHERE c.post_id = p.id),
+                upvotes = (SELECT COUNT(*) FROM votes v WHERE v.post_id = p.id AND v.vote_type = 1),
+                downvotes = (SELECT COUNT(*) FROM votes v WHERE v.post_id = p.id AND v.vote_type = -1);
+        END IF;
+    END IF;
+END $$;
+
+-- Add denormalized tag arrays to existing posts table if they don't exist.
+-- As with the counters, the backfill only runs when the columns are first created.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='posts' AND column_name='tag_ids') THEN
+        ALTER TABLE posts ADD COLUMN tag_ids INTEGER[] NOT NULL DEFAULT '{}';
+        ALTER TABLE posts ADD COLUMN tag_names TEXT[] NOT NULL DEFAULT '{}';
+        IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name='post_tags') THEN
+            UPDATE posts p SET tag_ids = agg.ids, tag_names = agg.names
+            FROM (
+                SELECT pt.post_id, array_agg(t.id ORDER BY t.name) AS ids, array_agg(t.name::text ORDER BY t.name) AS names
+                FROM post_tags pt JOIN tags t ON t.id = pt.tag_id
+                GROUP BY pt.post_id
+            ) agg
+            WHERE p.id = agg.post_id;
+        END IF;
+    END IF;
+END $$;
+
+-- Add thumbnail_sizes to existing posts table if it doesn't exist (fill it with backfill_media.py)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='posts' AND column_name='thumbnail_sizes') THEN
+        ALTER TABLE posts ADD COLUMN thumbnail_sizes INTEGER[] NOT NULL DEFAULT '{}';
+    END IF;
+END $$;
+
+-- Add file_hash to existing posts table if it doesn't exist. Posts uploaded before
+-- content-addressed storage keep a NULL hash and their original filename.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='posts' AND column_name='file_hash') THEN
+        ALTER TABLE posts ADD COLUMN file_hash VARCHAR(64) DEFAULT NULL;
+    END IF;
+END $$;
+
+-- Add phash to existing posts table if it doesn't exist (filled by backfill_media.py --phash)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='posts' AND column_name='phash') THEN
+        ALTER TABLE posts ADD COLUMN phash BIGINT DEFAULT NULL;
+    END IF;
+END $$;
+
+-- Add the generated full-text search column to existing posts table if it doesn't exist
+-- (adding it rewrites the table once to compute the vectors)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='posts' AND column_name='search_vector') THEN
+        ALTER TABLE posts ADD COLUMN search_vector TSVECTOR GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED;
+    END IF;
+END $$;
+
+-- Add random_key to existing posts table if it doesn't exist (the volatile default gives
+-- every existing row its own value; the table is rewritten once)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='posts' AND column_name='random_key') THEN
+        ALTER TABLE posts ADD COLUMN random_key DOUBLE PRECISION NOT NULL DEFAULT random();
+    END IF;
+END $$;
+
 -- Table for storing tags
 CREATE TABLE IF NOT EXISTS tags (
     id SERIAL PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
+    -- Denormalized number of posts carrying the tag, maintained by crud._link_post_tags / crud._unlink_post_tags
+    post_count INTEGER NOT NULL DEFAULT 0,
     CONSTRAINT uq_tag_name UNIQUE (name) -- Ensure tag names are unique
 );
 
@@ -49,6 +152,19 @@ CREATE TABLE IF NOT EXISTS post_tags (
     FOREIGN KEY (tag_id) REFERENCES tags (id) ON DELETE CASCADE
 );
 
+-- Add the denormalized post_count to existing tags table if it doesn't exist.
+-- The backfill only runs when the column is first created; afterwards the application
+-- keeps it up to date (rebuild with reconcile_denormalized.py --tag-counts).
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='tags' AND column_name='post_count') THEN
+        ALTER TABLE tags ADD COLUMN post_count INTEGER NOT NULL DEFAULT 0;
+        UPDATE tags t SET post_count = agg.post_count
+        FROM (SELECT tag_id, COUNT(*) AS post_count FROM post_tags GROUP BY tag_id) agg
+        WHERE t.id = agg.tag_id;
+    END IF;
+END $$;
+
 -- Table for storing user information
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
@@ -103,14 +219,36 @@ CREATE TABLE IF NOT EXISTS votes (
 CREATE INDEX IF NOT EXISTS idx_tags_name ON tags(name);
 CREATE INDEX IF NOT EXISTS idx_post_tags_post_id ON post_tags(post_id);
 CREATE INDEX IF NOT EXISTS idx_post_tags_tag_id ON post_tags(tag_id);
+CREATE INDEX IF NOT EXISTS idx_tags_post_count ON tags(post_count DESC, name); -- Tag listing sorted by count (keyset)
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_comments_post_id ON comments(post_id);
 CREATE INDEX IF NOT EXISTS idx_comments_user_id ON comments(user_id);
-CREATE INDEX IF NOT EXISTS idx_comments_parent_comment_id ON comments(parent_comment_id);
+-- Comment threads: a post's root comments and each comment's replies, both oldest first
+CREATE INDEX IF NOT EXISTS idx_comments_post_roots ON comments(post_id, created_at, id) WHERE parent_comment_id IS NULL;
+CREATE INDEX IF NOT EXISTS idx_comments_parent_created ON comments(parent_comment_id, created_at, id);
+DROP INDEX IF EXISTS idx_comments_parent_comment_id; -- Superseded by idx_comments_parent_created
 CREATE INDEX IF NOT EXISTS idx_votes_user_id ON votes(user_id);
 CREATE INDEX IF NOT EXISTS idx_votes_post_id ON votes(post_id);
 CREATE INDEX IF NOT EXISTS idx_votes_comment_id ON votes(comment_id);
+CREATE INDEX IF NOT EXISTS idx_posts_uploaded_at ON posts(uploaded_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_posts_score ON posts(score DESC, id DESC);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_posts_file_hash ON posts(file_hash) WHERE file_hash IS NOT NULL; -- One post per distinct file
+CREATE INDEX IF NOT EXISTS idx_posts_tag_names ON posts USING GIN (tag_names); -- Multi-tag AND filters use tag_names @> ARRAY[...]
+CREATE INDEX IF NOT EXISTS idx_posts_search_vector ON posts USING GIN (search_vector); -- q= full-text search
+CREATE INDEX IF NOT EXISTS idx_posts_uploader ON posts(uploader_id, uploaded_at DESC, id DESC); -- GET /users/{username}/posts
+CREATE INDEX IF NOT EXISTS idx_posts_random_key ON posts(random_key); -- sort_by=random sampling probes
+
+-- Trigram index for the uploader_name substring filter (ILIKE '%x%'). pg_trgm ships with
+-- Postgres but creating an extension may need elevated privileges; without it the filter
+-- still works, it just scans users.
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS idx_users_username_trgm ON users USING GIN (username gin_trgm_ops);
+EXCEPTION WHEN insufficient_privilege OR undefined_file OR feature_not_supported THEN -- 0A000: extension not installed (PG15+)
+    RAISE NOTICE 'pg_trgm unavailable (%), skipping idx_users_username_trgm', SQLERRM;
+END $$;
 
 
 -- Comments on tables and columns
@@ -123,9 +261,21 @@ COMMENT ON COLUMN posts.title IS 'Optional title for the post.';
 COMMENT ON COLUMN posts.description IS 'Optional description for the post.';
 COMMENT ON COLUMN posts.uploader_id IS 'Foreign key referencing the user who uploaded the post.';
 COMMENT ON COLUMN posts.uploaded_at IS 'Timestamp when the post (and its image) was uploaded.';
+COMMENT ON COLUMN posts.comment_count IS 'Denormalized number of comments on the post.';
+COMMENT ON COLUMN posts.upvotes IS 'Denormalized number of upvotes on the post.';
+COMMENT ON COLUMN posts.downvotes IS 'Denormalized number of downvotes on the post.';
+COMMENT ON COLUMN posts.score IS 'upvotes - downvotes, generated from the counter columns.';
+COMMENT ON COLUMN posts.tag_ids IS 'Denormalized tag ids of the post, ordered by tag name and aligned with tag_names.';
+COMMENT ON COLUMN posts.file_hash IS 'Hex SHA-256 of the image file; unique, used for upload de-duplication.';
+COMMENT ON COLUMN posts.phash IS 'Unsigned 64-bit dHash stored as two''s-complement BIGINT; searched in memory by app.core.phash, so no index.';
+COMMENT ON COLUMN posts.thumbnail_sizes IS 'Sizes (longest edge, px) of the thumbnails generated for the image.';
+COMMENT ON COLUMN posts.search_vector IS 'Generated tsvector over title (weight A) and description (weight B) for full-text search.';
+COMMENT ON COLUMN posts.random_key IS 'Uniform random value in [0, 1), indexed; random listings take the first post after random points.';
+COMMENT ON COLUMN posts.tag_names IS 'Denormalized tag names of the post, ordered by name. Indexed with GIN for tag filtering.';
 
 COMMENT ON TABLE tags IS 'Stores unique tags that can be applied to posts.';
 COMMENT ON COLUMN tags.name IS 'The unique name of the tag (e.g., "cat", "landscape").';
+COMMENT ON COLUMN tags.post_count IS 'Denormalized number of posts carrying the tag.';
 
 COMMENT ON TABLE post_tags IS 'Associates posts with tags in a many-to-many relationship.';
 COMMENT ON COLUMN post_tags.post_id IS 'Foreign key referencing the ID of the post.';
@@ -1,6 +1,7 @@
 import argparse
 import asyncio
 import asyncpg
+import redis.asyncio as redis_async
 import sys
 import os
 
@@ -14,7 +15,8 @@ async def run_script_operations(
     RoleEnum,
     crud_get_user_by_username,
     crud_get_user_by_email,
-    crud_update_user_role
+    crud_update_user_role,
+    crud_invalidate_user_cache
 ):
     """
     Core logic for the script, accepting necessary dependencies.
@@ -67,6 +69,17 @@ async def run_script_operations(
 
         updated_user = await crud_update_user_role(conn, user_to_update_record.id, new_role_enum)
 
+        # Make the running API drop its cached copy of this user (identity cache)
+        if updated_user:
+            redis_client = redis_async.from_url(str(script_settings.REDIS_URL))
+            try:
+                await crud_invalidate_user_cache(redis_client, updated_user.id, updated_user.username)
+            except Exception as e:
+                # Redis unreachable: the role is updated, API workers pick it up when their cache entries expire
+                print(f"Warning: Could not invalidate cached user in Redis ({e}). The change applies once cached entries expire.")
+            finally:
+                await redis_client.aclose()
+
         if updated_user: # updated_user is models.User
             print(f"Successfully updated role for user '{updated_user.username}' (ID: {updated_user.id}) to '{updated_user.role.value}'.")
         else:
@@ -140,6 +153,7 @@ if __name__ == "__main__":
     from app.crud import get_user_by_username as crud_get_user_by_username_func
     from app.crud import get_user_by_email as crud_get_user_by_email_func
     from app.crud import update_user_role as crud_update_user_role_func
+    from app.crud import invalidate_user_cache as crud_invalidate_user_cache_func
 
     # Step 4: Setup argparse using the imported AppUserRole for choices
     parser = argparse.ArgumentParser(description="Manage user roles in the Spectra database.")
@@ -162,5 +176,6 @@ if __name__ == "__main__":
         AppUserRole,
         crud_get_user_by_username_func,
         crud_get_user_by_email_func,
-        crud_update_user_role_func
+        crud_update_user_role_func,
+        crud_invalidate_user_cache_func
     ))
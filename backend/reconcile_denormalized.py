@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import asyncpg
+import redis.asyncio as redis_async
+
+# Adjust imports to match your project structure
+# Assuming this script is run from the 'backend' directory
+from app.core.config import settings
+from app import crud
+
+# Rebuilds the denormalized columns the application maintains incrementally.
+# Safe to run at any time (e.g. from cron); rows that are already correct are left untouched.
+# You can run this script from the 'backend' directory:
+# python reconcile_denormalized.py
+
+async def main(cli_args):
+    conn = None
+    try:
+        conn = await asyncpg.connect(str(settings.DATABASE_URL))
+        print("Database connection established.")
+
+        async with conn.transaction():
+            if cli_args.counters:
+                corrected = await crud.reconcile_post_counters(conn)
+                print(f"Post counters reconciled: {corrected} post(s) corrected.")
+            if cli_args.tag_arrays:
+                corrected = await crud.rebuild_post_tag_arrays(conn)
+                print(f"Post tag arrays rebuilt: {corrected} post(s) corrected.")
+            if cli_args.tag_counts:
+                corrected = await crud.reconcile_tag_counts(conn)
+                print(f"Tag post counts reconciled: {corrected} tag(s) corrected.")
+
+        # Cached lists/counts were built from the old values; move them to a new generation.
+        # Individually cached posts (post:{id}) still expire through their TTL.
+        redis_client = redis_async.from_url(str(settings.REDIS_URL))
+        try:
+            await crud.invalidate_post_lists(redis_client)
+        finally:
+            await redis_client.aclose()
+        print("Done. Cached post lists invalidated.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if conn:
+            await conn.close()
+            print("Database connection closed.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild denormalized columns in the Spectra database.")
+    parser.add_argument("--counters", action="store_true", help="Rebuild posts.comment_count/upvotes/downvotes.")
+    parser.add_argument("--tag-arrays", action="store_true", help="Rebuild posts.tag_ids/tag_names from post_tags.")
+    parser.add_argument("--tag-counts", action="store_true", help="Rebuild tags.post_count from post_tags.")
+    cli_args_parsed = parser.parse_args()
+    # With no explicit selection, reconcile everything
+    if not any(vars(cli_args_parsed).values()):
+        for name in vars(cli_args_parsed):
+            setattr(cli_args_parsed, name, True)
+    asyncio.run(main(cli_args_parsed))
@@ -0,0 +1,69 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Run from the 'backend' directory: python -m pytest tests
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+pytest.importorskip("asyncpg")
+pytest.importorskip("redis")
+
+from app.core.phash import PerceptualHashIndex, apply_message, sync_index # noqa: E402
+
+class FakePostsTable:
+    """Stands in for the asyncpg connection: answers sync_index's range query from a dict."""
+
+    def __init__(self) -> None:
+        self.rows = {} # post_id -> phash
+        self.queries = 0
+
+    async def fetch(self, query, after_id, limit):
+        self.queries += 1
+        ids = sorted(post_id for post_id in self.rows if post_id > after_id)[:limit]
+        return [{"id": post_id, "phash": self.rows[post_id]} for post_id in ids]
+
+def test_sync_is_a_no_op_until_marked_stale():
+    table = FakePostsTable()
+    index = PerceptualHashIndex()
+    table.rows[1] = 0x1111
+    asyncio.run(sync_index(table, index))
+    queries_after_load = table.queries
+
+    table.rows[2] = 0x2222 # Its message would have added it
+    asyncio.run(sync_index(table, index))
+    asyncio.run(sync_index(table, index))
+
+    assert table.queries == queries_after_load
+    assert 2 not in index
+
+def test_resync_after_reconnect_finds_lower_ids_committed_after_a_local_add():
+    table = FakePostsTable()
+    index = PerceptualHashIndex()
+    table.rows[1] = 0x1111
+    asyncio.run(sync_index(table, index))
+
+    # This worker creates post 5 and indexes it directly...
+    table.rows[5] = 0x5555
+    apply_message({"post_id": 5, "phash": 0x5555}, index)
+    asyncio.run(sync_index(table, index))
+    # ...while another worker's post 3 commits during a listener outage
+    table.rows[3] = 0x3333
+    index.mark_stale()
+    asyncio.run(sync_index(table, index))
+
+    assert index.get(3) == 0x3333
+    assert index.search(0x3333, 0) == [(3, 0)]
+
+def test_messages_add_and_remove_posts():
+    index = PerceptualHashIndex()
+    apply_message({"post_id": 7, "phash": 0x7777}, index)
+    apply_message({"post_id": 7, "phash": 0x7777}, index) # Echo of this worker's own message
+    assert len(index) == 1
+    assert index.search(0x7777, 0) == [(7, 0)]
+
+    apply_message({"post_id": 7, "phash": None}, index)
+    assert 7 not in index
+    assert index.search(0x7777, 0) == []
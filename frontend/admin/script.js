@@ -239,6 +239,22 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // --- Mass Image Upload Logic ---
+    // Returns the id of the post that already has this file's exact bytes, or null.
+    // Web Crypto is only available in secure contexts; without it every file is sent
+    // and the server de-duplicates on its own.
+    async function findExistingPostId(file) {
+        if (!window.crypto || !window.crypto.subtle) return null;
+        try {
+            const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+            const hex = Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+            const response = await fetch(`${API_BASE_URL}/posts/by-hash/${hex}`, { method: 'HEAD' });
+            return response.ok ? response.headers.get('X-Post-Id') : null;
+        } catch (error) {
+            console.warn('Duplicate pre-check failed, uploading anyway:', error);
+            return null;
+        }
+    }
+
     if (massUploadForm) {
         massUploadForm.addEventListener('submit', async (event) => {
             event.preventDefault();
@@ -257,16 +273,28 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
 
-            massUploadStatus.textContent = `Uploading ${files.length} file(s)...`;
-
+            // Ask the server which files it already has (by SHA-256) so their bytes are never sent
+            massUploadStatus.textContent = `Checking ${files.length} file(s) for duplicates...`;
+            const alreadyUploaded = [];
             const formData = new FormData();
             for (let i = 0; i < files.length; i++) {
-                formData.append('files', files[i]);
+                const existingPostId = await findExistingPostId(files[i]);
+                if (existingPostId) {
+                    alreadyUploaded.push({ filename: files[i].name, post_id: existingPostId });
+                } else {
+                    formData.append('files', files[i]);
+                }
             }
             if (tagsStr) {
                 formData.append('tags_str', tagsStr);
             }
 
+            if (!formData.has('files')) {
+                massUploadStatus.textContent = `All ${files.length} file(s) are already uploaded. Nothing to send.`;
+                return;
+            }
+            massUploadStatus.textContent = `Uploading ${files.length - alreadyUploaded.length} file(s)...`;
+
             try {
                 const response = await fetch(`${API_BASE_URL}/admin/posts/batch-upload`, {
                     method: 'POST',
@@ -281,6 +309,13 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (response.ok || response.status === 201 || response.status === 207) { // 207 for Multi-Status
                     let message = `Batch upload process completed.\n`;
                     message += `Successful uploads: ${result.successful ? result.successful.length : 0}\n`;
+                    const duplicates = alreadyUploaded.concat(result.duplicates || []);
+                    if (duplicates.length > 0) {
+                        message += `Skipped (already uploaded): ${duplicates.length}\n`;
+                        duplicates.forEach(dup => {
+                            message += `- ${dup.filename}: post #${dup.post_id}\n`;
+                        });
+                    }
                     if (result.failed && result.failed.length > 0) {
                         message += `Failed uploads: ${result.failed.length}\n`;
                         result.failed.forEach(fail => {
@@ -294,49 +294,95 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
-        comments.forEach(comment => {
-            const commentItem = document.createElement('div');
-            commentItem.className = 'comment-item';
-            commentItem.dataset.commentId = comment.id;
-
-            // Use comment.user which is UserBase (includes role if backend sends it)
-            const commenterName = comment.user ? comment.user.username : 'Anonymous';
-            const commenterRole = comment.user && comment.user.role ? comment.user.role : '';
-            const commentDate = new Date(comment.created_at).toLocaleString();
-
-            const commenterDisplay = `${commenterName}${commenterRole && commenterRole !== 'user' ? ' (' + commenterRole + ')' : ''}`;
-
-            commentItem.innerHTML = `
-                <div class="comment-meta">
-                    <span class="commenter-username">${commenterDisplay}</span> -
-                    <span class="comment-timestamp">${commentDate}</span>
-                </div>
-                <p class="comment-content">${comment.content}</p>
-                <div class="comment-actions">
-                    <div class="vote-section" data-target-type="comment" data-target-id="${comment.id}">
-                        <button class="vote-button upvote" data-vote-type="upvote">Upvote</button>
-                        <span class="vote-score">${(comment.upvotes || 0) - (comment.downvotes || 0)}</span>
-                        <button class="vote-button downvote" data-vote-type="downvote">Downvote</button>
-                    </div>
-                    <button class="reply-button" data-comment-id="${comment.id}" data-commenter-username="${commenterName}">Reply</button>
+        comments.forEach(comment => commentsListElement.appendChild(buildCommentItem(comment)));
+    }
+
+    // One comment and, nested below it, the replies the API returned with it
+    function buildCommentItem(comment) {
+        const commentItem = document.createElement('div');
+        commentItem.className = 'comment-item';
+        commentItem.dataset.commentId = comment.id;
+
+        // Use comment.user which is UserBase (includes role if backend sends it)
+        const commenterName = comment.user ? comment.user.username : 'Anonymous';
+        const commenterRole = comment.user && comment.user.role ? comment.user.role : '';
+        const commentDate = new Date(comment.created_at).toLocaleString();
+
+        const commenterDisplay = `${commenterName}${commenterRole && commenterRole !== 'user' ? ' (' + commenterRole + ')' : ''}`;
+
+        commentItem.innerHTML = `
+            <div class="comment-meta">
+                <span class="commenter-username">${commenterDisplay}</span> -
+                <span class="comment-timestamp">${commentDate}</span>
+            </div>
+            <p class="comment-content">${comment.content}</p>
+            <div class="comment-actions">
+                <div class="vote-section" data-target-type="comment" data-target-id="${comment.id}">
+                    <button class="vote-button upvote" data-vote-type="upvote">Upvote</button>
+                    <span class="vote-score">${(comment.upvotes || 0) - (comment.downvotes || 0)}</span>
+                    <button class="vote-button downvote" data-vote-type="downvote">Downvote</button>
                 </div>
-            `;
-            // Add event listener for comment votes
-            commentItem.querySelector('.vote-section').addEventListener('click', handleVote);
-
-            // Update initial vote display for the comment
-            updateVoteDisplay('comment', comment.id, comment.upvotes, comment.downvotes, comment.user_vote);
-
-            // Add event listener for reply button
-            const replyButton = commentItem.querySelector('.reply-button');
-            if (replyButton) {
-                // Update dataset to use commenterName for @mention consistency
-                replyButton.dataset.commenterUsername = commenterName;
-                replyButton.addEventListener('click', handleReplyClick);
-            }
+                <button class="reply-button" data-comment-id="${comment.id}" data-commenter-username="${commenterName}">Reply</button>
+            </div>
+        `;
+        // Add event listener for comment votes
+        commentItem.querySelector('.vote-section').addEventListener('click', handleVote);
+
+        // Update initial vote display for the comment
+        updateVoteDisplay('comment', comment.id, comment.upvotes, comment.downvotes, comment.user_vote);
+
+        // Add event listener for reply button
+        const replyButton = commentItem.querySelector('.reply-button');
+        if (replyButton) {
+            // Update dataset to use commenterName for @mention consistency
+            replyButton.dataset.commenterUsername = commenterName;
+            replyButton.addEventListener('click', handleReplyClick);
+        }
 
-            commentsListElement.appendChild(commentItem);
-        });
+        const replies = comment.replies || [];
+        const repliesElement = document.createElement('div');
+        repliesElement.className = 'comment-replies';
+        replies.forEach(reply => repliesElement.appendChild(buildCommentItem(reply)));
+        // Long threads come back trimmed; the rest is fetched a page at a time
+        if ((comment.reply_count || 0) > replies.length) {
+            const loadMoreButton = document.createElement('button');
+            loadMoreButton.className = 'load-more-replies';
+            loadMoreButton.textContent = 'Load more replies';
+            loadMoreButton.dataset.cursor = comment.replies_cursor || '';
+            loadMoreButton.addEventListener('click', () => loadMoreReplies(comment.id, repliesElement, loadMoreButton));
+            repliesElement.appendChild(loadMoreButton);
+        }
+        if (repliesElement.children.length > 0) {
+            commentItem.appendChild(repliesElement);
+        }
+        return commentItem;
+    }
+
+    async function loadMoreReplies(commentId, repliesElement, loadMoreButton) {
+        loadMoreButton.disabled = true;
+        const params = new URLSearchParams();
+        if (loadMoreButton.dataset.cursor) {
+            params.set('cursor', loadMoreButton.dataset.cursor);
+        }
+        try {
+            // Plain fetch: the next page's cursor is in the X-Next-Cursor response header
+            const response = await fetch(`${API_BASE_URL}/posts/${currentPostId}/comments/${commentId}/replies?${params}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const replies = await response.json();
+            replies.forEach(reply => repliesElement.insertBefore(buildCommentItem(reply), loadMoreButton));
+            const nextCursor = response.headers.get('X-Next-Cursor');
+            if (nextCursor) {
+                loadMoreButton.dataset.cursor = nextCursor;
+                loadMoreButton.disabled = false;
+            } else {
+                loadMoreButton.remove();
+            }
+        } catch (error) {
+            console.error('Error loading replies:', error);
+            loadMoreButton.disabled = false;
+        }
     }
 
     function handleReplyClick(event) {
@@ -385,11 +385,19 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!tagDisplayArea) return; // Sidebar might not be on all pages
 
         try {
-            const response = await fetch(`${API_BASE_URL}/tags/`);
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            const tagsWithCounts = await response.json(); // Expecting List[models.TagWithCount]
+            // The tag list is paged; follow X-Next-Cursor until the last page
+            const tagsWithCounts = []; // List[models.TagWithCount], most used first
+            let cursor = null;
+            do {
+                const params = new URLSearchParams({ limit: 1000 });
+                if (cursor) params.set('cursor', cursor);
+                const response = await fetch(`${API_BASE_URL}/tags/?${params}`);
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                tagsWithCounts.push(...await response.json());
+                cursor = response.headers.get('X-Next-Cursor');
+            } while (cursor);
 
             renderSidebarTags(tagsWithCounts);
 